@@ -1,7 +1,77 @@
-import pygame
 import sys
+import time
+STARTUP_CLOCK = time.perf_counter() # Before the imports below (pygame above all), so the startup report covers them
 import math
 import random
+import struct
+import mmap
+import argparse
+import bisect
+import os
+import json
+import threading
+import csv
+import cProfile
+import gc
+import tracemalloc
+import pickle
+import zlib
+import socket
+import signal
+import multiprocessing
+from multiprocessing import shared_memory
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# --- Importing pygame ---
+# When installed, numpy (for surfarray) and pkg_resources (for pkgdata) are loaded by pygame's own
+# import. The game uses neither, yet they are most of a cold start, so a script run hides them
+# while pygame is imported and pygame falls back without them. Only that import is affected:
+# afterwards they import as usual (VectorEnv's numpy buffers). Importing this module as a
+# library hides nothing.
+PYGAME_SKIPPED_MODULES = ('numpy', 'pkg_resources')
+
+@contextmanager
+def modules_hidden(names):
+    """
+    Inside the block, importing any of names that is not imported yet raises ImportError (a None
+    entry in sys.modules); the entries are removed again on the way out.
+    """
+    hidden = [name for name in names if name not in sys.modules]
+    for name in hidden:
+        sys.modules[name] = None
+    try:
+        yield
+    finally:
+        for name in hidden:
+            if sys.modules.get(name, False) is None:
+                del sys.modules[name]
+
+@contextmanager
+def environ_set(name, value):
+    """ Sets environment variable name to value inside the block (value None: leaves it alone), then restores it. """
+    if value is None:
+        yield
+        return
+    previous = os.environ.get(name)
+    os.environ[name] = value
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = previous
+
+if __name__ == "__main__":
+    # With --export-frames, pygame's import banner would land in the frame stream on stdout
+    with modules_hidden(PYGAME_SKIPPED_MODULES), \
+         environ_set('PYGAME_HIDE_SUPPORT_PROMPT', '1' if '--export-frames' in sys.argv else None):
+        import pygame
+else:
+    import pygame
 
 # --- Constants ---
 SCREEN_WIDTH = 800
@@ -70,6 +140,32 @@ BARRIER_PADDING_FACTOR = 2.0 # Factor of *average* tank size? Use player size fo
 PLAYER_START_CLEARANCE_FACTOR = 4.0
 BORDER_THICKNESS = 10
 
+# World Constants (worlds can be larger than the screen; the camera follows the player)
+CHUNK_SIZE = 256 # Pixels per side of a map chunk (its walls, spawn points and background tile)
+CHUNK_TILE_CACHE = 48 # Rendered background tiles kept around (a few screens' worth)
+ACTIVE_MARGIN = 400 # Enemies further than this outside the view are dormant
+OFFSCREEN_THINK_INTERVAL = 8 # Ticks between decisions for active enemies outside the view
+ENEMY_SPAWN_SPACING = 40 # Interior enemy spawn lattice in worlds larger than the screen
+SPAWN_RING = 200 # Enemies arrive from this band just outside the view
+world = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT) # Current world bounds, set from the arena by setup_game()
+
+# Arena Grid / Level Pack Constants
+GRID_CELL_SIZE = 10 # Pixels per cell of the wall occupancy grid
+LINE_CORNER_EPSILON = 1e-9 # Segment fractions this close count as passing through a cell corner
+WALL_BLOCK_CELLS = 16 # Grid cells per side of the blocks a stored grid finds a cell's walls through
+BARRIER_PLACE_ATTEMPTS = 100
+LOCAL_CONNECTIVITY_MARGIN = 30 # Cells searched around a new barrier before falling back to a full flood fill
+LEVEL_PACK_MAGIC = b'TMLP'
+LEVEL_PACK_VERSION = 2
+LEVEL_PACK_MAX_COORD = 32767 # Coordinates are stored as int16
+
+# Simulation Clock / Save State Constants
+TICK_RATE = 60 # Simulation ticks per second; game time advances a fixed step per tick
+SNAPSHOT_INTERVAL = 30 # Ticks between rewind snapshots (0.5s)
+SNAPSHOT_RING_SIZE = 120 # Snapshots kept for rewinding (60s)
+REWIND_TICKS = 120 # How far Backspace rewinds (2s)
+AUTOSAVE_INTERVAL = 600 # Ticks between --autosave writes (10s)
+
 # Power-up Constants
 POWERUP_SIZE = 18
 POWERUP_RESPAWN_TIME = 30000 # 30 seconds in milliseconds
@@ -88,6 +184,7 @@ PARTICLE_SPEED_MAX = 4
 PARTICLE_LIFESPAN = 25     # How many frames particles last (approx 0.4s at 60fps)
 PARTICLE_START_SIZE = 5
 PARTICLE_END_SIZE = 1
+PARTICLE_LIMIT = 1000      # Live particles; explosions beyond this are trimmed (mass kills in horde mode)
 EXPLOSION_COLORS = [(255, 0, 0), (255, 100, 0), (255, 200, 0), (200, 200, 200)] # Red, Orange, Yellow, Grey
 
 # # Safe Zone Circle Constants
@@ -106,6 +203,19 @@ MAX_WAVES = 10
 WAVE_START_DELAY = 5000       # 5 seconds delay before first wave and between waves
 ENEMY_SPAWN_INTERVAL = 1200   # Time between spawning each enemy within a wave (1.2 seconds)
 
+# Horde Mode Constants
+HORDE_BASE_ENEMIES = 50       # Size of the first horde wave
+HORDE_GROWTH = 0.5            # Curve growth factor (geometric: +50% per wave)
+HORDE_BURST_SIZE = 20         # Minimum enemies spawned per burst
+HORDE_BURST_INTERVAL = 250    # Time between bursts within a wave
+HORDE_WAVE_BURSTS = 40        # Large waves are split into about this many bursts
+HORDE_MAX_LIVE_ENEMIES = 5000 # Bursts pause while this many enemies are alive
+HORDE_THINK_INTERVAL = 4      # Ticks between decisions for horde enemies beyond HORDE_THINK_DISTANCE
+HORDE_THINK_DISTANCE = 150    # Horde enemies closer than this to the player decide every tick
+HORDE_BENCH_ENEMIES = 2000    # Enemies --horde-bench keeps alive by default
+HORDE_BENCH_TICKS = 600       # Ticks --horde-bench measures (10 s of game time), after HORDE_BENCH_WARMUP
+HORDE_BENCH_WARMUP = 60
+
 # Bombardment Constants
 BOMBARDMENT_COUNT = 9
 BOMBARDMENT_RADIUS = 75 # Radius of each danger zone
@@ -116,6 +226,7 @@ BOMBARDMENT_COLOR = (255, 0, 0, 50) # Red, semi-transparent (RGBA)
 BOMBARDMENT_THICKNESS = 2
 # BOMBARDMENT_DAMAGE_PER_SECOND = 1.5 # Option 1: Damage over time
 BOMBARDMENT_INSTANT_KILL = True      # Option 2: Instant kill
+DANGER_CELL_SIZE = 10 # Cell size of the rasterised bombardment danger map
 
 # --- Helper Functions ---
 def angle_diff(a1, a2):
@@ -124,44 +235,1003 @@ def angle_diff(a1, a2):
 
 def draw_text(surface, text, size, x, y, color=WHITE):
     """ Helper to draw text on the screen """
-    font = pygame.font.Font(None, size) # Use default font
-    text_surface = font.render(text, True, color)
-    text_rect = text_surface.get_rect()
-    text_rect.topleft = (x, y)
-    surface.blit(text_surface, text_rect)
+    surface.blit(text_surface(text, size, color), (x, y))
+
+def text_surface(text, size, color=WHITE):
+    """ Rendered text, cached because HUD strings repeat from frame to frame. """
+    key = (text, size, color)
+    rendered = _text_cache.get(key)
+    if rendered is None:
+        if len(_text_cache) >= TEXT_CACHE_SIZE:
+            _text_cache.clear() # A simple flush is enough to keep the cache bounded
+        rendered = get_font(size).render(text, True, color)
+        alloc_counts['surfaces'] += 1
+        _text_cache[key] = rendered
+    return rendered
+
+# --- Asset Caches ---
+# Fonts, rendered HUD text and sprite imagery are built once and shared by every
+# sprite and every game, so restarting does not pay for them again.
+TEXT_CACHE_SIZE = 256
+SCALED_CACHE_SIZE = 4096 # Images resized for the render scale (every tank rotation plus HUD text)
+alloc_counts = {'surfaces': 0} # Surfaces created so far (read by telemetry)
+_font_cache = {}
+_text_cache = {}
+_image_cache = {}
+_mask_cache = {}
+_scaled_cache = {}
+_sound_cache = {} # Effect name -> synthesised 16-bit stereo samples
+_pixels_lock = threading.Lock() # Held while drawing a frame and while reading a cached image's pixels (--pipelined)
+
+def new_surface(size, flags=0):
+    """ pygame.Surface() that is counted in alloc_counts. """
+    alloc_counts['surfaces'] += 1
+    return pygame.Surface(size, flags)
+
+def sprite_surface(image):
+    """
+    Marks a cached sprite image for RLE-accelerated blits. Sprite pixels are either opaque or
+    fully clear, so the runs encode them exactly and blits skip the clear pixels.
+    """
+    image.set_alpha(255, pygame.RLEACCEL)
+    return image
+
+def scaled_image(image, scale):
+    """ image resized by the render scale, built once per source image. """
+    scaled = _scaled_cache.get(image)
+    if scaled is None:
+        if len(_scaled_cache) >= SCALED_CACHE_SIZE:
+            _scaled_cache.clear()
+        width, height = image.get_size()
+        scaled = pygame.transform.smoothscale(image, (math.ceil(width * scale), math.ceil(height * scale)))
+        alloc_counts['surfaces'] += 1
+        if image.get_flags() & pygame.RLEACCELOK:
+            sprite_surface(scaled)
+        _scaled_cache[image] = scaled
+    return scaled
+
+def scale_blits(blits, scale):
+    """ (image, position) pairs laid out in screen coordinates, redone for a canvas at scale. """
+    if scale == 1:
+        return blits
+    return [(scaled_image(image, scale), (int(dest[0] * scale), int(dest[1] * scale))) for image, dest in blits]
+
+def image_mask(image):
+    """ Collision mask of a cached sprite image (so one per tank type and angle bucket), built on first use. """
+    mask = _mask_cache.get(image)
+    if mask is None:
+        with _pixels_lock: # from_surface() locks the image, which would fail a blit of it on the drawing thread
+            mask = _mask_cache[image] = pygame.mask.from_surface(image)
+    return mask
+
+def solid_mask(size):
+    key = ('solid', size[0], size[1])
+    mask = _mask_cache.get(key)
+    if mask is None:
+        mask = _mask_cache[key] = pygame.mask.Mask(size, fill=True)
+    return mask
+
+def mask_touches_rect(mask, rect, other):
+    """ Narrow phase against a plain rect: whether mask, placed at rect, has a set pixel inside other. """
+    clip = rect.clip(other)
+    if not clip.width or not clip.height:
+        return False
+    return mask.overlap(solid_mask(clip.size), (clip.x - rect.x, clip.y - rect.y)) is not None
+
+def spritecollide_masked(sprite, group, dokill=False):
+    """ spritecollide() with the usual rect test as broadphase and the sprites' cached masks as narrow phase. """
+    hits = [other for other in pygame.sprite.spritecollide(sprite, group, False)
+            if pygame.sprite.collide_mask(sprite, other)]
+    if dokill:
+        for other in hits:
+            other.kill()
+    return hits
+
+def get_font(size):
+    """ Returns the default font at the given size, loading it only once. """
+    font = _font_cache.get(size)
+    if font is None:
+        font = pygame.font.Font(None, size) # Use default font
+        _font_cache[size] = font
+    return font
+
+def tank_image(size, color):
+    """ Unrotated tank body with its barrel line. """
+    key = ('tank', size, color)
+    image = _image_cache.get(key)
+    if image is None:
+        image = new_surface([size, size], pygame.SRCALPHA)
+        pygame.draw.rect(image, color, [0, 0, size, size], border_radius=2)
+        pygame.draw.line(image, WHITE,
+                         (size // 2, size // 2),
+                         (size, size // 2),
+                         max(1, size // 8))
+        _image_cache[key] = sprite_surface(image)
+    return image
+
+def rotated_tank_image(size, color, angle):
+    """ Tank image rotated to angle (degrees, screen space), cached per whole degree. """
+    degrees = int(round(angle)) % 360
+    key = ('tank', size, color, degrees)
+    image = _image_cache.get(key)
+    if image is None:
+        image = pygame.transform.rotate(tank_image(size, color), -degrees)
+        alloc_counts['surfaces'] += 1
+        _image_cache[key] = sprite_surface(image)
+    return image
+
+def bullet_image(color):
+    key = ('bullet', color)
+    image = _image_cache.get(key)
+    if image is None:
+        image = new_surface([BULLET_SIZE, BULLET_SIZE], pygame.SRCALPHA) # Use SRCALPHA
+        pygame.draw.circle(image, color, (BULLET_SIZE//2, BULLET_SIZE//2), BULLET_SIZE//2)
+        _image_cache[key] = sprite_surface(image)
+    return image
+
+def particle_image(color, size):
+    key = ('particle', color, size)
+    image = _image_cache.get(key)
+    if image is None:
+        image = new_surface([size * 2, size * 2], pygame.SRCALPHA) # Double size for antialiasing
+        pygame.draw.circle(image, color, (size, size), size)
+        _image_cache[key] = sprite_surface(image)
+    return image
+
+def wall_image(width, height):
+    key = ('wall', width, height)
+    image = _image_cache.get(key)
+    if image is None:
+        image = new_surface([width, height])
+        image.fill(WHITE)
+        _image_cache[key] = image
+    return image
+
+# --- Startup ---
+# Only the SDL subsystems the game uses are started (pygame.init() would also open joysticks, and
+# the audio engine opens the mixer itself), and every sprite image is baked before the first frame
+# instead of on first use. The baked images, HUD text and synthesised sounds can be kept in an
+# asset cache file and read back in one read.
+ASSET_CACHE_MAGIC = b'TMAC'
+ASSET_CACHE_VERSION = 1
+FONT_SIZES = (20, 24, 30, 36, 74) # Every size the HUD, end screen and network client use
+
+def init_pygame():
+    """ Starts the display and font modules only. """
+    pygame.display.init()
+    pygame.font.init()
+
+def prebake_assets():
+    """ Builds every tank rotation, bullet, particle, power-up and zone image, and loads the fonts. """
+    tanks = [(PLAYER_SIZE, GREEN)] + [(data['size'], data['color']) for data in ENEMY_TYPES.values()]
+    for size, color in tanks:
+        for degrees in range(360):
+            rotated_tank_image(size, color, degrees)
+    for color in [BLUE] + [data['color'] for data in ENEMY_TYPES.values()]:
+        bullet_image(color)
+    for color in EXPLOSION_COLORS:
+        for size in range(1, PARTICLE_START_SIZE + 1):
+            particle_image(color, size)
+    for powerup_class in (AmmoRefill, HealthRestore):
+        powerup_class(0, 0, 0)
+    zone_image(BOMBARDMENT_RADIUS, BOMBARDMENT_COLOR, BOMBARDMENT_THICKNESS)
+    for size in FONT_SIZES:
+        get_font(size)
+
+def asset_cache_header():
+    """ Magic plus a signature, so a cache is only used by the same game file on the same pygame version. """
+    stat = os.stat(os.path.abspath(__file__))
+    signature = f"{ASSET_CACHE_VERSION}:{pygame.version.ver}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    return ASSET_CACHE_MAGIC + struct.pack('<H', len(signature)) + signature
+
+def save_asset_cache(path):
+    """ Writes the baked sprite images, rendered HUD text and synthesised sounds to path as one compressed blob. """
+    entries = []
+    for name, cache in (('image', _image_cache), ('text', _text_cache)):
+        for key, image in cache.items():
+            if key[0] == 'wall': # Arena-specific
+                continue
+            rle = bool(image.get_flags() & pygame.RLEACCELOK)
+            entries.append((name, key, image.get_size(), rle, pygame.image.tobytes(image, 'RGBA')))
+    entries += [('sound', name, None, False, samples) for name, samples in _sound_cache.items()]
+    data = asset_cache_header() + zlib.compress(pickle.dumps(entries, pickle.HIGHEST_PROTOCOL))
+    try:
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        event_log.emit('asset_cache_write_failed', 'warning', path=path, error=str(e))
+
+def load_asset_cache(path):
+    """ Fills the image, text and sound caches from an asset cache file; False if it is missing or stale. """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return False
+    header = asset_cache_header()
+    if not data.startswith(header):
+        event_log.emit('asset_cache_stale', path=path)
+        return False
+    try:
+        entries = pickle.loads(zlib.decompress(data[len(header):]))
+    except (zlib.error, pickle.UnpicklingError, EOFError, ValueError) as e:
+        event_log.emit('asset_cache_invalid', 'warning', path=path, error=str(e))
+        return False
+    for name, key, size, rle, pixels in entries:
+        if name == 'sound':
+            _sound_cache[key] = pixels
+            continue
+        image = pygame.image.frombytes(pixels, size, 'RGBA')
+        alloc_counts['surfaces'] += 1
+        if name == 'image':
+            _image_cache[key] = sprite_surface(image) if rle else image
+        else:
+            _text_cache[key] = image
+    return True
+
+class StartupTimer:
+    """ Splits the time to the first playable frame into phases for the 'startup' event. """
+    def __init__(self, start=STARTUP_CLOCK):
+        self.start = self.last = start
+        self.phases = {}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase + '_ms'] = round((now - self.last) * 1000, 1)
+        self.last = now
+
+    def report(self, **info):
+        event_log.emit('startup', total_ms=round((self.last - self.start) * 1000, 1), **self.phases, **info)
+
+# --- Event Log ---
+# Gameplay events (damage, kills, spawns, pickups, waves, bombardments) are recorded as
+# structured records in an in-memory ring buffer. A background thread writes them to a
+# JSON-lines file and/or the console in batches, so the game loop never does I/O.
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30}
+EVENT_LOG_CAPACITY = 4096 # Records kept in memory
+EVENT_LOG_FLUSH_INTERVAL = 0.5 # Seconds between background flushes
+
+class EventLog:
+    def __init__(self, capacity=EVENT_LOG_CAPACITY, level='info'):
+        self.records = deque(maxlen=capacity) # Most recent records, always available in memory
+        self.min_level = LOG_LEVELS[level]
+        self.now = 0 # Game time stamped on each record; updated by the game loop
+        self.seq = 0 # Records emitted so far
+        self.dropped = 0 # Records overwritten in the ring before the writer saw them
+        self._lock = threading.Lock()
+        self._written_seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._console = False
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """ Calls callback(event, fields) synchronously for every emitted event, regardless of level. """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def set_level(self, level):
+        self.min_level = LOG_LEVELS[level]
+
+    def emit(self, event, level='info', **fields):
+        """ Records one event. Cheap enough to call from inside the frame. """
+        for callback in self._subscribers:
+            callback(event, fields)
+        if LOG_LEVELS[level] < self.min_level:
+            return
+        with self._lock:
+            self.seq += 1
+            self.records.append((self.seq, self.now, level, event, fields))
+
+    def start(self, path=None, console=False):
+        """ Starts the background writer (a no-op if there is nowhere to write to). """
+        if not path and not console:
+            return
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+        self._console = console
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(EVENT_LOG_FLUSH_INTERVAL):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """ Writes every record not yet written. Called from the writer thread. """
+        with self._lock:
+            batch = [r for r in self.records if r[0] > self._written_seq]
+            if batch:
+                self.dropped += batch[0][0] - self._written_seq - 1
+                self._written_seq = batch[-1][0]
+        if not batch:
+            return
+        if self._file:
+            self._file.write(''.join(json.dumps({'seq': seq, 't': t, 'level': level, 'event': event, **fields})
+                                     + '\n' for seq, t, level, event, fields in batch))
+            self._file.flush()
+        if self._console:
+            sys.stdout.write(''.join(f"[{t / 1000:8.2f}s] {level.upper():7} {event} "
+                                     + ' '.join(f"{k}={v}" for k, v in fields.items()) + '\n'
+                                     for seq, t, level, event, fields in batch))
+            sys.stdout.flush()
+
+    def close(self):
+        """ Stops the writer after a final flush. """
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+event_log = EventLog()
+
+# --- Telemetry ---
+# One fixed-size binary record per frame goes into a preallocated ring; a background
+# thread appends new records to a rolling file. File layout: magic, version, JSON
+# header (record format and field names), then back-to-back records.
+TELEMETRY_MAGIC = b'TMTM'
+TELEMETRY_VERSION = 2
+TELEMETRY_FIELDS = ('tick', 'game_time', 'frame_ms', 'sim_ms', 'render_ms', 'enemies', 'player_bullets',
+                    'enemy_bullets', 'particles', 'powerups', 'surfaces_allocated', 'wave', 'quality_tier')
+TELEMETRY_RECORD = struct.Struct('<IIfffHHHHHHHB')
+TELEMETRY_CAPACITY = 4096 # Frames buffered in memory (~68s at 60 FPS)
+TELEMETRY_FLUSH_INTERVAL = 1.0 # Seconds between background writes
+TELEMETRY_MAX_BYTES = 8 * 1024 * 1024 # Roll the file over to PATH.1 beyond this size
+
+class Telemetry:
+    def __init__(self, path, capacity=TELEMETRY_CAPACITY, max_bytes=TELEMETRY_MAX_BYTES):
+        self.path = path
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.ring = bytearray(TELEMETRY_RECORD.size * capacity)
+        self.head = 0 # Records produced
+        self.tail = 0 # Records written to disk
+        self.dropped = 0
+        self._last_surfaces = alloc_counts['surfaces']
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+        self._thread.start()
+
+    def record(self, state, frame_ms, sim_ms, render_ms):
+        """ Adds one frame's metrics to the ring. """
+        surfaces = alloc_counts['surfaces']
+        values = (state.tick, state.current_time, frame_ms, sim_ms, render_ms,
+                  len(state.enemies), len(state.player_bullets), len(state.enemy_bullets),
+                  len(state.particles), len(state.powerups),
+                  min(surfaces - self._last_surfaces, 0xFFFF), state.wave_number, quality.tier)
+        self._last_surfaces = surfaces
+        with self._lock:
+            TELEMETRY_RECORD.pack_into(self.ring, (self.head % self.capacity) * TELEMETRY_RECORD.size, *values)
+            self.head += 1
+
+    def _open(self):
+        header = json.dumps({'format': TELEMETRY_RECORD.format, 'fields': TELEMETRY_FIELDS}).encode()
+        preamble = TELEMETRY_MAGIC + struct.pack('<HI', TELEMETRY_VERSION, len(header)) + header
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                if f.read(len(preamble)) != preamble: # Written with another record layout
+                    os.replace(self.path, self.path + '.1')
+        self._file = open(self.path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(preamble)
+
+    def _run(self):
+        while not self._stop.wait(TELEMETRY_FLUSH_INTERVAL):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """ Copies unwritten records out of the ring and appends them to the file. """
+        size = TELEMETRY_RECORD.size
+        with self._lock:
+            if self.head - self.tail > self.capacity:
+                self.dropped += self.head - self.tail - self.capacity
+                self.tail = self.head - self.capacity
+            start, end = self.tail % self.capacity, self.head % self.capacity
+            count = self.head - self.tail
+            if count and start < end:
+                chunk = bytes(self.ring[start * size:end * size])
+            elif count:
+                chunk = bytes(self.ring[start * size:]) + bytes(self.ring[:end * size])
+            self.tail = self.head
+        if not count:
+            return
+        if self._file is None:
+            self._open()
+        elif self._file.tell() + len(chunk) > self.max_bytes:
+            self._file.close()
+            os.replace(self.path, self.path + '.1')
+            self._open()
+        self._file.write(chunk)
+        self._file.flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        if self._file:
+            self._file.close()
+
+def read_telemetry(path):
+    """ Yields each record of a telemetry file as a dict. """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != TELEMETRY_MAGIC:
+        raise ValueError(f"{path} is not a telemetry file")
+    version, header_len = struct.unpack_from('<HI', data, 4)
+    header = json.loads(data[10:10 + header_len])
+    record = struct.Struct(header['format'])
+    fields = header['fields']
+    for values in record.iter_unpack(data[10 + header_len:]):
+        yield dict(zip(fields, values))
+
+def dump_telemetry(path):
+    """ Prints a telemetry file as CSV. """
+    writer = None
+    for row in read_telemetry(path):
+        if writer is None:
+            writer = csv.DictWriter(sys.stdout, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow(row)
+
+# --- Profile Capture ---
+# F9 (or ProfileCapture.request()) profiles the next PROFILE_FRAMES gameplay frames with
+# cProfile and writes a .prof file tagged with the wave number and entity counts. With a
+# frame budget set, a frame over budget triggers a capture automatically.
+PROFILE_FRAMES = 120
+PROFILE_AUTO_COOLDOWN = 30.0 # Seconds between automatic captures
+
+class ProfileCapture:
+    def __init__(self, out_dir='profiles', frames=PROFILE_FRAMES, budget_ms=0):
+        self.out_dir = out_dir
+        self.frames = frames
+        self.budget_ms = budget_ms # 0 disables automatic captures
+        self.profiler = None
+        self.frames_left = 0
+        self.reason = None
+        self.pending = None
+        self._last_auto = -PROFILE_AUTO_COOLDOWN
+
+    @property
+    def active(self):
+        return self.profiler is not None
+
+    def request(self, reason='manual'):
+        """ Profiles the next `frames` frames (ignored while a capture is running). """
+        if not self.active and self.pending is None:
+            self.pending = reason
+
+    def begin_frame(self, frame_ms):
+        """ Called at the top of each gameplay frame with the previous frame's duration. """
+        if self.budget_ms and frame_ms > self.budget_ms and not self.active:
+            now = time.monotonic()
+            if now - self._last_auto >= PROFILE_AUTO_COOLDOWN:
+                self._last_auto = now
+                self.request(f'spike{frame_ms:.0f}ms')
+        if self.pending is not None:
+            self.reason, self.pending = self.pending, None
+            self.frames_left = self.frames
+            self.profiler = cProfile.Profile()
+        if self.profiler:
+            self.profiler.enable()
+
+    def end_frame(self, state):
+        """ Called after the frame is presented; finishes the capture after the last frame. """
+        if not self.profiler:
+            return
+        self.profiler.disable()
+        self.frames_left -= 1
+        if self.frames_left > 0:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = (f"{time.strftime('%Y%m%d-%H%M%S')}_{self.reason}_wave{state.wave_number}"
+                f"_enemies{len(state.enemies)}_bullets{len(state.player_bullets) + len(state.enemy_bullets)}"
+                f"_particles{len(state.particles)}.prof")
+        path = os.path.join(self.out_dir, name)
+        # Writing the stats is the slow part; keep it off the game loop
+        threading.Thread(target=self.profiler.dump_stats, args=(path,), daemon=True).start()
+        event_log.emit('profile_saved', path=path, frames=self.frames, reason=self.reason)
+        self.profiler = None
+
+# --- Memory Diagnostics ---
+# Optional mode that takes a tracemalloc snapshot at each checkpoint event (game setup,
+# wave start/clear, bombardment start/end) and appends one JSON line per checkpoint:
+# traced totals, top allocation sites, growth since the previous checkpoint, and live
+# Surface / sprite counts. Counts that keep growing from one setup_game() to the next
+# are reported as leak suspects.
+MEMORY_CHECKPOINT_EVENTS = ('game_setup', 'wave_start', 'wave_clear', 'bombardment_start', 'bombardment_end')
+MEMORY_TOP_SITES = 15
+MEMORY_TRACE_FRAMES = 4 # Stack depth kept per allocation
+MEMORY_LEAK_SLACK = 64 # Surfaces allowed to appear between restarts (cache warm-up)
+
+def live_object_counts():
+    """ Live pygame Surfaces and sprites per class, found through the garbage collector. """
+    sprites = {}
+    surfaces = set()
+    for obj in gc.get_objects():
+        if isinstance(obj, pygame.sprite.Sprite):
+            name = type(obj).__name__
+            sprites[name] = sprites.get(name, 0) + 1
+        # Surfaces are not GC-tracked themselves, so find them through whatever holds them
+        for ref in gc.get_referents(obj):
+            if type(ref) is pygame.Surface:
+                surfaces.add(id(ref))
+    return {'surfaces': len(surfaces), 'sprites': dict(sorted(sprites.items()))}
+
+class MemoryDiagnostics:
+    def __init__(self, path, top=MEMORY_TOP_SITES):
+        self.path = path
+        self.top = top
+        self.file = open(path, 'a', encoding='utf-8')
+        self.previous = None # Last tracemalloc snapshot
+        self.setup_counts = None # Live counts at the previous setup_game()
+        self.games = 0
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                         tracemalloc.Filter(False, '<frozen importlib._bootstrap>')]
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_TRACE_FRAMES)
+        event_log.subscribe(self.on_event)
+
+    def on_event(self, event, fields):
+        if event in MEMORY_CHECKPOINT_EVENTS:
+            self.checkpoint(event, fields)
+
+    def checkpoint(self, label, fields=None):
+        """ Records one checkpoint. Slow by design; only runs in diagnostics mode. """
+        if label == 'game_setup':
+            self.games += 1
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        current, peak = tracemalloc.get_traced_memory()
+        top = [{'site': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+               for stat in snapshot.statistics('lineno')[:self.top]]
+        growth = []
+        if self.previous is not None:
+            growth = [{'site': str(stat.traceback), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+                      for stat in snapshot.compare_to(self.previous, 'lineno')[:self.top] if stat.size_diff]
+        self.previous = snapshot
+        counts = live_object_counts()
+        record = {'label': label, 'game': self.games, 'tick': event_log.now, 'fields': fields or {},
+                  'traced_current': current, 'traced_peak': peak, 'cached_images': len(_image_cache),
+                  'surfaces_allocated': alloc_counts['surfaces'], **counts,
+                  'top_sites': top, 'growth': growth}
+        if label == 'game_setup':
+            record['leak_suspects'] = self._leak_suspects(counts)
+            if record['leak_suspects']:
+                event_log.emit('memory_leak_suspect', 'warning', suspects=record['leak_suspects'])
+            self.setup_counts = counts
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def _leak_suspects(self, counts):
+        """ Names whose live count grew since the previous restart. """
+        if self.setup_counts is None:
+            return []
+        suspects = []
+        if counts['surfaces'] - self.setup_counts['surfaces'] > MEMORY_LEAK_SLACK:
+            suspects.append(f"Surface +{counts['surfaces'] - self.setup_counts['surfaces']}")
+        for name, count in counts['sprites'].items():
+            before = self.setup_counts['sprites'].get(name, 0)
+            if count > before:
+                suspects.append(f"{name} +{count - before}")
+        return suspects
+
+    def close(self):
+        event_log.unsubscribe(self.on_event)
+        self.file.close()
+        tracemalloc.stop()
+
+def compare_memory_reports(path_a, path_b):
+    """ Prints traced memory and live counts per checkpoint for two diagnostics files side by side. """
+    def load(path):
+        rows = {}
+        seen = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                key = (record['game'], record['label'])
+                seen[key] = seen.get(key, 0) + 1
+                rows[key + (seen[key],)] = record
+        return rows
+    a, b = load(path_a), load(path_b)
+    print(f"{'game':>4} {'checkpoint':<20} {'#':>3} {'traced KB A':>12} {'traced KB B':>12} "
+          f"{'surfaces A':>10} {'surfaces B':>10}")
+    for key in sorted(set(a) | set(b)):
+        ra, rb = a.get(key, {}), b.get(key, {})
+        print(f"{key[0]:>4} {key[1]:<20} {key[2]:>3} {ra.get('traced_current', 0) / 1024:>12.1f} "
+              f"{rb.get('traced_current', 0) / 1024:>12.1f} {ra.get('surfaces', '-'):>10} {rb.get('surfaces', '-'):>10}")
+
+# --- Quality Governor ---
+# Watches how long each frame's work (simulation + drawing) takes and steps through
+# QUALITY_TIERS, shedding cosmetic work while frames run over budget and restoring it
+# once there is headroom again.
+FRAME_BUDGET_MS = 1000 / TICK_RATE
+QUALITY_TIERS = [
+    # particles: share of PARTICLE_COUNT per explosion | zones: bombardment render mode
+    # hud_interval: frames between HUD rebuilds | ai_lod_interval: ticks between decisions for far enemies
+    {'particles': 1.0, 'zones': 'full', 'hud_interval': 1, 'ai_lod_interval': 1},
+    {'particles': 0.6, 'zones': 'overlay', 'hud_interval': 2, 'ai_lod_interval': 2},
+    {'particles': 0.3, 'zones': 'overlay', 'hud_interval': 4, 'ai_lod_interval': 4},
+    {'particles': 0.1, 'zones': 'outline', 'hud_interval': 8, 'ai_lod_interval': 8},
+]
+AI_LOD_DISTANCE = 250 # Enemies further than this from the player use the tier's ai_lod_interval
+GOVERNOR_DEGRADE_FRAMES = 30 # Over-budget window before dropping a tier
+GOVERNOR_RESTORE_FRAMES = 180 # Headroom window before raising a tier
+GOVERNOR_DEGRADE_RATIO = 0.9 # Average work above this share of the budget is "over budget"
+GOVERNOR_RESTORE_RATIO = 0.5 # Average work below this share of the budget is "headroom"
+
+class QualityGovernor:
+    def __init__(self, tiers=QUALITY_TIERS, budget_ms=FRAME_BUDGET_MS, enabled=False):
+        self.tiers = tiers
+        self.budget_ms = budget_ms
+        self.enabled = enabled
+        self.tier = 0
+        self.settings = tiers[0]
+        self.recent = deque(maxlen=max(GOVERNOR_DEGRADE_FRAMES, GOVERNOR_RESTORE_FRAMES))
+
+    def set_tier(self, tier):
+        tier = max(0, min(len(self.tiers) - 1, tier))
+        if tier != self.tier:
+            event_log.emit('quality_tier', tier=tier, previous=self.tier)
+        self.tier = tier
+        self.settings = self.tiers[tier]
+        self.recent.clear() # Let the new tier settle before judging it
+
+    def update(self, work_ms):
+        """ Feeds one frame's work time; may change tier. """
+        if not self.enabled:
+            return
+        self.recent.append(work_ms)
+        n = len(self.recent)
+        if n >= GOVERNOR_DEGRADE_FRAMES and self.tier < len(self.tiers) - 1:
+            window = list(self.recent)[-GOVERNOR_DEGRADE_FRAMES:]
+            if sum(window) / GOVERNOR_DEGRADE_FRAMES > self.budget_ms * GOVERNOR_DEGRADE_RATIO:
+                self.set_tier(self.tier + 1)
+                return
+        if n >= GOVERNOR_RESTORE_FRAMES and self.tier > 0:
+            if sum(self.recent) / n < self.budget_ms * GOVERNOR_RESTORE_RATIO:
+                self.set_tier(self.tier - 1)
+
+    def particle_count(self):
+        return max(1, round(PARTICLE_COUNT * self.settings['particles']))
+
+    def should_think(self, enemy, slot, player_rect, tick, min_interval=1, distance=AI_LOD_DISTANCE):
+        """
+        AI level of detail: enemies further than distance from the player only make decisions
+        every ai_lod_interval (or min_interval) ticks. slot, the enemy's place in the enemy group,
+        spreads them across ticks; unlike id() it survives a snapshot restore, so replays match.
+        """
+        interval = max(self.settings['ai_lod_interval'], min_interval)
+        if interval <= 1 or player_rect is None:
+            return True
+        if (tick + slot) % interval == 0: # Spread far enemies across ticks
+            return True
+        dx = enemy.rect.centerx - player_rect.centerx
+        dy = enemy.rect.centery - player_rect.centery
+        return dx * dx + dy * dy < distance * distance
+
+quality = QualityGovernor()
+
+# --- Frame Pacing ---
+# By default a frame samples input, simulates and draws, and clock.tick() then sleeps off the rest
+# of the tick, so input queues up during that sleep and is most of a frame old when it is shown.
+# In low-latency mode the sleep comes first: the pacer wakes just in time to sample input, simulate
+# and draw before the present deadline (a high percentile of recent frame work plus a margin),
+# sleeping coarsely and spinning the last PACING_SPIN_MS for accuracy. Both modes measure the time
+# from input sample to present and the jitter between presents, logged as 'frame_pacing' events.
+PACING_SPIN_MS = 2.0 # Busy-wait this close to the wake-up time; sleep() can overshoot by more
+PACING_MARGIN_MS = 1.0 # Slack added to the work estimate
+PACING_WORK_WINDOW = 60 # Frames of work history behind the estimate
+PACING_WORK_PERCENTILE = 0.9
+PACING_REPORT_FRAMES = 300 # Presented frames per 'frame_pacing' event
+PACING_LATE_RATIO = 1.5 # A present interval this many periods long counts as a late frame
+
+class FramePacer:
+    def __init__(self, low_latency=False, rate=TICK_RATE):
+        self.low_latency = low_latency
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.clock = pygame.time.Clock()
+        self.deadline = None # perf_counter time the next present is due (low-latency mode)
+        self.sample_time = None
+        self.last_present = None
+        self.work = deque(maxlen=PACING_WORK_WINDOW) # Seconds from input sample to present
+        self.latencies = [] # ms, input sample to present of the frame showing it
+        self.intervals = [] # ms between presents
+
+    def reset(self):
+        """ Starts pacing afresh, e.g. after the end screen; statistics carry on. """
+        self.deadline = None
+        self.last_present = None
+
+    def work_estimate(self):
+        if not self.work:
+            return self.period / 2
+        ordered = sorted(self.work)
+        return ordered[int(len(ordered) * PACING_WORK_PERCENTILE)]
+
+    def wait(self):
+        """ Blocks until it is time to sample input for the next frame. """
+        if not self.low_latency:
+            self.clock.tick(self.rate)
+            return
+        lead = self.work_estimate() + PACING_MARGIN_MS / 1000
+        now = time.perf_counter()
+        if self.deadline is None or now > self.deadline + self.period: # Fell a frame behind: resync
+            self.deadline = now + lead
+        wake = self.deadline - lead
+        if wake - now > PACING_SPIN_MS / 1000:
+            time.sleep(wake - now - PACING_SPIN_MS / 1000)
+        while time.perf_counter() < wake:
+            pass
+
+    def sampled(self):
+        """ Marks the moment input was read for this frame; returns it. """
+        self.sample_time = time.perf_counter()
+        return self.sample_time
+
+    def skip(self):
+        """ This frame presents nothing (e.g. a rewind); keep the schedule. """
+        if self.deadline is not None:
+            self.deadline += self.period
+
+    def presented(self, input_time):
+        """ A frame showing input sampled at input_time (this frame's, or the previous one's when
+            pipelined) has just been presented. """
+        now = time.perf_counter()
+        self.work.append(now - self.sample_time)
+        self.latencies.append((now - input_time) * 1000)
+        if self.last_present is not None:
+            self.intervals.append((now - self.last_present) * 1000)
+        self.last_present = now
+        if self.deadline is not None:
+            self.deadline += self.period
+        if len(self.latencies) >= PACING_REPORT_FRAMES:
+            self.report()
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        intervals = self.intervals or [self.period * 1000]
+        mean_interval = sum(intervals) / len(intervals)
+        jitter = math.sqrt(sum((i - mean_interval) ** 2 for i in intervals) / len(intervals))
+        late = sum(1 for i in intervals if i > self.period * 1000 * PACING_LATE_RATIO)
+        event_log.emit('frame_pacing', mode='low_latency' if self.low_latency else 'default',
+                       frames=len(latencies), latency_ms=round(sum(latencies) / len(latencies), 2),
+                       latency_p95_ms=round(latencies[int(len(latencies) * 0.95)], 2),
+                       latency_max_ms=round(latencies[-1], 2), interval_ms=round(mean_interval, 2),
+                       jitter_ms=round(jitter, 3), late_frames=late,
+                       work_estimate_ms=round(self.work_estimate() * 1000, 2))
+        self.latencies.clear()
+        self.intervals.clear()
+
+# --- Audio ---
+# Every effect is synthesised (or decoded from --sound-dir) into a mixer Sound once at startup, so
+# a shot never touches the decoder. Gameplay code only queues effects with audio.play(); once per
+# frame flush() starts one voice per queued effect, however many times it was triggered (forty
+# kills in one bombardment tick are one louder explosion), highest priority first. Each category
+# has its own pool of reserved channels: when a pool is full the new voice takes over the lowest
+# priority, oldest voice it outranks or ties, or is dropped. Effects are panned around the view
+# and fade out beyond it. Servers and training environments never start the mixer, so play()
+# there is a single attribute check.
+AUDIO_FREQUENCY = 22050
+AUDIO_BUFFER = 512 # Samples per mixer callback (~23 ms)
+AUDIO_AMPLITUDE = 12000 # Peak of synthesised samples (16-bit)
+AUDIO_NOISE_SMOOTHING = 0.3 # One-pole low-pass on noise; lower is a deeper rumble
+AUDIO_SEED = 7 # Noise is the same every launch (and never touches the game's random stream)
+AUDIO_VOICE_VOLUME = 0.6 # Channel volume of a single trigger
+AUDIO_MERGE_GAIN = 0.25 # Extra volume per doubling of triggers merged into one voice
+AUDIO_HEARING_MARGIN = 400 # Effects fade out over this distance beyond the view
+AUDIO_CATEGORIES = {'weapons': 6, 'explosions': 6, 'pickups': 2, 'alerts': 3} # Channels per category
+# name: (category, priority, volume, synthesis segments of (ms, start Hz, end Hz, noise share))
+AUDIO_EFFECTS = {
+    'player_shot': ('weapons', 3, 0.5, ((90, 900, 300, 0.3),)),
+    'enemy_shot': ('weapons', 1, 0.35, ((90, 600, 200, 0.3),)),
+    'empty_click': ('weapons', 2, 0.4, ((15, 2000, 2000, 0.5),)),
+    'explosion': ('explosions', 1, 0.7, ((350, 120, 40, 0.85),)),
+    'pickup': ('pickups', 2, 0.6, ((70, 660, 660, 0), (70, 880, 880, 0), (110, 1320, 1320, 0))),
+    'player_hit': ('alerts', 3, 0.7, ((180, 220, 110, 0.2),)),
+    'bombardment': ('alerts', 2, 0.6, ((250, 500, 900, 0), (250, 900, 500, 0))),
+    'wave': ('alerts', 1, 0.5, ((100, 440, 440, 0), (60, 0, 0, 0), (100, 440, 440, 0))),
+}
+AUDIO_STATS = ('triggered', 'merged', 'played', 'stolen', 'dropped', 'culled')
+
+def synth_samples(segments, rng):
+    """ Mono 16-bit samples for (ms, start Hz, end Hz, noise share) segments, each fading out. """
+    samples = array('h')
+    for ms, start_hz, end_hz, noise_share in segments:
+        count = AUDIO_FREQUENCY * ms // 1000
+        sweep = (end_hz - start_hz) / (2 * count) # Phase of a linear sweep: (start + sweep * i) * i / rate
+        if start_hz:
+            values = [(1.0 if (start_hz + sweep * i) * i / AUDIO_FREQUENCY % 1.0 < 0.5 else -1.0) * (1 - noise_share)
+                      for i in range(count)]
+        else:
+            values = [0.0] * count
+        if noise_share:
+            noise = 0.0
+            rand = rng.random
+            for i in range(count):
+                noise += (rand() * 2 - 1 - noise) * AUDIO_NOISE_SMOOTHING
+                values[i] += noise * noise_share * 2
+        samples.extend([int(max(-1.0, min(1.0, v)) * (1 - i / count) ** 2 * AUDIO_AMPLITUDE) for i, v in enumerate(values)])
+    return samples
+
+class AudioEngine:
+    def __init__(self):
+        self.enabled = False
+        self.sounds = {}
+        self.pools = {} # category -> [channel, priority, start order] per channel
+        self.pending = {} # name -> [triggers, sum x, sum y, positioned triggers] since the last flush
+        self.started = 0 # Voices started; orders voices by age
+        self.stats = dict.fromkeys(AUDIO_STATS, 0)
+        self.flush_ms = 0.0 # Slowest flush since the last report
+
+    def start(self, sound_dir=None):
+        """ Opens the mixer, reserves the channel pools and decodes every effect. False without audio. """
+        try:
+            pygame.mixer.init(AUDIO_FREQUENCY, -16, 2, AUDIO_BUFFER, allowedchanges=0)
+        except (pygame.error, NotImplementedError) as e: # No audio device, or pygame built without the mixer
+            event_log.emit('audio_unavailable', 'warning', error=str(e))
+            return False
+        total = sum(AUDIO_CATEGORIES.values())
+        pygame.mixer.set_num_channels(total)
+        pygame.mixer.set_reserved(total) # Only the pools below ever pick a channel
+        number = 0
+        for category, count in AUDIO_CATEGORIES.items():
+            self.pools[category] = [[pygame.mixer.Channel(number + i), 0, 0] for i in range(count)]
+            number += count
+        rng = random.Random(AUDIO_SEED)
+        for name, (category, priority, volume, segments) in AUDIO_EFFECTS.items():
+            sound = self.load(sound_dir, name) if sound_dir else None
+            if sound is None:
+                if name not in _sound_cache: # Kept in the --asset-cache file between launches
+                    mono = synth_samples(segments, rng)
+                    stereo = array('h', bytes(len(mono) * 4))
+                    stereo[0::2] = mono
+                    stereo[1::2] = mono
+                    _sound_cache[name] = stereo.tobytes()
+                sound = pygame.mixer.Sound(buffer=_sound_cache[name])
+            sound.set_volume(volume)
+            self.sounds[name] = sound
+        self.enabled = True
+        return True
+
+    def load(self, sound_dir, name):
+        """ name.wav or name.ogg from sound_dir, decoded in full; None if there is neither. """
+        for ext in ('.wav', '.ogg'):
+            path = os.path.join(sound_dir, name + ext)
+            if os.path.exists(path):
+                try:
+                    return pygame.mixer.Sound(path)
+                except pygame.error as e:
+                    event_log.emit('sound_load_failed', 'warning', path=path, error=str(e))
+        return None
+
+    def play(self, name, pos=None):
+        """ Queues an effect (at world position pos) for the next flush(). """
+        if not self.enabled:
+            return
+        entry = self.pending.get(name)
+        if entry is None:
+            entry = self.pending[name] = [0, 0, 0, 0]
+        entry[0] += 1
+        if pos is not None:
+            entry[1] += pos[0]
+            entry[2] += pos[1]
+            entry[3] += 1
+
+    def voice(self, category, priority):
+        """ A free channel slot of the category's pool, else the weakest voice priority may replace. """
+        weakest = None
+        for slot in self.pools[category]:
+            if not slot[0].get_busy():
+                return slot
+            if weakest is None or (slot[1], slot[2]) < (weakest[1], weakest[2]):
+                weakest = slot
+        if weakest[1] > priority:
+            return None
+        self.stats['stolen'] += 1
+        return weakest
+
+    def flush(self, view):
+        """ Starts the effects queued since the last flush, heard from the centre of view. """
+        if not self.pending:
+            return
+        start = time.perf_counter()
+        pending, self.pending = self.pending, {}
+        stats = self.stats
+        inner = max(view.width, view.height) / 2
+        for name in sorted(pending, key=lambda n: -AUDIO_EFFECTS[n][1]):
+            count, sum_x, sum_y, positioned = pending[name]
+            category, priority = AUDIO_EFFECTS[name][:2]
+            stats['triggered'] += count
+            stats['merged'] += count - 1
+            volume = min(1.0, AUDIO_VOICE_VOLUME * (1 + AUDIO_MERGE_GAIN * math.log2(count)))
+            left = right = volume
+            if positioned: # Heard from the middle of the triggers' positions
+                dx = sum_x / positioned - view.centerx
+                distance = math.hypot(dx, sum_y / positioned - view.centery)
+                if distance > inner + AUDIO_HEARING_MARGIN:
+                    stats['culled'] += 1
+                    continue
+                if distance > inner:
+                    volume *= 1 - (distance - inner) / AUDIO_HEARING_MARGIN
+                pan = max(-1.0, min(1.0, dx / (view.width / 2)))
+                left, right = volume * min(1.0, 1 - pan), volume * min(1.0, 1 + pan)
+            slot = self.voice(category, priority)
+            if slot is None:
+                stats['dropped'] += 1
+                continue
+            self.started += 1
+            slot[0].play(self.sounds[name])
+            slot[0].set_volume(left, right) # After play(), which resets the channel volume
+            slot[1], slot[2] = priority, self.started
+            stats['played'] += 1
+        self.flush_ms = max(self.flush_ms, (time.perf_counter() - start) * 1000)
+
+    def report(self):
+        """ Logs and resets the voice counters (once per game). """
+        if self.stats['triggered']:
+            event_log.emit('audio', flush_max_ms=round(self.flush_ms, 3), **self.stats)
+        self.stats = dict.fromkeys(AUDIO_STATS, 0)
+        self.flush_ms = 0.0
+
+audio = AudioEngine()
 
 # --- Player Tank Class ---
 class Player(pygame.sprite.Sprite):
     def __init__(self):
         super().__init__()
         self.size = PLAYER_SIZE
-        self.base_image = pygame.Surface([self.size, self.size], pygame.SRCALPHA)
-        pygame.draw.rect(self.base_image, GREEN, [0, 0, self.size, self.size], border_radius=2)
-        pygame.draw.line(self.base_image, WHITE,
-                         (self.size // 2, self.size // 2),
-                         (self.size, self.size // 2),
-                         max(1, self.size // 8))
+        self.color = GREEN
+        self.base_image = tank_image(self.size, self.color)
         self.image = self.base_image
-        self.start_pos = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
+        self.start_pos = world.center
         self.rect = self.image.get_rect(center=self.start_pos)
         self.angle = 0
+        self.aim_target = None # World position to aim at; None aims at the mouse
         self.vel_x = 0
         self.vel_y = 0
         self.last_shot_time = 0
         self.health = PLAYER_MAX_HEALTH # Added health
         self.ammo = PLAYER_MAX_AMMO     # Added ammo
 
+    # Save states: snapshot() and restore() cover the fields __init__ sets that change in play;
+    # keep them in step with __init__.
+    def snapshot(self):
+        return (tuple(self.rect), self.angle, self.health, self.ammo, self.last_shot_time, self.alive())
+
+    def restore(self, data):
+        """ Puts the player back in place (references stay valid); returns whether it was alive. """
+        rect, self.angle, self.health, self.ammo, self.last_shot_time, alive = data
+        self.image = rotated_tank_image(self.size, self.color, self.angle)
+        self.rect = pygame.Rect(rect)
+        self.vel_x = self.vel_y = 0
+        return alive
+
+    @property
+    def mask(self):
+        return image_mask(self.image)
+
     def update(self, walls, enemies_group):
         if self.health <= 0: return # Don't update if dead
 
-        # Aiming
-        mouse_x, mouse_y = pygame.mouse.get_pos()
-        delta_x = mouse_x - self.rect.centerx
-        delta_y = mouse_y - self.rect.centery
+        # Aiming (aim_target is the mouse in world coordinates when the camera scrolls)
+        target_x, target_y = self.aim_target if self.aim_target else pygame.mouse.get_pos()
+        delta_x = target_x - self.rect.centerx
+        delta_y = target_y - self.rect.centery
         self.angle = math.degrees(math.atan2(delta_y, delta_x))
 
         # Rotation
-        self.image = pygame.transform.rotate(self.base_image, -self.angle)
+        self.image = rotated_tank_image(self.size, self.color, self.angle)
         self.rect = self.image.get_rect(center=self.rect.center)
 
         # --- Movement ---
@@ -172,14 +1242,14 @@ class Player(pygame.sprite.Sprite):
         # --- Try moving X ---
         self.rect.x += applied_vel_x
         # Check wall collision X
-        colliding_walls_x = pygame.sprite.spritecollide(self, walls, False)
+        colliding_walls_x = spritecollide_masked(self, walls)
         if colliding_walls_x:
             self.rect.x -= applied_vel_x # Revert X move if wall collision
             applied_vel_x = 0 # Don't apply X velocity if blocked by wall
 
         # Check enemy collision X (only if not blocked by wall)
         if applied_vel_x != 0:
-            colliding_enemies_x = pygame.sprite.spritecollide(self, enemies_group, False)
+            colliding_enemies_x = spritecollide_masked(self, enemies_group)
             if colliding_enemies_x:
                 self.rect.x -= applied_vel_x # Revert X move if enemy collision
                 applied_vel_x = 0 # Mark X as blocked
@@ -187,14 +1257,14 @@ class Player(pygame.sprite.Sprite):
         # --- Try moving Y ---
         self.rect.y += applied_vel_y
         # Check wall collision Y
-        colliding_walls_y = pygame.sprite.spritecollide(self, walls, False)
+        colliding_walls_y = spritecollide_masked(self, walls)
         if colliding_walls_y:
             self.rect.y -= applied_vel_y # Revert Y move if wall collision
             applied_vel_y = 0 # Don't apply Y velocity if blocked by wall
 
         # Check enemy collision Y (only if not blocked by wall)
         if applied_vel_y != 0:
-            colliding_enemies_y = pygame.sprite.spritecollide(self, enemies_group, False)
+            colliding_enemies_y = spritecollide_masked(self, enemies_group)
             if colliding_enemies_y:
                  # Check if we already reverted X due to an enemy
                  # If so, and Y is also blocked by *the same enemy or another one*,
@@ -206,9 +1276,9 @@ class Player(pygame.sprite.Sprite):
         # --- Final Position & Screen Bounds ---
         # Apply screen bounds clamping AFTER resolving collisions
         self.rect.left = max(BORDER_THICKNESS, self.rect.left)
-        self.rect.right = min(SCREEN_WIDTH - BORDER_THICKNESS, self.rect.right)
+        self.rect.right = min(world.width - BORDER_THICKNESS, self.rect.right)
         self.rect.top = max(BORDER_THICKNESS, self.rect.top)
-        self.rect.bottom = min(SCREEN_HEIGHT - BORDER_THICKNESS, self.rect.bottom)
+        self.rect.bottom = min(world.height - BORDER_THICKNESS, self.rect.bottom)
 
         # Reset external velocity request flags
         self.vel_x = 0
@@ -219,13 +1289,12 @@ class Player(pygame.sprite.Sprite):
     def move_left(self): self.vel_x = -PLAYER_SPEED
     def move_right(self): self.vel_x = PLAYER_SPEED
 
-    def shoot(self, all_sprites, bullets):
+    def shoot(self, all_sprites, bullets, now):
         if self.ammo <= 0:
             # print("Player out of ammo!") # Optional feedback
-            # Add empty click sound here later?
+            audio.play('empty_click')
             return
 
-        now = pygame.time.get_ticks()
         if now - self.last_shot_time > SHOOT_DELAY:
             self.last_shot_time = now
             self.ammo -= 1 # Decrement ammo
@@ -238,56 +1307,76 @@ class Player(pygame.sprite.Sprite):
             bullet = Bullet(spawn_x, spawn_y, self.angle, color=BLUE, damage=1)
             all_sprites.add(bullet)
             bullets.add(bullet)
+            audio.play('player_shot', self.rect.center)
             # print(f"Player Ammo: {self.ammo}") # Debug
 
     def take_damage(self, amount):
         self.health -= amount
-        print(f"Player Hit! Health: {self.health}/{PLAYER_MAX_HEALTH}")
+        event_log.emit('damage', target='player', amount=amount, health=self.health)
+        audio.play('player_hit')
         if self.health <= 0:
             self.kill() # Remove sprite from groups
 
 # --- Enemy Tank Class ---
 class Enemy(pygame.sprite.Sprite):
-    def __init__(self, x, y, walls):
+    # Per-angle caches (class defaults so snapshot-restored enemies start empty too)
+    _heading_angle = None
+    _heading = (1.0, 0.0)
+    _image_angle = None
+
+    def __init__(self, x, y, walls, now):
         super().__init__()
         self.walls = walls # Keep reference to walls
-
-        # --- INSERT THIS BLOCK HERE ---
-        # Choose Type and Set Properties
-        self.type = random.choice(list(ENEMY_TYPES.keys()))
-        type_data = ENEMY_TYPES[self.type]
-        self.size = type_data['size']           # <-- Sets self.size
-        self.max_health = type_data['health']
-        self.health = type_data['health']
-        self.speed = PLAYER_SPEED * type_data['speed_mod']
-        self.color = type_data['color']
-        self.damage = type_data['damage']
-        self.score_value = type_data['score']
-        # --- END OF BLOCK TO INSERT ---
-
-        # Now self.size exists and can be used:
-        self.base_image = pygame.Surface([self.size, self.size], pygame.SRCALPHA)
-        pygame.draw.rect(self.base_image, self.color, [0, 0, self.size, self.size], border_radius=2)
-        pygame.draw.line(self.base_image, WHITE,
-                         (self.size // 2, self.size // 2),
-                         (self.size, self.size // 2),
-                         max(1, self.size // 8))
+        self.set_type(random.choice(list(ENEMY_TYPES.keys())))
+        self.health = self.max_health
         self.image = self.base_image
         self.rect = self.image.get_rect(center=(x, y))
         self.angle = random.randint(0, 359)
-
-        # ... rest of the __init__ method (timers, ammo, state, etc.) ...
-        self.change_dir_timer = pygame.time.get_ticks() + random.randint(500, 1500)
-        self.shoot_timer = pygame.time.get_ticks() + random.randint(1000, 2500)
+        self.change_dir_timer = now + random.randint(500, 1500)
+        self.shoot_timer = now + random.randint(1000, 2500)
         self.last_shot_time = 0
         self.ammo = ENEMY_MAX_AMMO
-        self.lookahead_dist = self.size * 1.3 # Use self.size after it's set
         self.state = 'roaming'
 
+    def set_type(self, enemy_type):
+        """ Sets everything that follows from the enemy type (size, stats, base image). """
+        type_data = ENEMY_TYPES[enemy_type]
+        self.type = enemy_type
+        self.size = type_data['size']
+        self.max_health = type_data['health']
+        self.speed = PLAYER_SPEED * type_data['speed_mod']
+        self.color = type_data['color']
+        self.damage = type_data['damage']
+        self.score_value = type_data['score']
+        self.base_image = tank_image(self.size, self.color)
+        self.lookahead_dist = self.size * 1.3
+
+    # Save states: snapshot() holds every field __init__ sets that is not derived by set_type(),
+    # and from_snapshot() puts them back; keep both in step with __init__.
+    def snapshot(self):
+        return (self.type, tuple(self.rect), self.angle, self.health, self.change_dir_timer, self.shoot_timer,
+                self.last_shot_time, self.ammo, self.state)
+
+    @classmethod
+    def from_snapshot(cls, data, walls):
+        """ Rebuilds a snapshotted enemy, bypassing __init__ so the RNG is not disturbed. """
+        enemy = cls.__new__(cls)
+        pygame.sprite.Sprite.__init__(enemy)
+        enemy.walls = walls
+        (enemy_type, rect, enemy.angle, enemy.health, enemy.change_dir_timer, enemy.shoot_timer,
+         enemy.last_shot_time, enemy.ammo, enemy.state) = data
+        enemy.set_type(enemy_type)
+        enemy.image = rotated_tank_image(enemy.size, enemy.color, enemy.angle)
+        enemy.rect = pygame.Rect(rect)
+        return enemy
+
+    @property
+    def mask(self):
+        return image_mask(self.image)
+
     # Update method now includes chasing logic
-    def update(self, all_sprites, bullets, player_rect, players_group, enemies_group):
+    def update(self, all_sprites, bullets, player_rect, players_group, enemies_group, now, index=None, danger=None):
         if self.health <= 0: return
-        now = pygame.time.get_ticks()
 
         # --- State Handling & Target Acquisition ---
         target_angle = self.angle
@@ -305,19 +1394,26 @@ class Enemy(pygame.sprite.Sprite):
 
         # --- Collision Prediction (Walls) ---
         # Calculate prediction based on current angle BEFORE deciding turns
-        rad_predict_angle = math.radians(self.angle)
-        lookahead_x = self.rect.centerx + math.cos(rad_predict_angle) * self.lookahead_dist
-        lookahead_y = self.rect.centery + math.sin(rad_predict_angle) * self.lookahead_dist
+        cos_a, sin_a = self.heading()
+        lookahead_x = self.rect.centerx + cos_a * self.lookahead_dist
+        lookahead_y = self.rect.centery + sin_a * self.lookahead_dist
         lookahead_rect = pygame.Rect(0, 0, 4, 4)
         lookahead_rect.center = (lookahead_x, lookahead_y)
 
         predicted_wall_collision = False
-        for wall in self.walls:
-            if wall.rect.colliderect(lookahead_rect):
-                predicted_wall_collision = True
-                break
-        if not (BORDER_THICKNESS < lookahead_x < SCREEN_WIDTH - BORDER_THICKNESS and \
-                BORDER_THICKNESS < lookahead_y < SCREEN_HEIGHT - BORDER_THICKNESS):
+        if index is not None:
+            predicted_wall_collision = lookahead_rect.collidelist(index.walls_at(lookahead_x, lookahead_y)) != -1
+        else:
+            for wall in self.walls:
+                if wall.rect.colliderect(lookahead_rect):
+                    predicted_wall_collision = True
+                    break
+        if not (BORDER_THICKNESS < lookahead_x < world.width - BORDER_THICKNESS and \
+                BORDER_THICKNESS < lookahead_y < world.height - BORDER_THICKNESS):
+            predicted_wall_collision = True
+        # Bombardment zones are avoided like walls
+        predicted_danger = danger is not None and danger.dangerous(lookahead_x, lookahead_y)
+        if predicted_danger:
             predicted_wall_collision = True
 
 
@@ -340,56 +1436,17 @@ class Enemy(pygame.sprite.Sprite):
             target_angle = math.degrees(math.atan2(dy, dx))
             # If chasing AND predicting wall, force a turn away from wall? (More complex)
             # For now, just let the stuck logic handle it if chasing into wall.
-            self.angle = target_angle # Snap angle
-            self.angle %= 360
-
-
-        # --- Rotation ---
-        # Apply the decided final angle
-        self.image = pygame.transform.rotate(self.base_image, -self.angle)
-        current_center = self.rect.center
-        self.rect = self.image.get_rect(center=current_center)
-
-
-        # --- Movement Execution ---
-        # Always attempt to move based on the current angle
-        old_center = self.rect.center
-        applied_dx = 0
-        applied_dy = 0
-
-        rad_move_angle = math.radians(self.angle) # Use final angle for movement
-        potential_dx = math.cos(rad_move_angle) * self.speed
-        potential_dy = math.sin(rad_move_angle) * self.speed
-
-        # Create the check group
-        tanks_to_check = players_group.sprites() + [e for e in enemies_group if e != self]
-        temp_group_for_check = pygame.sprite.Group(tanks_to_check)
+            if danger is not None and distance_to_player and danger.dangerous(self.rect.centerx + dx / distance_to_player * self.lookahead_dist,
+                                                       self.rect.centery + dy / distance_to_player * self.lookahead_dist):
+                # The straight chase runs into a bombardment zone: skirt it instead of snapping
+                if predicted_danger:
+                    self.angle = (self.angle + random.choice((-90, 90))) % 360
+            else:
+                self.angle = target_angle # Snap angle
+                self.angle %= 360
 
-        # Try moving X
-        self.rect.x += potential_dx
-        collided_wall_x = pygame.sprite.spritecollide(self, self.walls, False)
-        collided_tank_x = pygame.sprite.spritecollide(self, temp_group_for_check, False)
-        if collided_wall_x or collided_tank_x:
-            self.rect.x -= potential_dx # Revert X
-        else:
-            applied_dx = potential_dx # X move successful
-
-        # Try moving Y
-        self.rect.y += potential_dy
-        collided_wall_y = pygame.sprite.spritecollide(self, self.walls, False)
-        collided_tank_y = pygame.sprite.spritecollide(self, temp_group_for_check, False)
-        if collided_wall_y or collided_tank_y:
-             self.rect.y -= potential_dy # Revert Y
-        else:
-             applied_dy = potential_dy # Y move successful
 
-        # --- Check if Stuck & Force Turn ---
-        # Only force turn if movement was attempted but resulted in zero displacement
-        if applied_dx == 0 and applied_dy == 0 and (abs(potential_dx) > 0.01 or abs(potential_dy) > 0.01): # Check potential was non-zero
-             self.rect.center = old_center # Ensure full revert if stuck
-             self.angle += random.choice([110, -110, 135, -135, 160, -160, 180])
-             self.angle %= 360
-             self.change_dir_timer = now + random.randint(100, 400) # Re-evaluate soon
+        self.move(players_group, enemies_group, now, index)
 
 
         # --- Shooting Logic ---
@@ -400,7 +1457,9 @@ class Enemy(pygame.sprite.Sprite):
                  # Shoot if chasing and aimed, or if roaming and aimed
                  should_shoot = (self.state == 'chasing' or self.state == 'roaming')
 
-                 if should_shoot and abs(angle_diff(self.angle, angle_to_player)) < ENEMY_AIM_TOLERANCE:
+                 # Only fire with a clear line of sight (walls would just eat the bullet)
+                 if should_shoot and abs(angle_diff(self.angle, angle_to_player)) < ENEMY_AIM_TOLERANCE and \
+                    (index is None or index.line_of_sight(*self.rect.center, player_rect.center)):
                      # ... (fire bullet) ...
                      self.last_shot_time = now
                      self.ammo -= 1
@@ -412,10 +1471,106 @@ class Enemy(pygame.sprite.Sprite):
                      bullet = Bullet(spawn_x, spawn_y, bullet_angle, color=self.color, damage=self.damage)
                      all_sprites.add(bullet)
                      bullets.add(bullet)
+                     audio.play('enemy_shot', self.rect.center)
                      self.shoot_timer = now + random.randint(500, 1500)
                  else:
                       self.shoot_timer = now + random.randint(200, 500)
 
+    def heading(self):
+        """ (cos, sin) of the current angle, recomputed only when the angle changes. """
+        if self._heading_angle != self.angle:
+            rad = math.radians(self.angle)
+            self._heading_angle = self.angle
+            self._heading = (math.cos(rad), math.sin(rad))
+        return self._heading
+
+    def move(self, players_group, enemies_group, now, index=None):
+        """
+        Rotates to the current angle and drives forward, turning away if completely stuck.
+        With a TankIndex only nearby tanks and the wall rect list are checked.
+        """
+        # --- Rotation ---
+        # Apply the decided final angle (the image and rect size only change with it)
+        if self._image_angle != self.angle:
+            self._image_angle = self.angle
+            self.image = rotated_tank_image(self.size, self.color, self.angle)
+            current_center = self.rect.center
+            self.rect = self.image.get_rect(center=current_center)
+
+
+        # --- Movement Execution ---
+        # Always attempt to move based on the current angle
+        old_center = self.rect.center
+        applied_dx = 0
+        applied_dy = 0
+
+        cos_a, sin_a = self.heading() # Use final angle for movement
+        potential_dx = cos_a * self.speed
+        potential_dy = sin_a * self.speed
+
+        if index is not None:
+            # Walls, the player and the enemies close enough to be reached this tick
+            wall_rects, tanks = index.blockers_at(*self.rect.center)
+            if index.solid_enemies:
+                nearby = [e for e in index.query(self.rect.inflate(4, 4), self) if e.alive()]
+                if nearby:
+                    tanks = [*tanks, *nearby]
+
+            # Try moving X (rect broadphase inline, masks only when something is touched)
+            self.rect.x += potential_dx
+            if (tanks or self.rect.collidelist(wall_rects) != -1) and self.blocked(wall_rects, tanks):
+                self.rect.x -= potential_dx # Revert X
+            else:
+                applied_dx = potential_dx # X move successful
+
+            # Try moving Y
+            self.rect.y += potential_dy
+            if (tanks or self.rect.collidelist(wall_rects) != -1) and self.blocked(wall_rects, tanks):
+                self.rect.y -= potential_dy # Revert Y
+            else:
+                applied_dy = potential_dy # Y move successful
+        else:
+            # Create the check group
+            tanks_to_check = players_group.sprites() + [e for e in enemies_group if e != self]
+            temp_group_for_check = pygame.sprite.Group(tanks_to_check)
+
+            # Try moving X
+            self.rect.x += potential_dx
+            collided_wall_x = spritecollide_masked(self, self.walls)
+            collided_tank_x = spritecollide_masked(self, temp_group_for_check)
+            if collided_wall_x or collided_tank_x:
+                self.rect.x -= potential_dx # Revert X
+            else:
+                applied_dx = potential_dx # X move successful
+
+            # Try moving Y
+            self.rect.y += potential_dy
+            collided_wall_y = spritecollide_masked(self, self.walls)
+            collided_tank_y = spritecollide_masked(self, temp_group_for_check)
+            if collided_wall_y or collided_tank_y:
+                 self.rect.y -= potential_dy # Revert Y
+            else:
+                 applied_dy = potential_dy # Y move successful
+
+        # --- Check if Stuck & Force Turn ---
+        # Only force turn if movement was attempted but resulted in zero displacement
+        if applied_dx == 0 and applied_dy == 0 and (abs(potential_dx) > 0.01 or abs(potential_dy) > 0.01): # Check potential was non-zero
+             self.rect.center = old_center # Ensure full revert if stuck
+             self.angle += random.choice([110, -110, 135, -135, 160, -160, 180])
+             self.angle %= 360
+             self.change_dir_timer = now + random.randint(100, 400) # Re-evaluate soon
+
+    def blocked(self, wall_rects, tanks):
+        """ Whether the rotated tank (its cached mask, not its rect) overlaps any of the walls or tanks. """
+        rect, mask = self.rect, self.mask
+        for i in rect.collidelistall(wall_rects):
+            if mask_touches_rect(mask, rect, wall_rects[i]):
+                return True
+        for tank in tanks:
+            if rect.colliderect(tank.rect) and pygame.sprite.collide_mask(self, tank):
+                return True
+        return False
+
     def take_damage(self, amount):
         self.health -= amount
         # print(f"Enemy {self.type} hit! Health: {self.health}/{self.max_health}") # Debug
@@ -428,34 +1583,69 @@ class Bullet(pygame.sprite.Sprite):
     # Added damage parameter
     def __init__(self, x, y, angle, color=BLUE, damage=1):
         super().__init__()
-        self.image = pygame.Surface([BULLET_SIZE, BULLET_SIZE], pygame.SRCALPHA) # Use SRCALPHA
-        # Draw circle, use colorkey only if background isn't transparent
-        pygame.draw.circle(self.image, color, (BULLET_SIZE//2, BULLET_SIZE//2), BULLET_SIZE//2)
-        # self.image.set_colorkey(BLACK) # Not needed with SRCALPHA and clear background
+        self.image = bullet_image(color) # Shared, cached surface
         self.rect = self.image.get_rect(center=(x, y))
         self.angle = angle
         self.speed = BULLET_SPEED
         self.damage = damage # Store damage value
+        self.color = color
         rad_angle = math.radians(self.angle)
         self.vel_x = math.cos(rad_angle) * self.speed
         self.vel_y = math.sin(rad_angle) * self.speed
+        self.start = self.rect.topleft # Where this tick's move began, for swept collision
+
+    # Save states: keep snapshot() and from_snapshot() in step with __init__.
+    def snapshot(self):
+        return (self.rect.x, self.rect.y, self.angle, self.vel_x, self.vel_y, self.damage, self.color)
+
+    @classmethod
+    def from_snapshot(cls, data):
+        """ Rebuilds a snapshotted bullet with its exact velocity. """
+        x, y, angle, vel_x, vel_y, damage, color = data
+        bullet = cls.__new__(cls)
+        pygame.sprite.Sprite.__init__(bullet)
+        bullet.image = bullet_image(color)
+        bullet.rect = bullet.image.get_rect(topleft=(x, y))
+        bullet.angle = angle
+        bullet.speed = BULLET_SPEED
+        bullet.damage = damage
+        bullet.color = color
+        bullet.vel_x = vel_x
+        bullet.vel_y = vel_y
+        bullet.start = bullet.rect.topleft
+        return bullet
+
+    @property
+    def mask(self):
+        return image_mask(self.image)
 
     def update(self):
+        # Out-of-world bullets are removed after the swept collision test, so a fast bullet
+        # still hits what lies on its way out.
+        self.start = self.rect.topleft
         self.rect.x += self.vel_x
         self.rect.y += self.vel_y
-        if not (BORDER_THICKNESS < self.rect.centerx < SCREEN_WIDTH - BORDER_THICKNESS and \
-                BORDER_THICKNESS < self.rect.centery < SCREEN_HEIGHT - BORDER_THICKNESS):
-             self.kill()
+
+    def path_rect(self):
+        """ Rect covering the bullet at both ends of this tick's move. """
+        return self.rect.union(pygame.Rect(self.start, self.rect.size))
+
+    def in_world(self):
+        return (BORDER_THICKNESS < self.rect.centerx < world.width - BORDER_THICKNESS and
+                BORDER_THICKNESS < self.rect.centery < world.height - BORDER_THICKNESS)
 
 # --- Wall Class --- (No changes needed)
 class Wall(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height):
         super().__init__()
-        self.image = pygame.Surface([width, height])
-        self.image.fill(WHITE)
+        self.image = wall_image(width, height)
         self.rect = self.image.get_rect()
         self.rect.topleft = (x, y)
 
+    @property
+    def mask(self):
+        return solid_mask(self.rect.size)
+
 # --- Bombardment Zone Class ---
 class BombardmentZone:
     def __init__(self, x, y, spawn_time):
@@ -464,7 +1654,6 @@ class BombardmentZone:
         self.spawn_time = spawn_time
         self.color = BOMBARDMENT_COLOR
         self.thickness = BOMBARDMENT_THICKNESS
-        print(f"Bombardment zone created at {self.center}") # Debug
 
     def is_expired(self, current_time):
         """Checks if the zone's duration has passed."""
@@ -474,28 +1663,126 @@ class BombardmentZone:
         """Checks if a point vector is inside the zone."""
         return point_vec.distance_to(self.center) <= self.radius
 
-    def draw(self, surface):
-        """Draws the zone on the target surface."""
-        # Draw on a temporary surface for alpha blending
-        temp_surface = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
-        pygame.draw.circle(temp_surface, self.color,
-                           (int(self.center.x), int(self.center.y)),
-                           self.radius, self.thickness)
-        surface.blit(temp_surface, (0, 0))
+    def draw(self, surface, offset=(0, 0), scale=1):
+        """Draws the zone on the target surface (offset is the camera's world position, scale the render scale)."""
+        # The alpha ring is drawn once per size at the render scale (zone_image) and blended in with a blit
+        radius = int(self.radius * scale)
+        surface.blit(zone_image(radius, self.color, max(1, int(self.thickness * scale))),
+                     (int((self.center.x - offset[0]) * scale) - radius, int((self.center.y - offset[1]) * scale) - radius))
+
+# --- Bombardment zone rendering ---
+def zone_image(radius, color, thickness):
+    """ Alpha ring for a bombardment zone, shared by every zone of that size. """
+    key = ('zone', radius, color, thickness)
+    image = _image_cache.get(key)
+    if image is None:
+        image = new_surface([radius * 2 + 1, radius * 2 + 1], pygame.SRCALPHA)
+        pygame.draw.circle(image, color, (radius, radius), radius, thickness)
+        _image_cache[key] = image
+    return image
+
+def draw_bombardment_zones(surface, zones, mode='full', offset=(0, 0), scale=1):
+    """
+    'full' blits each zone's alpha ring drawn at the render scale (BombardmentZone.draw), 'overlay'
+    one batch of rings drawn at scale 1 and scaled, and 'outline' draws plain opaque circles straight
+    onto the target. offset is the camera's world position.
+    """
+    ox, oy = offset
+    if mode == 'full':
+        for zone in zones:
+            zone.draw(surface, offset, scale)
+    elif mode == 'overlay':
+        surface.blits(scale_blits([(zone_image(zone.radius, zone.color, zone.thickness),
+                                    (int(zone.center.x) - zone.radius - ox, int(zone.center.y) - zone.radius - oy))
+                                   for zone in zones], scale), False)
+    else:
+        for zone in zones:
+            pygame.draw.circle(surface, zone.color[:3], (int((zone.center.x - ox) * scale), int((zone.center.y - oy) * scale)),
+                               int(zone.radius * scale), 1)
+
+# --- Danger Map ---
+# Active bombardment zones are rasterised once when a bombardment starts into a coarse grid
+# over the world. Kill checks and enemy steering then cost one cell lookup per tank, however
+# many zones there are; only cells on a zone's rim fall back to an exact distance check.
+DANGER_SAFE, DANGER_INSIDE, DANGER_EDGE = 0, 1, 2
+
+class DangerMap:
+    def __init__(self, cell_size=DANGER_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cols = self.rows = 0
+        self.cells = None # bytearray of DANGER_* per cell, None while no bombardment is active
+        self.edges = {} # cell index -> zones whose rim crosses that cell
+
+    def clear(self):
+        self.cells = None
+        self.edges = {}
+
+    def rasterize(self, zones):
+        """ Marks every cell the zones fully cover as inside and every cell their rims cross as edge. """
+        if not zones:
+            self.clear()
+            return
+        cs = self.cell_size
+        cols = self.cols = -(-world.width // cs)
+        rows = self.rows = -(-world.height // cs)
+        cells = self.cells = bytearray(cols * rows)
+        edges = self.edges = {}
+        reach = cs / math.sqrt(2) # Cell centre to corner
+        for zone in zones:
+            cx, cy, r = zone.center.x, zone.center.y, zone.radius
+            for row in range(max(0, int(cy - r) // cs), min(rows - 1, int(cy + r) // cs) + 1):
+                for col in range(max(0, int(cx - r) // cs), min(cols - 1, int(cx + r) // cs) + 1):
+                    i = row * cols + col
+                    if cells[i] == DANGER_INSIDE:
+                        continue
+                    d = math.hypot((col + 0.5) * cs - cx, (row + 0.5) * cs - cy)
+                    if d + reach <= r:
+                        cells[i] = DANGER_INSIDE
+                        edges.pop(i, None)
+                    elif d - reach <= r:
+                        cells[i] = DANGER_EDGE
+                        edges.setdefault(i, []).append(zone)
+
+    def _cell(self, x, y):
+        col = int(x) // self.cell_size
+        row = int(y) // self.cell_size
+        if self.cells is None or not (0 <= col < self.cols and 0 <= row < self.rows):
+            return -1
+        return row * self.cols + col
+
+    def hit(self, x, y):
+        """ Exactly BombardmentZone.collides_point() for any active zone. """
+        i = self._cell(x, y)
+        if i < 0:
+            return False
+        danger = self.cells[i]
+        if danger == DANGER_INSIDE:
+            return True
+        if danger == DANGER_EDGE:
+            for zone in self.edges[i]:
+                if (x - zone.center.x) ** 2 + (y - zone.center.y) ** 2 <= zone.radius * zone.radius:
+                    return True
+        return False
+
+    def dangerous(self, x, y):
+        """ Coarse check for AI steering: the cell under (x, y) is in or on the rim of a zone. """
+        i = self._cell(x, y)
+        return i >= 0 and self.cells[i] != DANGER_SAFE
 
 # --- Helper function to start bombardment ---
 def start_bombardment(current_time, zone_list, walls_group, player_sprite):
-
-    print(f"Starting bombardment at {current_time}!") # Debug
     zone_list.clear() # Clear any previous zones (should be empty anyway)
     spawned_count = 0
     total_attempts = 0 # Prevent infinite loops
 
-    # Define spawn area inset from borders
-    min_x = BORDER_THICKNESS + BOMBARDMENT_RADIUS
-    max_x = SCREEN_WIDTH - BORDER_THICKNESS - BOMBARDMENT_RADIUS
-    min_y = BORDER_THICKNESS + BOMBARDMENT_RADIUS
-    max_y = SCREEN_HEIGHT - BORDER_THICKNESS - BOMBARDMENT_RADIUS
+    # Define spawn area inset from borders (a screen-sized area around the player in large worlds)
+    area = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+    area.center = player_sprite.rect.center if player_sprite else world.center
+    area.clamp_ip(world)
+    min_x = area.left + BORDER_THICKNESS + BOMBARDMENT_RADIUS
+    max_x = area.right - BORDER_THICKNESS - BOMBARDMENT_RADIUS
+    min_y = area.top + BORDER_THICKNESS + BOMBARDMENT_RADIUS
+    max_y = area.bottom - BORDER_THICKNESS - BOMBARDMENT_RADIUS
 
     while spawned_count < BOMBARDMENT_COUNT and total_attempts < 200:
         total_attempts += 1
@@ -520,8 +1807,10 @@ def start_bombardment(current_time, zone_list, walls_group, player_sprite):
         zone_list.append(new_zone)
         spawned_count += 1
 
+    audio.play('bombardment')
+    event_log.emit('bombardment_start', zones=[(round(z.center.x), round(z.center.y)) for z in zone_list])
     if spawned_count < BOMBARDMENT_COUNT:
-        print(f"Warning: Only spawned {spawned_count}/{BOMBARDMENT_COUNT} bombardment zones.")
+        event_log.emit('bombardment_short', 'warning', spawned=spawned_count, wanted=BOMBARDMENT_COUNT)
 
 
 # --- Particle Class for Explosions ---
@@ -540,10 +1829,23 @@ class Particle(pygame.sprite.Sprite):
         self.vel_y = math.sin(angle) * speed
 
         # Create initial image and rect
-        self.image = pygame.Surface([self.size * 2, self.size * 2], pygame.SRCALPHA) # Double size for antialiasing
-        pygame.draw.circle(self.image, self.color, (self.size, self.size), self.size)
+        self.image = particle_image(self.color, self.size)
         self.rect = self.image.get_rect(center=(self.x, self.y))
 
+    # Save states: keep snapshot() and from_snapshot() in step with __init__.
+    def snapshot(self):
+        return (self.x, self.y, self.vel_x, self.vel_y, self.color, self.lifespan, self.size)
+
+    @classmethod
+    def from_snapshot(cls, data):
+        """ Rebuilds a snapshotted particle, bypassing __init__ so the RNG is not disturbed. """
+        particle = cls.__new__(cls)
+        pygame.sprite.Sprite.__init__(particle)
+        particle.x, particle.y, particle.vel_x, particle.vel_y, particle.color, particle.lifespan, particle.size = data
+        particle.image = particle_image(particle.color, particle.size)
+        particle.rect = particle.image.get_rect(center=(int(particle.x), int(particle.y)))
+        return particle
+
     def update(self):
         # Move
         self.x += self.vel_x
@@ -565,8 +1867,7 @@ class Particle(pygame.sprite.Sprite):
         if current_size != self.size:
              self.size = current_size
              center = self.rect.center # Store center
-             self.image = pygame.Surface([self.size * 2, self.size * 2], pygame.SRCALPHA)
-             pygame.draw.circle(self.image, self.color, (self.size, self.size), self.size)
+             self.image = particle_image(self.color, self.size)
              self.rect = self.image.get_rect(center=center) # Re-center
 
         # Optional: Add friction/gravity here if desired
@@ -578,30 +1879,33 @@ class AmmoRefill(pygame.sprite.Sprite):
         super().__init__()
         self.type = 'ammo' # Identify the type
         self.size = POWERUP_SIZE
-        self.image = pygame.Surface([self.size, self.size], pygame.SRCALPHA)
-        self.image.fill((0,0,0,0))
-
-        # --- Draw star --- (same as before)
-        center_x, center_y = self.size // 2, self.size // 2
-        radius_outer = self.size // 2
-        radius_inner = int(radius_outer * 0.5)
-        num_points = 5
-        star_points = []
-        for i in range(num_points * 2):
-            angle = math.pi / num_points * i - math.pi / 2
-            radius = radius_outer if i % 2 == 0 else radius_inner
-            px = center_x + radius * math.cos(angle)
-            py = center_y + radius * math.sin(angle)
-            star_points.append((px, py))
-        pygame.draw.polygon(self.image, YELLOW, star_points)
-        # --- End star ---
+        self.image = _image_cache.get(('powerup', self.type)) # Built once, shared by every spawn
+        if self.image is None:
+            self.image = new_surface([self.size, self.size], pygame.SRCALPHA)
+            self.image.fill((0,0,0,0))
+
+            # --- Draw star --- (same as before)
+            center_x, center_y = self.size // 2, self.size // 2
+            radius_outer = self.size // 2
+            radius_inner = int(radius_outer * 0.5)
+            num_points = 5
+            star_points = []
+            for i in range(num_points * 2):
+                angle = math.pi / num_points * i - math.pi / 2
+                radius = radius_outer if i % 2 == 0 else radius_inner
+                px = center_x + radius * math.cos(angle)
+                py = center_y + radius * math.sin(angle)
+                star_points.append((px, py))
+            pygame.draw.polygon(self.image, YELLOW, star_points)
+            # --- End star ---
+            _image_cache[('powerup', self.type)] = sprite_surface(self.image)
 
         self.rect = self.image.get_rect(center=(x, y))
         self.spawn_time = spawn_time # Store when it was spawned
 
     def update(self, current_time): # Needs current_time to check lifespan
         if current_time - self.spawn_time > POWERUP_LIFESPAN:
-            print(f"{self.type} powerup timed out.") # Debug
+            event_log.emit('powerup_expired', type=self.type)
             self.kill() # Remove if lifespan exceeded
 
 # --- NEW: Health Restore Power-up Class ---
@@ -610,57 +1914,65 @@ class HealthRestore(pygame.sprite.Sprite):
         super().__init__()
         self.type = 'health' # Identify the type
         self.size = POWERUP_SIZE
-        self.image = pygame.Surface([self.size, self.size], pygame.SRCALPHA)
-        self.image.fill((0,0,0,0))
-
-        # --- Draw a simple cross ---
-        bar_width = self.size // 5
-        bar_length = self.size - 2 # Make slightly smaller than surface
-        # Horizontal bar
-        pygame.draw.rect(self.image, HEALTH_CROSS_COLOR,
-                         [1, self.size // 2 - bar_width // 2, bar_length, bar_width], border_radius=1)
-        # Vertical bar
-        pygame.draw.rect(self.image, HEALTH_CROSS_COLOR,
-                         [self.size // 2 - bar_width // 2, 1, bar_width, bar_length], border_radius=1)
-        # --- End cross ---
+        self.image = _image_cache.get(('powerup', self.type)) # Built once, shared by every spawn
+        if self.image is None:
+            self.image = new_surface([self.size, self.size], pygame.SRCALPHA)
+            self.image.fill((0,0,0,0))
+
+            # --- Draw a simple cross ---
+            bar_width = self.size // 5
+            bar_length = self.size - 2 # Make slightly smaller than surface
+            # Horizontal bar
+            pygame.draw.rect(self.image, HEALTH_CROSS_COLOR,
+                             [1, self.size // 2 - bar_width // 2, bar_length, bar_width], border_radius=1)
+            # Vertical bar
+            pygame.draw.rect(self.image, HEALTH_CROSS_COLOR,
+                             [self.size // 2 - bar_width // 2, 1, bar_width, bar_length], border_radius=1)
+            # --- End cross ---
+            _image_cache[('powerup', self.type)] = sprite_surface(self.image)
 
         self.rect = self.image.get_rect(center=(x, y))
         self.spawn_time = spawn_time # Store when it was spawned
 
     def update(self, current_time): # Needs current_time to check lifespan
         if current_time - self.spawn_time > POWERUP_LIFESPAN:
-            print(f"{self.type} powerup timed out.") # Debug
+            event_log.emit('powerup_expired', type=self.type)
             self.kill() # Remove if lifespan exceeded
 
 # --- Helper function to spawn Powerup --- (Renamed from spawn_star)
-def spawn_powerup(current_time, all_sprites_group, powerups_group, walls_group, player_sprite):
+def spawn_powerup(current_time, all_sprites_group, powerups_group, walls_group, player_sprite, spawn_points=None):
     # Randomly choose which powerup to spawn
     PowerupClass = random.choice([AmmoRefill, HealthRestore])
 
     spawn_attempts = 0
     while spawn_attempts < 100:
         spawn_attempts += 1
-        x = random.randint(BORDER_THICKNESS + POWERUP_SIZE, SCREEN_WIDTH - BORDER_THICKNESS - POWERUP_SIZE)
-        y = random.randint(BORDER_THICKNESS + POWERUP_SIZE, SCREEN_HEIGHT - BORDER_THICKNESS - POWERUP_SIZE)
+        if spawn_points: # Precomputed wall-free points from the arena
+            x, y = random.choice(spawn_points)
+        else:
+            x = random.randint(BORDER_THICKNESS + POWERUP_SIZE, world.width - BORDER_THICKNESS - POWERUP_SIZE)
+            y = random.randint(BORDER_THICKNESS + POWERUP_SIZE, world.height - BORDER_THICKNESS - POWERUP_SIZE)
 
         # Create temporary powerup for collision checks
         # We pass current_time now because the constructors need it
         temp_powerup = PowerupClass(x, y, current_time)
 
-        if not pygame.sprite.spritecollide(temp_powerup, walls_group, False):
+        if spawn_points or not pygame.sprite.spritecollide(temp_powerup, walls_group, False):
             # Check collision with player using the passed player_sprite reference
             if not (player_sprite and temp_powerup.rect.colliderect(player_sprite.rect.inflate(PLAYER_SIZE, PLAYER_SIZE))):
                  # Add the real powerup
                  all_sprites_group.add(temp_powerup)
                  powerups_group.add(temp_powerup)
-                 print(f"{temp_powerup.type} spawned at ({x},{y})")
+                 event_log.emit('spawn', entity='powerup', type=temp_powerup.type, x=x, y=y)
                  return True
-    print("Warning: Could not find valid spawn location for powerup.")
+    event_log.emit('spawn_failed', 'warning', entity='powerup')
     return False
 
 # --- Helper function to create explosion particles --- <--- MOVE IT HERE
 def create_explosion(center_pos, all_sprites_group, particles_group):
-    for _ in range(PARTICLE_COUNT):
+    audio.play('explosion', center_pos)
+    count = min(quality.particle_count(), PARTICLE_LIMIT - len(particles_group)) # PARTICLE_COUNT, reduced by the quality governor
+    for _ in range(count):
         # Pass the groups directly to the Particle constructor
         Particle(center_pos[0], center_pos[1], (all_sprites_group, particles_group))
 
@@ -674,25 +1986,844 @@ def fibonacci(n):
         a, b = b, a + b
     return b
 
+# --- Wall Grid (static wall index) ---
+class WallGrid:
+    """ Uniform grid over the arena holding per-cell wall occupancy and the walls touching each cell. """
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, cell_size=GRID_CELL_SIZE):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.cols = (width + cell_size - 1) // cell_size
+        self.rows = (height + cell_size - 1) // cell_size
+        self.occupancy = bytearray(self.cols * self.rows) # 1 = a wall touches this cell
+        self.buckets = {} # cell index -> list of wall rects
+        self.rects = []
+
+    @classmethod
+    def from_occupancy(cls, rects, occupancy, width, height, cell_size=GRID_CELL_SIZE):
+        """ A grid over rects whose occupancy is already known (a level pack); no cell is visited. """
+        grid = cls(width, height, cell_size)
+        grid.occupancy[:] = occupancy
+        grid.rects = [pygame.Rect(rect) for rect in rects]
+        grid.buckets = WallBuckets(grid)
+        return grid
+
+    def cell_range(self, rect):
+        """ Returns the (col0, col1, row0, row1) cell span covered by rect, clipped to the grid. """
+        cs = self.cell_size
+        col0 = max(0, rect.left // cs)
+        col1 = min(self.cols - 1, (rect.right - 1) // cs)
+        row0 = max(0, rect.top // cs)
+        row1 = min(self.rows - 1, (rect.bottom - 1) // cs)
+        return col0, col1, row0, row1
+
+    def add(self, rect):
+        """ Registers a wall rect in the occupancy grid and the cell buckets. """
+        rect = pygame.Rect(rect)
+        self.rects.append(rect)
+        col0, col1, row0, row1 = self.cell_range(rect)
+        for row in range(row0, row1 + 1):
+            base = row * self.cols
+            for col in range(col0, col1 + 1):
+                self.occupancy[base + col] = 1
+                self.buckets.setdefault(base + col, []).append(rect)
+
+    def query(self, rect):
+        """ Returns the wall rects sharing at least one cell with rect (broadphase candidates). """
+        col0, col1, row0, row1 = self.cell_range(rect)
+        found = []
+        for row in range(row0, row1 + 1):
+            base = row * self.cols
+            for col in range(col0, col1 + 1):
+                if self.occupancy[base + col]:
+                    for wall_rect in self.buckets[base + col]:
+                        if wall_rect not in found:
+                            found.append(wall_rect)
+        return found
+
+    def collides(self, rect):
+        """ True if rect overlaps any registered wall. """
+        col0, col1, row0, row1 = self.cell_range(rect)
+        for row in range(row0, row1 + 1):
+            base = row * self.cols
+            for col in range(col0, col1 + 1):
+                if self.occupancy[base + col]:
+                    for wall_rect in self.buckets[base + col]:
+                        if rect.colliderect(wall_rect):
+                            return True
+        return False
+
+    def is_blocked(self, x, y):
+        """ True if the cell under point (x, y) touches a wall. Points off the grid count as blocked. """
+        col = int(x) // self.cell_size
+        row = int(y) // self.cell_size
+        if not (0 <= col < self.cols and 0 <= row < self.rows):
+            return True
+        return self.occupancy[row * self.cols + col] == 1
+
+    def line_clear(self, x0, y0, x1, y1):
+        """
+        True if the segment from (x0, y0) to (x1, y1) crosses no wall cell. Grid DDA: steps cell by
+        cell along the segment, one row or column at a time; the two end cells are not checked. A
+        segment through a cell corner touches both cells beside the corner, so both are checked.
+        """
+        cs = self.cell_size
+        col, row = int(x0) // cs, int(y0) // cs
+        steps = abs(int(x1) // cs - col) + abs(int(y1) // cs - row)
+        dx, dy = x1 - x0, y1 - y0
+        step_col = 1 if dx > 0 else -1
+        step_row = 1 if dy > 0 else -1
+        # Segment fraction at the next column/row boundary, and per whole cell
+        if dx:
+            next_x, delta_x = ((col + (dx > 0)) * cs - x0) / dx, cs / abs(dx)
+        else:
+            next_x = delta_x = math.inf
+        if dy:
+            next_y, delta_y = ((row + (dy > 0)) * cs - y0) / dy, cs / abs(dy)
+        else:
+            next_y = delta_y = math.inf
+        occupancy, cols = self.occupancy, self.cols
+        while steps > 1:
+            if abs(next_x - next_y) < LINE_CORNER_EPSILON: # Through a corner: a row and a column step at once
+                if occupancy[row * cols + col + step_col] or occupancy[(row + step_row) * cols + col]:
+                    return False
+                col += step_col
+                row += step_row
+                next_x += delta_x
+                next_y += delta_y
+                steps -= 2
+                if not steps: # Reached the end cell
+                    return True
+            elif next_x < next_y:
+                col += step_col
+                next_x += delta_x
+                steps -= 1
+            else:
+                row += step_row
+                next_y += delta_y
+                steps -= 1
+            if occupancy[row * cols + col]:
+                return False
+        return True
+
+class WallBuckets(dict):
+    """
+    Cell buckets of a grid built from stored occupancy. A cell's walls are found on its first
+    lookup, among the few walls of its WALL_BLOCK_CELLS block, so loading touches no cells.
+    """
+    def __init__(self, grid):
+        super().__init__()
+        self.grid = grid
+        self.blocks = {} # (block col, block row) -> wall rects touching the block
+        block = grid.cell_size * WALL_BLOCK_CELLS
+        for rect in grid.rects:
+            for row in range(rect.top // block, (rect.bottom - 1) // block + 1):
+                for col in range(rect.left // block, (rect.right - 1) // block + 1):
+                    self.blocks.setdefault((col, row), []).append(rect)
+
+    def __missing__(self, cell):
+        grid = self.grid
+        row, col = divmod(cell, grid.cols)
+        cs = grid.cell_size
+        nearby = self.blocks.get((col // WALL_BLOCK_CELLS, row // WALL_BLOCK_CELLS), [])
+        walls = self[cell] = [nearby[i] for i in pygame.Rect(col * cs, row * cs, cs, cs).collidelistall(nearby)]
+        return walls
+
+# --- Tank Index ---
+# Enemies are bucketed by the cell holding their centre once per tick, so movement, bullet
+# and bombardment checks only look at nearby tanks instead of every enemy on the field.
+TANK_INDEX_CELL_SIZE = 32
+TANK_INDEX_PAD = 24 # Half the largest rotated tank plus slack for tanks that moved since the rebuild
+
+class TankIndex:
+    """ Per-tick broadphase: enemies bucketed by cell, plus the wall rects and players near each cell. """
+    def __init__(self, cell_size=TANK_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.wall_rects = []
+        self.wall_cells = {} # cell -> wall rects a tank centred in that cell could touch
+        self.player_cells = {} # cell -> players a tank centred in that cell could touch
+        self.solid_enemies = True # False lets enemies drive through each other (horde swarms)
+        self.grid = None # Arena WallGrid for line-of-sight checks
+        self.sight = {} # (grid cell, target) -> clear shot from there, this tick
+        self._wall_sprites = None
+
+    def cells_touching(self, rect):
+        """ Cells whose tanks could overlap rect (cell bounds padded by TANK_INDEX_PAD). """
+        cs = self.cell_size
+        return [(col, row)
+                for row in range((rect.top - TANK_INDEX_PAD) // cs, (rect.bottom - 1 + TANK_INDEX_PAD) // cs + 1)
+                for col in range((rect.left - TANK_INDEX_PAD) // cs, (rect.right - 1 + TANK_INDEX_PAD) // cs + 1)]
+
+    def clear(self):
+        """ Forgets every tank, player and wall (a new game starts); the next rebuild() fills it in again. """
+        self.cells = {}
+        self.player_cells = {}
+        self.sight = {}
+        self.grid = None
+        self._wall_sprites = None
+        self.set_walls([])
+
+    def set_walls(self, wall_rects):
+        self.wall_rects = wall_rects
+        self.wall_cells = {}
+        for rect in wall_rects:
+            for key in self.cells_touching(rect):
+                self.wall_cells.setdefault(key, []).append(rect)
+
+    def rebuild(self, walls, enemies, players, solid_enemies=True, grid=None):
+        """ Rebuckets enemies and players for this tick (walls=None keeps the current walls). """
+        self.grid = grid
+        self.sight = {}
+        if walls is not None:
+            wall_sprites = walls.sprites()
+            if wall_sprites != self._wall_sprites: # Walls only change with the arena
+                self._wall_sprites = wall_sprites
+                self.set_walls([wall.rect for wall in wall_sprites])
+        player_cells = self.player_cells = {}
+        for player in players:
+            for key in self.cells_touching(player.rect):
+                player_cells.setdefault(key, []).append(player)
+        self.solid_enemies = solid_enemies
+        cs = self.cell_size
+        cells = self.cells = {}
+        for enemy in enemies:
+            key = (enemy.rect.centerx // cs, enemy.rect.centery // cs)
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [enemy]
+            else:
+                bucket.append(enemy)
+
+    def walls_at(self, x, y):
+        """ Wall rects that a tank (or bullet) centred at (x, y) could touch. """
+        cs = self.cell_size
+        return self.wall_cells.get((int(x) // cs, int(y) // cs), ())
+
+    def walls_in(self, rect):
+        """ Wall rects overlapping rect (which may span several cells, e.g. a bullet's path). """
+        cs = self.cell_size
+        found = []
+        for row in range(rect.top // cs, (rect.bottom - 1) // cs + 1):
+            for col in range(rect.left // cs, (rect.right - 1) // cs + 1):
+                for wall in self.wall_cells.get((col, row), ()):
+                    if wall not in found and rect.colliderect(wall):
+                        found.append(wall)
+        return found
+
+    def blockers_at(self, x, y):
+        """ (wall rects, players) that a tank centred at (x, y) could touch. """
+        cs = self.cell_size
+        key = (int(x) // cs, int(y) // cs)
+        return self.wall_cells.get(key, ()), self.player_cells.get(key, ())
+
+    def line_of_sight(self, x, y, target):
+        """
+        Whether a shot from (x, y) to target (a player, fixed for the tick) crosses no wall.
+        Enemies in the same grid cell aiming at the same player share one raycast per tick.
+        """
+        if self.grid is None:
+            return True
+        cs = self.grid.cell_size
+        key = (int(x) // cs, int(y) // cs, target)
+        clear = self.sight.get(key)
+        if clear is None:
+            clear = self.sight[key] = self.grid.line_clear(x, y, *target)
+        return clear
+
+    def query(self, rect, exclude=None):
+        """ Enemies whose rect overlaps rect (killed ones included until the next rebuild). """
+        cs = self.cell_size
+        cells = self.cells
+        found = []
+        for row in range((rect.top - TANK_INDEX_PAD) // cs, (rect.bottom + TANK_INDEX_PAD) // cs + 1):
+            for col in range((rect.left - TANK_INDEX_PAD) // cs, (rect.right + TANK_INDEX_PAD) // cs + 1):
+                bucket = cells.get((col, row))
+                if bucket:
+                    for enemy in bucket:
+                        if enemy is not exclude and rect.colliderect(enemy.rect):
+                            found.append(enemy)
+        return found
+
+# --- Swept Bullet Collision ---
+# A bullet moves a whole tick at once, so testing only where it lands lets a fast bullet (or a
+# low tick rate) skip straight over thin barriers and small tanks. Instead the bullet's box is
+# swept from where the tick started to where it ended: walls are solid, so a slab test of the
+# box against each wall gives the exact time of impact; tanks are tested with their masks at
+# steps of at most SWEEP_MASK_STEP pixels across the stretch where the boxes overlap. The
+# bullet is moved back to its earliest impact and hits whatever it overlaps there.
+SWEEP_MASK_STEP = BULLET_SIZE / 2
+
+def sweep_box(start, delta, size, target):
+    """ (enter, exit) fractions of the move where a box at topleft start moving by delta overlaps target, or None. """
+    t_enter, t_exit = 0.0, 1.0
+    for origin, move, low, high in ((start[0], delta[0], target.left - size[0], target.right),
+                                    (start[1], delta[1], target.top - size[1], target.bottom)):
+        if move == 0:
+            if not low < origin < high:
+                return None
+            continue
+        t0, t1 = (low - origin) / move, (high - origin) / move
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_enter, t_exit = max(t_enter, t0), min(t_exit, t1)
+        if t_enter >= t_exit:
+            return None
+    return t_enter, t_exit
+
+def sweep_mask(bullet, start, delta, target, t_enter, t_exit):
+    """ Earliest fraction in [t_enter, t_exit] where the bullet's mask touches target's, or None. """
+    steps = max(1, math.ceil(math.hypot(*delta) * (t_exit - t_enter) / SWEEP_MASK_STEP))
+    bullet_mask, target_mask = bullet.mask, target.mask
+    for i in range(steps + 1):
+        t = t_enter + (t_exit - t_enter) * i / steps
+        offset = (round(start[0] + delta[0] * t) - target.rect.x, round(start[1] + delta[1] * t) - target.rect.y)
+        if target_mask.overlap(bullet_mask, offset):
+            return t
+    return None
+
+def sweep_bullet(bullet, walls, targets):
+    """
+    Sweeps the bullet along this tick's move against wall rects and target sprites.
+    Returns None if it hit nothing, else moves it to the earliest impact and returns
+    the targets it overlaps there (empty for a wall).
+    """
+    start, end = bullet.start, bullet.rect.topleft
+    delta = (end[0] - start[0], end[1] - start[1])
+    size = bullet.rect.size
+    first, first_target = None, None
+    for wall in walls:
+        span = sweep_box(start, delta, size, wall)
+        if span and (first is None or span[0] < first):
+            first = span[0]
+    for target in targets:
+        span = sweep_box(start, delta, size, target.rect)
+        if span is None or (first is not None and span[0] >= first):
+            continue
+        t = sweep_mask(bullet, start, delta, target, span[0], span[1] if first is None else min(span[1], first))
+        if t is not None and (first is None or t < first):
+            first, first_target = t, target
+    if first is None:
+        return None
+    bullet.rect.topleft = (round(start[0] + delta[0] * first), round(start[1] + delta[1] * first))
+    if first_target is None:
+        return []
+    return [target for target in targets if pygame.sprite.collide_mask(bullet, target)]
+
+# --- Map Chunks ---
+# The world is split into CHUNK_SIZE squares. Each chunk knows the walls and spawn points
+# inside it, and its background tile (grass with the walls baked in) is only rendered
+# while it is near the view, so drawing and tile memory scale with the screen, not the world.
+class ChunkMap:
+    def __init__(self, arena, chunk_size=CHUNK_SIZE, spawn_buckets=None):
+        self.chunk_size = chunk_size
+        self.cols = -(-arena.width // chunk_size)
+        self.rows = -(-arena.height // chunk_size)
+        self.walls = {} # chunk -> wall rects overlapping it
+        for rect in arena.grid.rects:
+            for key in self.chunks_in(rect):
+                self.walls.setdefault(key, []).append(rect)
+        if spawn_buckets is None: # Level packs store them already bucketed
+            spawn_buckets = (self._bucket(arena.enemy_spawns), self._bucket(arena.powerup_spawns))
+        self.enemy_spawns, self.powerup_spawns = spawn_buckets
+        self.tiles = {} # chunk -> rendered background tile, least recently used first
+        self.tile_scale = 1 # Render scale the cached tiles were drawn at
+
+    def _bucket(self, points):
+        cs = self.chunk_size
+        buckets = {}
+        for point in points:
+            buckets.setdefault((point[0] // cs, point[1] // cs), []).append(point)
+        return buckets
+
+    def chunks_in(self, rect):
+        """ Keys of the chunks overlapping rect, clipped to the world. """
+        cs = self.chunk_size
+        return [(col, row)
+                for row in range(max(0, rect.top // cs), min(self.rows - 1, (rect.bottom - 1) // cs) + 1)
+                for col in range(max(0, rect.left // cs), min(self.cols - 1, (rect.right - 1) // cs) + 1)]
+
+    def points(self, table, rect):
+        """ Spawn points from table ('enemy_spawns' or 'powerup_spawns') in the chunks overlapping rect. """
+        buckets = getattr(self, table)
+        found = []
+        for key in self.chunks_in(rect):
+            found.extend(buckets.get(key, ()))
+        return found
+
+    def tile(self, key, scale=1):
+        """
+        Background tile for a chunk, rendered on first use (at the render scale, so it is never
+        resized per frame) and evicted when the cache is full.
+        """
+        if scale != self.tile_scale:
+            self.tiles.clear()
+            self.tile_scale = scale
+        tile = self.tiles.pop(key, None)
+        if tile is None:
+            if len(self.tiles) >= CHUNK_TILE_CACHE:
+                del self.tiles[next(iter(self.tiles))] # Oldest tile
+            cs = self.chunk_size
+            tile = new_surface([math.ceil(cs * scale), math.ceil(cs * scale)])
+            tile.fill(GRASS_GREEN)
+            for rect in self.walls.get(key, ()):
+                left, top = int((rect.left - key[0] * cs) * scale), int((rect.top - key[1] * cs) * scale)
+                right = math.ceil((rect.right - key[0] * cs) * scale)
+                bottom = math.ceil((rect.bottom - key[1] * cs) * scale)
+                tile.fill(WHITE, (left, top, right - left, bottom - top))
+        self.tiles[key] = tile # (Re)insert as most recently used
+        return tile
+
+# --- Arena Generation ---
+def border_rects(width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """ The four world-edge walls as (x, y, w, h) tuples. """
+    return [
+        (0, 0, width, BORDER_THICKNESS),
+        (0, height - BORDER_THICKNESS, width, BORDER_THICKNESS),
+        (0, 0, BORDER_THICKNESS, height),
+        (width - BORDER_THICKNESS, 0, BORDER_THICKNESS, height),
+    ]
+
+class Arena:
+    """ A generated barrier layout plus its wall grid, precomputed spawn tables and map chunks. """
+    def __init__(self, seed, barriers, enemy_spawns=None, powerup_spawns=None, grid=None,
+                 width=SCREEN_WIDTH, height=SCREEN_HEIGHT, spawn_buckets=None):
+        self.seed = seed
+        self.width = width
+        self.height = height
+        self.barriers = [tuple(b) for b in barriers] # (x, y, w, h), border walls excluded
+        if grid is None:
+            grid = WallGrid(width, height)
+            for rect in border_rects(width, height) + self.barriers:
+                grid.add(rect)
+        self.grid = grid
+        self.enemy_spawns = enemy_spawns if enemy_spawns is not None else build_enemy_spawn_table(grid)
+        self.powerup_spawns = powerup_spawns if powerup_spawns is not None else build_powerup_spawn_table(grid)
+        self.chunks = ChunkMap(self, spawn_buckets=spawn_buckets)
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def enemy_spawns_around(self, view):
+        """ Enemy spawn points just outside view (or on the world edge where view meets it). """
+        if view.contains(pygame.Rect(0, 0, self.width, self.height)):
+            return self.enemy_spawns # The whole world is on screen: spawn on its edges as always
+        inner = view.inflate(-2 * (BORDER_THICKNESS + ENEMY_SPAWN_SPACING), -2 * (BORDER_THICKNESS + ENEMY_SPAWN_SPACING))
+        return [p for p in self.chunks.points('enemy_spawns', view.inflate(SPAWN_RING * 2, SPAWN_RING * 2))
+                if not inner.collidepoint(p)]
+
+    def powerup_spawns_in(self, view):
+        """ Power-up spawn points inside view. """
+        if view.contains(pygame.Rect(0, 0, self.width, self.height)):
+            return self.powerup_spawns
+        return [p for p in self.chunks.points('powerup_spawns', view) if view.collidepoint(p)]
+
+def build_enemy_spawn_table(grid):
+    """
+    Edge spawn points where the largest enemy type fits without touching a wall, plus an
+    interior lattice in worlds larger than the screen (enemies arrive from just off-screen).
+    """
+    max_enemy_size = max(d['size'] for d in ENEMY_TYPES.values())
+    buffer = int(max_enemy_size * 0.7) # Same inset as spawn_enemy_at_edge()
+    check_size = int(max_enemy_size * 0.8) # Matches the collide_rect_ratio(0.8) check
+    check_rect = pygame.Rect(0, 0, check_size, check_size)
+    low = BORDER_THICKNESS + buffer
+    points = []
+    for x in range(low, grid.width - low + 1, GRID_CELL_SIZE):
+        points.append((x, low))
+        points.append((x, grid.height - low))
+    for y in range(low, grid.height - low + 1, GRID_CELL_SIZE):
+        points.append((low, y))
+        points.append((grid.width - low, y))
+    if grid.width > SCREEN_WIDTH or grid.height > SCREEN_HEIGHT:
+        for y in range(low + ENEMY_SPAWN_SPACING, grid.height - low - ENEMY_SPAWN_SPACING + 1, ENEMY_SPAWN_SPACING):
+            for x in range(low + ENEMY_SPAWN_SPACING, grid.width - low - ENEMY_SPAWN_SPACING + 1, ENEMY_SPAWN_SPACING):
+                points.append((x, y))
+    table = []
+    for point in points:
+        check_rect.center = point
+        if not grid.collides(check_rect):
+            table.append(point)
+    return table
+
+def build_powerup_spawn_table(grid):
+    """ Interior points where a power-up fits without touching a wall. """
+    check_rect = pygame.Rect(0, 0, POWERUP_SIZE, POWERUP_SIZE)
+    step = POWERUP_SIZE if grid.width <= SCREEN_WIDTH and grid.height <= SCREEN_HEIGHT else POWERUP_SIZE * 3
+    table = []
+    for y in range(BORDER_THICKNESS + POWERUP_SIZE, grid.height - BORDER_THICKNESS - POWERUP_SIZE + 1, step):
+        for x in range(BORDER_THICKNESS + POWERUP_SIZE, grid.width - BORDER_THICKNESS - POWERUP_SIZE + 1, step):
+            check_rect.center = (x, y)
+            if not grid.collides(check_rect):
+                table.append((x, y))
+    return table
+
+def _nav_span(rect, cols, rows, cell_size):
+    """ The (col0, col1, row0, row1) nav cells touched by rect, clipped to the grid. """
+    return (max(0, rect.left // cell_size), min(cols - 1, (rect.right - 1) // cell_size),
+            max(0, rect.top // cell_size), min(rows - 1, (rect.bottom - 1) // cell_size))
+
+def _free_runs_around(cells, cols, rows, span):
+    """
+    Counts the separate runs of free cells on the one-cell ring around span. A new blocked
+    region whose ring has at most one free run cannot split the free space, so the flood
+    fill can be skipped.
+    """
+    ring = _ring_cells(cols, rows, span)
+    if ring is None:
+        return 2 # Touches the grid edge; let the flood fill decide
+    states = [cells[i] for i in ring]
+    runs = sum(1 for i in range(len(states)) if not states[i] and states[i - 1])
+    if runs == 0 and not any(states):
+        return 1 # Free all the way round
+    return runs
+
+def _ring_cells(cols, rows, span):
+    """ Cell indexes of the one-cell ring around span, in order, or None at the grid edge. """
+    col0, col1, row0, row1 = span
+    col0, col1, row0, row1 = col0 - 1, col1 + 1, row0 - 1, row1 + 1
+    if col0 < 0 or row0 < 0 or col1 >= cols or row1 >= rows:
+        return None
+    return ([row0 * cols + c for c in range(col0, col1 + 1)] +
+            [r * cols + col1 for r in range(row0 + 1, row1 + 1)] +
+            [row1 * cols + c for c in range(col1 - 1, col0 - 1, -1)] +
+            [r * cols + col0 for r in range(row1 - 1, row0, -1)])
+
+def _ring_connected_locally(cells, cols, rows, span, margin=LOCAL_CONNECTIVITY_MARGIN):
+    """
+    True if the free cells on the ring around a newly blocked span still reach each other
+    within margin cells of it. Any path through span can then be rerouted around it, so
+    the free space stays connected without flood filling the whole (possibly huge) world.
+    """
+    ring = _ring_cells(cols, rows, span)
+    if ring is None:
+        return False
+    targets = {i for i in ring if not cells[i]}
+    if not targets:
+        return True
+    col0, col1, row0, row1 = span
+    col0, col1 = max(0, col0 - margin), min(cols - 1, col1 + margin)
+    row0, row1 = max(0, row0 - margin), min(rows - 1, row1 + margin)
+    start = next(iter(targets))
+    seen = {start}
+    queue = deque([start])
+    remaining = len(targets) - 1
+    while queue and remaining:
+        cell = queue.popleft()
+        row, col = divmod(cell, cols)
+        for nxt, ok in ((cell - cols, row > row0), (cell + cols, row < row1),
+                        (cell - 1, col > col0), (cell + 1, col < col1)):
+            if ok and nxt not in seen and not cells[nxt]:
+                seen.add(nxt)
+                if nxt in targets:
+                    remaining -= 1
+                queue.append(nxt)
+    return remaining == 0
+
+def _mark_cells(cells, cols, span):
+    col0, col1, row0, row1 = span
+    for row in range(row0, row1 + 1):
+        base = row * cols
+        cells[base + col0:base + col1 + 1] = b'\x01' * (col1 - col0 + 1)
+
+def _reachable_count(cells, cols, rows, start):
+    """ Flood fills free nav cells from start and returns how many were reached. """
+    if cells[start]: return 0
+    seen = bytearray(cells) # Blocked cells count as already visited
+    seen[start] = 1
+    queue = deque([start])
+    reached = 1
+    total = len(seen)
+    while queue:
+        cell = queue.popleft()
+        col = cell % cols
+        for nxt in (cell - cols, cell + cols,
+                    cell - 1 if col > 0 else -1,
+                    cell + 1 if col < cols - 1 else -1):
+            if 0 <= nxt < total and not seen[nxt]:
+                seen[nxt] = 1
+                reached += 1
+                queue.append(nxt)
+    return reached
+
+def generate_arena(seed=None, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """
+    Places BARRIER_COUNT random barriers per screen of world area using the wall grid as a
+    broadphase, and rejects any barrier that would cut off part of the free space a
+    player-sized tank can reach.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    rng = random.Random(seed)
+    grid = WallGrid(width, height)
+    for rect in border_rects(width, height):
+        grid.add(rect)
+    barrier_count = round(BARRIER_COUNT * width * height / (SCREEN_WIDTH * SCREEN_HEIGHT))
+
+    barrier_padding = int(PLAYER_SIZE * BARRIER_PADDING_FACTOR)
+    start_clearance = int(PLAYER_SIZE * PLAYER_START_CLEARANCE_FACTOR)
+    start_rect = pygame.Rect(0, 0, PLAYER_SIZE, PLAYER_SIZE)
+    start_rect.center = (width // 2, height // 2)
+    player_start_area = start_rect.inflate(start_clearance * 2, start_clearance * 2)
+    spacing = PLAYER_SIZE // 2
+
+    # Nav cells a tank centre cannot occupy: walls inflated by half a tank
+    nav = bytearray(grid.cols * grid.rows)
+    for rect in grid.rects:
+        _mark_cells(nav, grid.cols, _nav_span(rect.inflate(PLAYER_SIZE, PLAYER_SIZE), grid.cols, grid.rows, grid.cell_size))
+    start_cell = (start_rect.centery // grid.cell_size) * grid.cols + start_rect.centerx // grid.cell_size
+
+    barriers = []
+    for i in range(barrier_count):
+        for attempt in range(BARRIER_PLACE_ATTEMPTS):
+            w = rng.randint(MIN_BARRIER_WIDTH, MAX_BARRIER_WIDTH)
+            h = rng.randint(MIN_BARRIER_HEIGHT, MAX_BARRIER_HEIGHT)
+            x = rng.randint(BORDER_THICKNESS + barrier_padding, width - BORDER_THICKNESS - barrier_padding - w)
+            y = rng.randint(BORDER_THICKNESS + barrier_padding, height - BORDER_THICKNESS - barrier_padding - h)
+            temp_rect = pygame.Rect(x, y, w, h)
+
+            if temp_rect.colliderect(player_start_area): continue
+            if grid.collides(temp_rect.inflate(spacing, spacing)): continue
+
+            # Connectivity: only flood fill when the barrier could actually split the free space
+            span = _nav_span(temp_rect.inflate(PLAYER_SIZE, PLAYER_SIZE), grid.cols, grid.rows, grid.cell_size)
+            check_needed = _free_runs_around(nav, grid.cols, grid.rows, span) > 1
+            trial = bytearray(nav)
+            _mark_cells(trial, grid.cols, span)
+            if check_needed and not _ring_connected_locally(trial, grid.cols, grid.rows, span) and \
+                    _reachable_count(trial, grid.cols, grid.rows, start_cell) != trial.count(0):
+                continue
+            nav = trial
+            grid.add(temp_rect)
+            barriers.append((x, y, w, h))
+            break
+        else:
+            event_log.emit('barrier_failed', 'warning', barrier=i + 1, attempts=BARRIER_PLACE_ATTEMPTS)
+
+    return Arena(seed, barriers, width=width, height=height)
+
+# --- Level Pack Format ---
+# A pack holds everything an Arena is made of, so loading one decodes no more than the barrier
+# list and spawn tables: the wall grid takes the stored occupancy as is and finds a cell's walls
+# on first use, and the spawn points are also stored sorted by chunk, each chunk decoded when
+# the spawner first looks at it. Coordinates are int16, so worlds are at most 32767 px a side.
+# Header:  magic, version, cell size, chunk size, world width, world height, arena count
+# Index:   one entry per arena -> record offset, seed, barrier / enemy spawn / powerup spawn counts
+# Record:  barriers (x, y, w, h int16), occupancy grid (1 byte per cell), enemy spawns, powerup
+#          spawns (x, y int16), both again sorted by chunk, then each one's chunk ends (uint32 per chunk)
+# Each spawn table is stored twice on purpose. The flat copy keeps the generator's order, which
+# random.choice() over Arena.enemy_spawns / powerup_spawns depends on: save states and replays
+# rebuild their arena from its barriers (Arena() recomputes the tables in that order), so a game
+# on a packed arena only restores and replays exactly if the packed tables pick the same points.
+# The chunk-sorted copy is what the spawner reads near the view. Rebuilding the flat order on
+# load would mean decoding every chunk up front, which the lazy chunks avoid.
+LEVEL_PACK_HEADER = struct.Struct('<4sHHHHHI')
+LEVEL_PACK_ENTRY = struct.Struct('<IIHHH')
+
+def check_level_pack_size(width, height):
+    if not 0 < width <= LEVEL_PACK_MAX_COORD or not 0 < height <= LEVEL_PACK_MAX_COORD:
+        raise ValueError(f"Level packs hold worlds up to {LEVEL_PACK_MAX_COORD}x{LEVEL_PACK_MAX_COORD}, not {width}x{height}")
+
+def pack_points(points):
+    return struct.pack(f'<{len(points) * 2}h', *[v for p in points for v in p])
+
+def pack_chunk_points(points, width, height, chunk_size=CHUNK_SIZE):
+    """ points sorted by chunk (row-major, stable), and the uint32 end of each chunk's run. """
+    cols, rows = -(-width // chunk_size), -(-height // chunk_size)
+    key = lambda p: (p[1] // chunk_size) * cols + p[0] // chunk_size
+    ordered = sorted(points, key=key)
+    ends = [0] * (cols * rows)
+    for point in ordered:
+        ends[key(point)] += 1
+    for i in range(1, len(ends)):
+        ends[i] += ends[i - 1]
+    return pack_points(ordered), struct.pack(f'<{len(ends)}I', *ends)
+
+class PackedChunkPoints:
+    """ Spawn points by chunk straight from a level pack record; a chunk's are decoded on first lookup. """
+    def __init__(self, data, ends, cols):
+        self.data = data # int16 x, y pairs sorted by chunk
+        self.ends = ends # End of each chunk's run in data, row-major
+        self.cols = cols
+        self.decoded = {}
+
+    def get(self, key, default=()):
+        points = self.decoded.get(key)
+        if points is None:
+            i = key[1] * self.cols + key[0]
+            start, end = self.ends[i - 1] if i else 0, self.ends[i]
+            flat = struct.unpack_from(f'<{(end - start) * 2}h', self.data, start * 4)
+            points = self.decoded[key] = list(zip(flat[0::2], flat[1::2]))
+        return points or default
+
+def write_level_pack(path, arenas):
+    """ Writes arenas (all of one world size) to a binary level pack file. """
+    width, height = arenas[0].size if arenas else (SCREEN_WIDTH, SCREEN_HEIGHT)
+    check_level_pack_size(width, height)
+    offset = LEVEL_PACK_HEADER.size + LEVEL_PACK_ENTRY.size * len(arenas)
+    index = []
+    records = []
+    for arena in arenas:
+        if arena.size != (width, height):
+            raise ValueError(f"All arenas in a level pack must be {width}x{height}, not {arena.width}x{arena.height}")
+        enemy_points, enemy_ends = pack_chunk_points(arena.enemy_spawns, width, height)
+        powerup_points, powerup_ends = pack_chunk_points(arena.powerup_spawns, width, height)
+        record = b''.join([
+            struct.pack(f'<{len(arena.barriers) * 4}h', *[v for b in arena.barriers for v in b]),
+            bytes(arena.grid.occupancy),
+            pack_points(arena.enemy_spawns), # Generation order, for random.choice() (see the format notes)
+            pack_points(arena.powerup_spawns),
+            enemy_points, powerup_points, enemy_ends, powerup_ends,
+        ])
+        index.append(LEVEL_PACK_ENTRY.pack(offset, arena.seed, len(arena.barriers),
+                                           len(arena.enemy_spawns), len(arena.powerup_spawns)))
+        records.append(record)
+        offset += len(record)
+    with open(path, 'wb') as f:
+        f.write(LEVEL_PACK_HEADER.pack(LEVEL_PACK_MAGIC, LEVEL_PACK_VERSION, GRID_CELL_SIZE, CHUNK_SIZE,
+                                       width, height, len(arenas)))
+        f.writelines(index)
+        f.writelines(records)
+
+class LevelPack:
+    """ Memory-mapped, read-only view of a level pack; arenas are decoded on demand. """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, cell_size, chunk_size, width, height, count = LEVEL_PACK_HEADER.unpack_from(self._map, 0)
+        if magic != LEVEL_PACK_MAGIC or version != LEVEL_PACK_VERSION:
+            raise ValueError(f"{path} is not a version {LEVEL_PACK_VERSION} level pack")
+        if cell_size != GRID_CELL_SIZE or chunk_size != CHUNK_SIZE:
+            raise ValueError(f"{path} was built for a different grid cell or chunk size")
+        self.width = width # World size of every arena in the pack
+        self.height = height
+        self.count = count
+        self.grid_size = -(-width // cell_size) * -(-height // cell_size)
+        self.chunk_cols = -(-width // chunk_size)
+        self.chunk_count = self.chunk_cols * -(-height // chunk_size)
+
+    def __len__(self):
+        return self.count
+
+    def load(self, i):
+        """ Builds arena i straight from the mapped record: no grid cell, wall bucket or spawn point is recomputed. """
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset, seed, n_barriers, n_enemy, n_powerup = LEVEL_PACK_ENTRY.unpack_from(
+            self._map, LEVEL_PACK_HEADER.size + LEVEL_PACK_ENTRY.size * i)
+        flat = struct.unpack_from(f'<{n_barriers * 4}h', self._map, offset)
+        barriers = [flat[j:j + 4] for j in range(0, len(flat), 4)]
+        offset += n_barriers * 8
+        occupancy = self._map[offset:offset + self.grid_size]
+        offset += self.grid_size
+        flat = struct.unpack_from(f'<{n_enemy * 2}h', self._map, offset)
+        enemy_spawns = list(zip(flat[0::2], flat[1::2]))
+        offset += n_enemy * 4
+        flat = struct.unpack_from(f'<{n_powerup * 2}h', self._map, offset)
+        powerup_spawns = list(zip(flat[0::2], flat[1::2]))
+        offset += n_powerup * 4
+        enemy_data = self._map[offset:offset + n_enemy * 4] # Copied, so the arena outlives close()
+        offset += n_enemy * 4
+        powerup_data = self._map[offset:offset + n_powerup * 4]
+        offset += n_powerup * 4
+        enemy_ends = struct.unpack_from(f'<{self.chunk_count}I', self._map, offset)
+        powerup_ends = struct.unpack_from(f'<{self.chunk_count}I', self._map, offset + self.chunk_count * 4)
+        grid = WallGrid.from_occupancy(border_rects(self.width, self.height) + barriers, occupancy, self.width, self.height)
+        spawn_buckets = (PackedChunkPoints(enemy_data, enemy_ends, self.chunk_cols),
+                         PackedChunkPoints(powerup_data, powerup_ends, self.chunk_cols))
+        return Arena(seed, barriers, enemy_spawns, powerup_spawns, grid, self.width, self.height, spawn_buckets)
+
+    def random_arena(self):
+        return self.load(random.randrange(self.count))
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+def build_level_pack(path, count, seed=None, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """ Generates count arenas (seeded sequentially if seed is given) and writes them to path. """
+    check_level_pack_size(width, height)
+    rng = random.Random(seed)
+    arenas = [generate_arena(rng.randrange(2**32), width, height) for _ in range(count)]
+    write_level_pack(path, arenas)
+    print(f"Wrote {count} arenas to {path}")
+
+# --- Game State ---
+class GameState:
+    """ Everything the gameplay loop reads and writes. Created once and reset by setup_game(). """
+    def __init__(self):
+        # --- Sprite Groups ---
+        self.all_sprites = pygame.sprite.Group()
+        self.players = pygame.sprite.GroupSingle()
+        self.enemies = pygame.sprite.Group()
+        self.player_bullets = pygame.sprite.Group()
+        self.enemy_bullets = pygame.sprite.Group()
+        self.walls = pygame.sprite.Group()
+        self.powerups = pygame.sprite.Group()
+        self.particles = pygame.sprite.Group()
+        self.active_bombardment_zones = []
+        self.danger = DangerMap() # Rasterised active_bombardment_zones
+        self.arena = None
+        self.player = None
+        self.horde = None
+        self.index = TankIndex()
+        self.tick = 0
+        self.current_time = 0
+
+    def lead_player(self):
+        """ The player that spawns and bombardments keep clear of: the first one still alive. """
+        for player in self.players:
+            return player
+        return None
+
+    def advance_clock(self):
+        """ Steps the simulation clock by one tick and returns the new game time in ms. """
+        self.tick += 1
+        self.current_time = self.tick * 1000 // TICK_RATE
+        return self.current_time
+
+def place_player(state, player):
+    """ Adds player to the game, nudged clear of any wall it was placed on. """
+    # --- Add Player to Groups (Check spawn safety) ---
+    player_collides_spawn = pygame.sprite.spritecollide(player, state.walls, False)
+    if player_collides_spawn:
+         event_log.emit('player_spawn_blocked', 'warning')
+         start = player.rect.center
+         while pygame.sprite.spritecollide(player, state.walls, False):
+             player.rect.x += 5
+             if player.rect.right > world.width - BORDER_THICKNESS:
+                  player.rect.center = start # Reset
+                  event_log.emit('player_spawn_failed', 'warning')
+                  break
+    state.players.add(player)
+    state.all_sprites.add(player) # Add player AFTER barriers
+
 # --- NEW: Game Setup Function ---
-def setup_game():
-    print("Setting up new game...") # Debug message
+def setup_game(arena=None, state=None, horde=None):
+    """
+    Resets state (or a new GameState) for a fresh game. Sprite groups are emptied rather than
+    rebuilt, and the wall sprites are kept when the same arena is passed in again.
+    """
+    if state is None:
+        state = GameState()
+
     # --- Sprite Groups ---
-    all_sprites = pygame.sprite.Group()
-    players = pygame.sprite.GroupSingle()
-    enemies = pygame.sprite.Group()
-    player_bullets = pygame.sprite.Group()
-    enemy_bullets = pygame.sprite.Group()
-    walls = pygame.sprite.Group()
-    powerups = pygame.sprite.Group()
-    particles = pygame.sprite.Group()
+    for group in (state.all_sprites, state.players, state.enemies, state.player_bullets,
+                  state.enemy_bullets, state.powerups, state.particles):
+        group.empty()
+    state.index.clear() # Still holds the last tick's tanks, which would otherwise outlive the game
 
     # --- Game Variables ---
-    score = 0
-    game_over = False
-    win = False
+    # Game time is a fixed-step simulation clock, so saved snapshots stay valid when restored later
+    state.tick = 0
+    state.current_time = 0
+    state.score = 0
+    state.game_over = False
+    state.win = False
     # Timer for the next star spawn
-    next_powerup_spawn_time = pygame.time.get_ticks() + 8000 # Spawn first one after 8 seconds
+    state.next_powerup_spawn_time = state.current_time + 8000 # Spawn first one after 8 seconds
 
     # # --- NEW: Safe Zone & Timer Setup ---
     # game_start_time = pygame.time.get_ticks()
@@ -709,73 +2840,37 @@ def setup_game():
     # # --- End Safe Zone Setup ---
 
     # --- ADD NEW BOMBARDMENT VARS ---
-    next_bombardment_time = pygame.time.get_ticks() + NEXT_BOMBARDMENT_DELAY
-    active_bombardment_zones = [] # List to hold active zone objects
+    state.next_bombardment_time = state.current_time + NEXT_BOMBARDMENT_DELAY
+    state.active_bombardment_zones.clear() # List to hold active zone objects
+    state.danger.clear()
 
     # --- NEW: Wave System Variables ---
-    wave_number = 0                       # Start at wave 0, first wave is 1
-    enemies_this_wave = 0                 # How many enemies total for the current wave
-    enemies_spawned_this_wave = 0         # How many spawned *so far* in current wave
-    next_wave_time = pygame.time.get_ticks() + WAVE_START_DELAY # Time for the *first* wave
-    next_enemy_spawn_time = 0             # Timer for individual spawns within a wave
-    waiting_for_next_wave = True          # Flag to indicate if we are between waves
+    state.wave_number = 0                       # Start at wave 0, first wave is 1
+    state.enemies_this_wave = 0                 # How many enemies total for the current wave
+    state.enemies_spawned_this_wave = 0         # How many spawned *so far* in current wave
+    state.next_wave_time = state.current_time + WAVE_START_DELAY # Time for the *first* wave
+    state.next_enemy_spawn_time = 0             # Timer for individual spawns within a wave
+    state.waiting_for_next_wave = True          # Flag to indicate if we are between waves
+    state.horde = horde                         # HordeConfig for endless horde waves, None for MAX_WAVES
     # --- End Wave Variables ---
 
-    # --- Create Boundary Walls ---
-    wall_list = [
-        Wall(0, 0, SCREEN_WIDTH, BORDER_THICKNESS),
-        Wall(0, SCREEN_HEIGHT - BORDER_THICKNESS, SCREEN_WIDTH, BORDER_THICKNESS),
-        Wall(0, 0, BORDER_THICKNESS, SCREEN_HEIGHT),
-        Wall(SCREEN_WIDTH - BORDER_THICKNESS, 0, BORDER_THICKNESS, SCREEN_HEIGHT)
-    ]
-    for wall in wall_list:
-        all_sprites.add(wall)
-        walls.add(wall)
+    # --- Arena (barrier layout, wall grid and spawn tables) ---
+    if arena is None:
+        arena = generate_arena()
+
+    # --- Create Boundary Walls and Barriers --- (Kept as-is when retrying the same arena)
+    world.size = arena.size
+    if arena is not state.arena:
+        state.walls.empty()
+        for rect in border_rects(arena.width, arena.height) + arena.barriers:
+            state.walls.add(Wall(*rect))
+        state.arena = arena
+    state.all_sprites.add(state.walls.sprites())
 
     # --- Create Player ---
     player = Player()
-    # Calculate padding based on player size *after* creating player
-    BARRIER_PADDING = player.size * BARRIER_PADDING_FACTOR
-    PLAYER_START_CLEARANCE = player.size * PLAYER_START_CLEARANCE_FACTOR
-    player_start_area = player.rect.inflate(PLAYER_START_CLEARANCE * 2, PLAYER_START_CLEARANCE * 2)
-
-    # --- Generate Random Barriers ---
-    for i in range(BARRIER_COUNT):
-        attempts = 0
-        while attempts < 100:
-            attempts += 1
-            width = random.randint(MIN_BARRIER_WIDTH, MAX_BARRIER_WIDTH)
-            height = random.randint(MIN_BARRIER_HEIGHT, MAX_BARRIER_HEIGHT)
-            x = random.randint(BORDER_THICKNESS + BARRIER_PADDING, SCREEN_WIDTH - BORDER_THICKNESS - BARRIER_PADDING - width)
-            y = random.randint(BORDER_THICKNESS + BARRIER_PADDING, SCREEN_HEIGHT - BORDER_THICKNESS - BARRIER_PADDING - height)
-            temp_rect = pygame.Rect(x, y, width, height)
-
-            if temp_rect.colliderect(player_start_area): continue
-            collides_existing = False
-            for existing_wall in walls:
-                if temp_rect.colliderect(existing_wall.rect.inflate(player.size // 2, player.size // 2)):
-                    collides_existing = True
-                    break
-            if collides_existing: continue
-
-            barrier = Wall(x, y, width, height)
-            all_sprites.add(barrier)
-            walls.add(barrier)
-            break
-        if attempts >= 100: print(f"Warning: Could not place barrier {i+1} after 100 attempts.")
-
-    # --- Add Player to Groups (Check spawn safety) ---
-    player_collides_spawn = pygame.sprite.spritecollide(player, walls, False)
-    if player_collides_spawn:
-         print("WARNING: Player spawned inside a barrier! Repositioning slightly.")
-         while pygame.sprite.spritecollide(player, walls, False):
-             player.rect.x += 5
-             if player.rect.right > SCREEN_WIDTH - BORDER_THICKNESS:
-                  player.rect.center = player.start_pos # Reset
-                  print("ERROR: Could not find clear spawn for player.")
-                  break
-    players.add(player)
-    all_sprites.add(player) # Add player AFTER barriers
+    state.player = player
+    place_player(state, player)
 
     # # --- Create Enemies ---
     # for _ in range(ENEMY_COUNT):
@@ -801,19 +2896,165 @@ def setup_game():
             # next_powerup_spawn_time, # Keep existing ones
             # game_start_time, circle_center_x, circle_center_y, # Add new ones
             # circle_current_radius, circle_start_radius) # Add new ones
-            
-    # Return bombardment variables instead of old circle ones
-    # Return the new wave variables
-    return (all_sprites, players, enemies, player_bullets, enemy_bullets,
-            walls, powerups, particles, player, score, game_over, win,
-            next_powerup_spawn_time,
-            next_bombardment_time, active_bombardment_zones,
-            # --- Add new wave vars to return ---
-            wave_number, enemies_this_wave, enemies_spawned_this_wave,
-            next_wave_time, next_enemy_spawn_time, waiting_for_next_wave)
+
+    event_log.emit('game_setup', seed=arena.seed)
+    return state
+
+# --- Save States (Snapshots & Rewind) ---
+# A snapshot is plain tuples of every entity's simulation fields plus the scalar game
+# variables and the RNG state. Taking one copies no surfaces; each sprite class turns itself
+# into a tuple (snapshot()) and back (from_snapshot()), rebuilding from cached images and
+# bypassing __init__ so the RNG is not disturbed.
+SNAPSHOT_VERSION = 1
+
+class Snapshot:
+    __slots__ = ('tick', 'current_time', 'variables', 'arena', 'player', 'enemies',
+                 'player_bullets', 'enemy_bullets', 'particles', 'powerups', 'zones', 'rng_state')
+
+def take_snapshot(state):
+    """ Captures the complete simulation state of a game. """
+    snap = Snapshot()
+    snap.tick = state.tick
+    snap.current_time = state.current_time
+    snap.variables = tuple(getattr(state, name) for name in SNAPSHOT_VARIABLES)
+    snap.arena = state.arena
+    snap.player = state.player.snapshot()
+    snap.enemies = tuple(e.snapshot() for e in state.enemies)
+    snap.player_bullets = tuple(b.snapshot() for b in state.player_bullets)
+    snap.enemy_bullets = tuple(b.snapshot() for b in state.enemy_bullets)
+    snap.particles = tuple(p.snapshot() for p in state.particles)
+    snap.powerups = tuple((p.type, p.rect.center, p.spawn_time) for p in state.powerups)
+    snap.zones = tuple((z.center.x, z.center.y, z.spawn_time) for z in state.active_bombardment_zones)
+    snap.rng_state = random.getstate()
+    return snap
+
+# Scalar GameState fields captured by take_snapshot()
+SNAPSHOT_VARIABLES = ('score', 'game_over', 'win', 'next_powerup_spawn_time', 'next_bombardment_time',
+                      'wave_number', 'enemies_this_wave', 'enemies_spawned_this_wave',
+                      'next_wave_time', 'next_enemy_spawn_time', 'waiting_for_next_wave')
+
+POWERUP_CLASSES = {'ammo': AmmoRefill, 'health': HealthRestore}
+
+def _add_restored(sprite, group, all_sprites):
+    # Sprite.add() type-checks every argument; restored sprites are known-good, so link directly
+    group.add_internal(sprite)
+    sprite.add_internal(group)
+    all_sprites.add_internal(sprite)
+    sprite.add_internal(all_sprites)
+
+def restore_snapshot(state, snap):
+    """ Puts state back exactly as it was when snap was taken (state can be fresh or in use). """
+    # --- Arena & walls (only rebuilt if the snapshot is from a different arena) ---
+    world.size = snap.arena.size
+    if snap.arena is not state.arena:
+        state.walls.empty()
+        for rect in border_rects(snap.arena.width, snap.arena.height) + snap.arena.barriers:
+            state.walls.add(Wall(*rect))
+        state.arena = snap.arena
+    for group in (state.all_sprites, state.players, state.enemies, state.player_bullets,
+                  state.enemy_bullets, state.powerups, state.particles):
+        group.empty()
+    for wall in state.walls:
+        state.all_sprites.add_internal(wall)
+        wall.add_internal(state.all_sprites)
+
+    state.tick = snap.tick
+    state.current_time = snap.current_time
+    for name, value in zip(SNAPSHOT_VARIABLES, snap.variables):
+        setattr(state, name, value)
+
+    # --- Player (restored in place so existing references stay valid) ---
+    if state.player is None:
+        state.player = Player()
+    if state.player.restore(snap.player):
+        state.player.add(state.players, state.all_sprites)
+
+    # --- Enemies, Bullets, Particles, Power-ups ---
+    for data in snap.enemies:
+        _add_restored(Enemy.from_snapshot(data, state.walls), state.enemies, state.all_sprites)
+    for data in snap.player_bullets:
+        _add_restored(Bullet.from_snapshot(data), state.player_bullets, state.all_sprites)
+    for data in snap.enemy_bullets:
+        _add_restored(Bullet.from_snapshot(data), state.enemy_bullets, state.all_sprites)
+    for data in snap.particles:
+        _add_restored(Particle.from_snapshot(data), state.particles, state.all_sprites)
+    for powerup_type, center, spawn_time in snap.powerups:
+        POWERUP_CLASSES[powerup_type](center[0], center[1], spawn_time).add(state.powerups, state.all_sprites)
+
+    # --- Bombardment Zones ---
+    state.active_bombardment_zones.clear()
+    for x, y, spawn_time in snap.zones:
+        state.active_bombardment_zones.append(BombardmentZone(x, y, spawn_time))
+    state.danger.rasterize(state.active_bombardment_zones)
+
+    if snap.rng_state is not None: # Replay keyframes reseed instead
+        random.setstate(snap.rng_state)
+
+def fork_game(snap):
+    """ Returns a new, independent GameState continuing from snap (e.g. for batch simulations). """
+    state = GameState()
+    restore_snapshot(state, snap)
+    return state
+
+def snapshot_to_bytes(snap):
+    """ Compact serialized form: the arena is stored by seed and barrier list, not by object. """
+    fields = [getattr(snap, name) for name in Snapshot.__slots__]
+    fields[Snapshot.__slots__.index('arena')] = (snap.arena.seed, snap.arena.barriers, snap.arena.width, snap.arena.height)
+    return zlib.compress(pickle.dumps((SNAPSHOT_VERSION, fields), pickle.HIGHEST_PROTOCOL), 1)
+
+def snapshot_from_bytes(data, arena=None):
+    """ Inverse of snapshot_to_bytes(). Pass the current arena to reuse it when it matches. """
+    version, fields = pickle.loads(zlib.decompress(data))
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+    snap = Snapshot()
+    for name, value in zip(Snapshot.__slots__, fields):
+        setattr(snap, name, value)
+    seed, barriers, *size = snap.arena # Saves from before large worlds have no size
+    size = tuple(size) or (SCREEN_WIDTH, SCREEN_HEIGHT)
+    if arena is not None and arena.seed == seed and arena.barriers == barriers and arena.size == size:
+        snap.arena = arena
+    else:
+        snap.arena = Arena(seed, barriers, width=size[0], height=size[1])
+    return snap
+
+def save_snapshot(path, snap):
+    """ Writes a snapshot atomically, so a crash mid-write never leaves a broken save. """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(snapshot_to_bytes(snap))
+    os.replace(tmp_path, path)
+
+def load_snapshot(path):
+    with open(path, 'rb') as f:
+        return snapshot_from_bytes(f.read())
+
+class SnapshotRing:
+    """ Bounded ring of snapshots taken every `interval` ticks, used for rewinding. """
+    def __init__(self, capacity=SNAPSHOT_RING_SIZE, interval=SNAPSHOT_INTERVAL):
+        self.interval = interval
+        self.snapshots = deque(maxlen=capacity)
+
+    def capture(self, state):
+        """ Takes a snapshot if this tick is on the capture interval. """
+        if state.tick % self.interval == 0:
+            self.snapshots.append(take_snapshot(state))
+
+    def rewind(self, state, ticks):
+        """ Restores the newest snapshot at least `ticks` old; returns False if there is none. """
+        target = state.tick - ticks
+        while len(self.snapshots) > 1 and self.snapshots[-1].tick > target:
+            self.snapshots.pop()
+        if not self.snapshots:
+            return False
+        restore_snapshot(state, self.snapshots[-1])
+        return True
+
+    def clear(self):
+        self.snapshots.clear()
 
 # --- Helper function to spawn enemy at edge ---
-def spawn_enemy_at_edge(all_sprites_group, enemies_group, walls_group, player_sprite):
+def spawn_enemy_at_edge(current_time, all_sprites_group, enemies_group, walls_group, player_sprite, spawn_points=None):
     spawn_attempts = 0
     max_attempts = 100
     min_dist_from_player = PLAYER_SIZE * 4
@@ -829,33 +3070,37 @@ def spawn_enemy_at_edge(all_sprites_group, enemies_group, walls_group, player_sp
         # ---
 
         # Ensure buffer doesn't make range invalid if screen is small
-        # (BORDER_THICKNESS + buffer) must be less than (SCREEN_WIDTH/HEIGHT - BORDER_THICKNESS - buffer)
-        if (BORDER_THICKNESS + buffer) >= (SCREEN_WIDTH - BORDER_THICKNESS - buffer):
-            print("Warning: Buffer too large for screen width, adjusting.")
-            buffer = int((SCREEN_WIDTH / 2) - BORDER_THICKNESS - 1)
-        if (BORDER_THICKNESS + buffer) >= (SCREEN_HEIGHT - BORDER_THICKNESS - buffer):
-             print("Warning: Buffer too large for screen height, adjusting.")
-             buffer = int((SCREEN_HEIGHT / 2) - BORDER_THICKNESS - 1)
+        # (BORDER_THICKNESS + buffer) must be less than (world width/height - BORDER_THICKNESS - buffer)
+        if (BORDER_THICKNESS + buffer) >= (world.width - BORDER_THICKNESS - buffer):
+            event_log.emit('spawn_buffer_adjusted', 'warning', axis='x')
+            buffer = int((world.width / 2) - BORDER_THICKNESS - 1)
+        if (BORDER_THICKNESS + buffer) >= (world.height - BORDER_THICKNESS - buffer):
+             event_log.emit('spawn_buffer_adjusted', 'warning', axis='y')
+             buffer = int((world.height / 2) - BORDER_THICKNESS - 1)
         # Ensure buffer is not negative after adjustment
         buffer = max(0, buffer)
 
 
         # Determine coordinates based on edge (Now uses integer buffer)
         if edge == 'top':
-            x = random.randint(BORDER_THICKNESS + buffer, SCREEN_WIDTH - BORDER_THICKNESS - buffer)
+            x = random.randint(BORDER_THICKNESS + buffer, world.width - BORDER_THICKNESS - buffer)
             y = BORDER_THICKNESS + buffer
         elif edge == 'bottom':
-            x = random.randint(BORDER_THICKNESS + buffer, SCREEN_WIDTH - BORDER_THICKNESS - buffer)
-            y = SCREEN_HEIGHT - BORDER_THICKNESS - buffer
+            x = random.randint(BORDER_THICKNESS + buffer, world.width - BORDER_THICKNESS - buffer)
+            y = world.height - BORDER_THICKNESS - buffer
         elif edge == 'left':
             x = BORDER_THICKNESS + buffer
-            y = random.randint(BORDER_THICKNESS + buffer, SCREEN_HEIGHT - BORDER_THICKNESS - buffer)
+            y = random.randint(BORDER_THICKNESS + buffer, world.height - BORDER_THICKNESS - buffer)
         elif edge == 'right':
-            x = SCREEN_WIDTH - BORDER_THICKNESS - buffer
-            y = random.randint(BORDER_THICKNESS + buffer, SCREEN_HEIGHT - BORDER_THICKNESS - buffer)
+            x = world.width - BORDER_THICKNESS - buffer
+            y = random.randint(BORDER_THICKNESS + buffer, world.height - BORDER_THICKNESS - buffer)
+
+        # Precomputed wall-free edge points from the arena replace the random edge position
+        if spawn_points:
+            x, y = random.choice(spawn_points)
 
         # Create temporary enemy first
-        temp_enemy = Enemy(x, y, walls_group)
+        temp_enemy = Enemy(x, y, walls_group, current_time)
         # Position its rect correctly *before* checks
         temp_enemy.rect.center = (x, y)
 
@@ -870,7 +3115,7 @@ def spawn_enemy_at_edge(all_sprites_group, enemies_group, walls_group, player_sp
         #      if wall_collision_check_rect.colliderect(wall.rect):
         #           collided_walls = True
         #           break
-        if collided_walls:
+        if collided_walls and not spawn_points:
              # print(f"Attempt {spawn_attempts}: Edge spawn ({x},{y}) too close to wall.") # Debug
              continue
 
@@ -895,6 +3140,7 @@ def spawn_enemy_at_edge(all_sprites_group, enemies_group, walls_group, player_sp
         # If all checks pass, add the enemy
         all_sprites_group.add(temp_enemy)
         enemies_group.add(temp_enemy)
+        event_log.emit('spawn', 'debug', entity='enemy', type=temp_enemy.type, x=x, y=y)
 
         # --- Optional Nudge ---
         # Immediately after adding, check collision again and nudge inwards if needed
@@ -909,461 +3155,2444 @@ def spawn_enemy_at_edge(all_sprites_group, enemies_group, walls_group, player_sp
         return True # Success
 
     # If loop finishes without success
-    print(f"Warning: Failed to spawn enemy at edge after {max_attempts} attempts.")
+    event_log.emit('spawn_failed', 'warning', entity='enemy', attempts=max_attempts)
     return False # Failure
 
-# --- Pygame Initialization ---
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Tank Mayhem - Restartable")
-clock = pygame.time.Clock()
-random.seed()
-
-# --- Main Game Control Loop ---
-running = True
-while running:
-    # --- Call setup to get fresh game state ---
-    (all_sprites, players, enemies, player_bullets, enemy_bullets,
-     walls, powerups, particles, player, score, game_over, win,
-     next_powerup_spawn_time,
-     next_bombardment_time, active_bombardment_zones,
-     # --- Unpack wave variables ---
-     wave_number, enemies_this_wave, enemies_spawned_this_wave,
-     next_wave_time, next_enemy_spawn_time, waiting_for_next_wave
-     ) = setup_game()
-
-    # --- Gameplay Loop ---
-    game_active = True
-    # # Variable to track damage tick for circle
-    # last_circle_damage_time = pygame.time.get_ticks()
-
-    while game_active:
-        current_time = pygame.time.get_ticks()
-
-        # # --- Calculate Time and Circle Radius ---
-        # elapsed_time = current_time - game_start_time
-        # time_remaining = max(0, GAME_DURATION - elapsed_time)
-        # time_ratio = min(1.0, elapsed_time / GAME_DURATION) # Clamp between 0 and 1
-
-        # # Linear interpolation for radius
-        # circle_current_radius = circle_start_radius + (CIRCLE_END_RADIUS - circle_start_radius) * time_ratio
-        # circle_current_radius = max(CIRCLE_END_RADIUS, circle_current_radius) # Ensure it doesn't go below min
-
-        # --- Event Handling ---
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                game_active = False # Exit gameplay loop
-                running = False     # Exit main control loop
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                 if event.button == 1 and player.alive():
-                     player.shoot(all_sprites, player_bullets)
-            # --- Check for quit/restart keys DURING gameplay? Optional ---
-            # if event.type == pygame.KEYDOWN:
-            #     if event.key == pygame.K_ESCAPE: # Example quit key
-            #         game_active = False
-            #         running = False
-
-        # If running is false due to QUIT event, stop processing this frame
-        if not running:
+# --- Horde Mode ---
+# Endless waves whose size follows a growth curve. Each wave arrives in bursts of many
+# enemies per tick, dropped on random edge points from the arena's spawn table. Horde
+# tanks only collide with walls and the player: an 800x600 arena cannot hold thousands
+# of non-overlapping tanks.
+HORDE_CURVES = ('linear', 'geometric', 'fibonacci')
+
+class HordeConfig:
+    def __init__(self, curve='geometric', base=HORDE_BASE_ENEMIES, growth=HORDE_GROWTH,
+                 burst=HORDE_BURST_SIZE, burst_interval=HORDE_BURST_INTERVAL, max_live=HORDE_MAX_LIVE_ENEMIES):
+        self.curve = curve
+        self.base = base
+        self.growth = growth
+        self.burst = burst
+        self.burst_interval = burst_interval
+        self.max_live = max_live
+        self.think_interval = HORDE_THINK_INTERVAL
+        self.think_distance = HORDE_THINK_DISTANCE
+
+    def wave_size(self, wave):
+        """ Enemies in the given wave (1-based). """
+        if self.curve == 'linear':
+            size = self.base * (1 + self.growth * (wave - 1))
+        elif self.curve == 'fibonacci':
+            size = self.base * fibonacci(wave)
+        else:
+            size = self.base * (1 + self.growth) ** (wave - 1)
+        return max(1, int(size))
+
+    def burst_size(self, wave_size):
+        """ Enemies per burst: at least `burst`, more for big waves so each arrives in ~HORDE_WAVE_BURSTS bursts. """
+        return max(self.burst, -(-wave_size // HORDE_WAVE_BURSTS))
+
+def spawn_horde_burst(state, count, now, points=None):
+    """ Spawns up to count enemies this tick on random spawn-table points; returns how many spawned. """
+    if points is None:
+        points = state.arena.enemy_spawns
+    if not points:
+        return int(spawn_enemy_at_edge(now, state.all_sprites, state.enemies, state.walls, state.lead_player()))
+    player = state.lead_player()
+    max_enemy_size = max(d['size'] for d in ENEMY_TYPES.values())
+    keep_out = PLAYER_SIZE * 4 + max_enemy_size # Same clearance as spawn_enemy_at_edge()
+    spawned = []
+    for _ in range(count):
+        x, y = random.choice(points)
+        if player and (x - player.rect.centerx) ** 2 + (y - player.rect.centery) ** 2 < keep_out * keep_out:
+            continue
+        spawned.append(Enemy(x, y, state.walls, now))
+    state.all_sprites.add(spawned)
+    state.enemies.add(spawned)
+    if spawned:
+        event_log.emit('spawn_burst', 'debug', entity='enemy', count=len(spawned), wave=state.wave_number)
+    return len(spawned)
+
+# --- Parallel Horde ---
+# Horde enemies drive through each other, so updating one only reads the walls, the players,
+# the danger map and that enemy's own state. With --enemy-workers N the world is cut into N
+# vertical strips. Each tick the main process packs every enemy due an update into a table of
+# records in shared memory, one contiguous run per strip, and each worker process runs the
+# usual Enemy.update() or move() on its strip (wall lookahead, steering, movement, aim and the
+# decision to fire). The main process reads the records back into the sprites and fires their
+# bullets; bullet hits, pickups and drawing stay in the main process. Enemies are rebucketed by
+# strip every tick, so crossing into another strip needs no hand-off. Workers draw from their
+# own random streams (seeded from the main one each tick): a run is reproducible for a given
+# worker count, but is not the same run as with the enemies updated in-process.
+ENEMY_TYPE_NAMES = tuple(ENEMY_TYPES)
+ENEMY_TYPE_INDEX = {name: i for i, name in enumerate(ENEMY_TYPE_NAMES)}
+ENEMY_AI_STATES = ('roaming', 'chasing')
+ENEMY_STATE_INDEX = {name: i for i, name in enumerate(ENEMY_AI_STATES)}
+# type, rect (4), angle, image angle (NaN: not rotated yet), AI state, direction timer, shoot timer,
+# last shot, ammo, think (1) or only move (0), target player (-1: none), fired bullet x, y (NaN: no shot)
+ENEMY_RECORD_FIELDS = 16
+ENEMY_RECORD = struct.Struct(f'<{ENEMY_RECORD_FIELDS}d')
+ENEMY_WORKER_START_METHOD = 'spawn' # Workers start clean instead of forking the parent's SDL state
+MAX_ENEMY_WORKERS = 64
+
+def pack_enemies(buf, start, jobs, targets):
+    """ Writes the (enemy, think, target rect) jobs to consecutive records from slot start. """
+    values = []
+    add = values.extend
+    nan = math.nan
+    for enemy, think, target in jobs:
+        image_angle = enemy._image_angle
+        add((ENEMY_TYPE_INDEX[enemy.type], *enemy.rect, enemy.angle, nan if image_angle is None else image_angle,
+             ENEMY_STATE_INDEX[enemy.state], enemy.change_dir_timer, enemy.shoot_timer, enemy.last_shot_time,
+             enemy.ammo, think, targets.get(id(target), -1), nan, nan))
+    struct.pack_into(f'<{len(values)}d', buf, start * ENEMY_RECORD.size, *values)
+
+def unpack_enemies(buf, start, jobs):
+    """ Copies the records back into their enemies; returns (enemy, x, y) for each bullet fired. """
+    values = ENEMY_RECORD_FIELDS * len(jobs)
+    values = struct.unpack_from(f'<{values}d', buf, start * ENEMY_RECORD.size)
+    isnan = math.isnan
+    shots = []
+    offset = 0
+    for enemy, think, _ in jobs:
+        (_, left, top, width, height, angle, image_angle, ai_state, change_dir_timer, shoot_timer,
+         last_shot_time, ammo, _, _, bullet_x, bullet_y) = values[offset:offset + ENEMY_RECORD_FIELDS]
+        offset += ENEMY_RECORD_FIELDS
+        enemy.rect.update(left, top, width, height)
+        enemy.angle = angle
+        if image_angle != enemy._image_angle and not isnan(image_angle):
+            enemy._image_angle = image_angle
+            enemy.image = rotated_tank_image(enemy.size, enemy.color, image_angle)
+        if think: # Only decisions change the AI state and timers, or fire
+            enemy.state = ENEMY_AI_STATES[int(ai_state)]
+            enemy.change_dir_timer = int(change_dir_timer)
+            enemy.shoot_timer = int(shoot_timer)
+            enemy.last_shot_time = int(last_shot_time)
+            enemy.ammo = int(ammo)
+            if not isnan(bullet_x):
+                shots.append((enemy, int(bullet_x), int(bullet_y)))
+    return shots
+
+def enemy_proxy(enemy_type):
+    """ Stand-in Enemy a worker loads records into (only the fields update() and move() use). """
+    enemy = Enemy.__new__(Enemy)
+    pygame.sprite.Sprite.__init__(enemy)
+    enemy.walls = ()
+    enemy.set_type(enemy_type)
+    enemy.health = enemy.max_health
+    enemy.rect = enemy.base_image.get_rect()
+    return enemy
+
+def player_proxy(rect, size, angle):
+    """ Stand-in for a player that enemies collide with and aim at. """
+    player = pygame.sprite.Sprite()
+    player.image = rotated_tank_image(size, GREEN, angle)
+    player.mask = image_mask(player.image)
+    player.rect = pygame.Rect(rect)
+    return player
+
+def run_enemy_records(buf, start, end, proxies, players, now, index, danger, fired):
+    """ Worker side: runs update() (or just move()) for the records in [start, end) and writes them back. """
+    values = struct.unpack_from(f'<{ENEMY_RECORD_FIELDS * (end - start)}d', buf, start * ENEMY_RECORD.size)
+    results = []
+    add = results.extend
+    nan, isnan = math.nan, math.isnan
+    for offset in range(0, len(values), ENEMY_RECORD_FIELDS):
+        (type_index, left, top, width, height, angle, image_angle, ai_state, change_dir_timer, shoot_timer,
+         last_shot_time, ammo, think, target, _, _) = values[offset:offset + ENEMY_RECORD_FIELDS]
+        enemy = proxies[int(type_index)]
+        enemy.rect.update(left, top, width, height)
+        enemy.angle = angle
+        if isnan(image_angle): # Never rotated yet
+            enemy._image_angle = None
+        else:
+            enemy._image_angle = image_angle
+            if image_angle == angle: # Otherwise move() rotates it anyway
+                enemy.image = rotated_tank_image(enemy.size, enemy.color, image_angle)
+        enemy.state = ENEMY_AI_STATES[int(ai_state)]
+        enemy.change_dir_timer = change_dir_timer
+        enemy.shoot_timer = shoot_timer
+        enemy.last_shot_time = last_shot_time
+        enemy.ammo = ammo
+        bullet_x = bullet_y = nan
+        if think:
+            enemy.update(fired, fired, players[int(target)].rect if target >= 0 else None, None, None, now, index, danger)
+            if fired:
+                bullet_x, bullet_y = fired.sprites()[0].rect.topleft
+                fired.empty()
+        else:
+            enemy.move(None, None, now, index)
+        image_angle = enemy._image_angle
+        add((type_index, *enemy.rect, enemy.angle, nan if image_angle is None else image_angle,
+             ENEMY_STATE_INDEX[enemy.state], enemy.change_dir_timer, enemy.shoot_timer, enemy.last_shot_time,
+             enemy.ammo, think, target, bullet_x, bullet_y))
+    struct.pack_into(f'<{len(results)}d', buf, start * ENEMY_RECORD.size, *results)
+
+def enemy_worker(connection, memory_name):
+    """ Worker process: keeps a copy of the arena and updates one run of records per 'tick' message. """
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C reaches the whole group; the parent stops its workers
+    memory = shared_memory.SharedMemory(name=memory_name)
+    index = TankIndex()
+    proxies = [enemy_proxy(name) for name in ENEMY_TYPE_NAMES]
+    fired = pygame.sprite.Group()
+    grid = danger = None
+    while True:
+        message = connection.recv()
+        kind = message[0]
+        if kind == 'tick':
+            _, start, end, now, seed, player_data = message
+            random.seed(seed)
+            players = [player_proxy(*data) for data in player_data]
+            index.rebuild(None, (), players, solid_enemies=False, grid=grid)
+            if end > start:
+                run_enemy_records(memory.buf, start, end, proxies, players, now, index, danger, fired)
+            connection.send(end - start)
+        elif kind == 'arena':
+            _, size, wall_rects, grid = message
+            world.size = size
+            index.set_walls(wall_rects)
+        elif kind == 'danger':
+            danger = message[1]
+        elif kind == 'memory':
+            memory.close()
+            memory = shared_memory.SharedMemory(name=message[1])
+            connection.send(True)
+        else:
             break
+    memory.close()
+
+def start_worker(process):
+    """
+    Starts a spawned worker process with pygame's import banner hidden. A spawned child inherits
+    the environment at start(), so the variable is only set around that call and ours is left as it was.
+    """
+    with environ_set('PYGAME_HIDE_SUPPORT_PROMPT', '1'): # The worker imports pygame again
+        process.start()
+
+class EnemyPool:
+    """ The --enemy-workers processes and the shared record table they update. """
+    def __init__(self):
+        self.workers = [] # (process, connection)
+        self.memory = None
+        self.capacity = 0
+        self.arena = None
+        self.danger_cells = None
+
+    def start(self, count, capacity):
+        context = multiprocessing.get_context(ENEMY_WORKER_START_METHOD)
+        self.capacity = capacity
+        self.memory = shared_memory.SharedMemory(create=True, size=capacity * ENEMY_RECORD.size)
+        for number in range(count):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=enemy_worker, args=(child_connection, self.memory.name),
+                                      name=f'enemy-worker-{number}', daemon=True)
+            start_worker(process)
+            child_connection.close()
+            self.workers.append((process, connection))
+        event_log.emit('enemy_workers', workers=count, capacity=capacity)
+
+    def stop(self):
+        for process, connection in self.workers:
+            try:
+                connection.send(('stop',))
+            except OSError:
+                pass # Already gone
+        for process, connection in self.workers:
+            process.join(1)
+            connection.close()
+        self.workers = []
+        if self.memory:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def reserve(self, count):
+        """ Grows the record table to hold count enemies. """
+        if count <= self.capacity:
+            return
+        old = self.memory
+        self.capacity = max(count, self.capacity * 2)
+        self.memory = shared_memory.SharedMemory(create=True, size=self.capacity * ENEMY_RECORD.size)
+        self.send_all(('memory', self.memory.name))
+        for _, connection in self.workers:
+            connection.recv() # Every worker has let go of the old table
+        old.close()
+        old.unlink()
+
+    def send_all(self, message):
+        for _, connection in self.workers:
+            connection.send(message)
+
+    def run(self, state, jobs, now, index, danger):
+        """
+        Updates the (enemy, think, target player rect) jobs on the workers and returns the
+        bullets they fired. Each strip is sent off as soon as it is packed and read back as
+        soon as its worker answers.
+        """
+        if state.arena is not self.arena:
+            self.arena = state.arena
+            self.send_all(('arena', tuple(world.size), index.wall_rects, state.arena.grid))
+        cells = danger.cells if danger else None
+        if cells is not self.danger_cells:
+            self.danger_cells = cells
+            self.send_all(('danger', danger))
+        self.reserve(len(jobs))
+        players = state.players.sprites()
+        player_data = [(tuple(player.rect), player.size, player.angle) for player in players]
+        targets = {id(player.rect): i for i, player in enumerate(players)}
+        count, width = len(self.workers), world.width
+        strips = [[] for _ in range(count)]
+        for job in jobs:
+            strips[min(count - 1, max(0, job[0].rect.centerx * count // width))].append(job)
+        seed = random.getrandbits(32)
+        buf = self.memory.buf
+        slot = 0
+        for number, ((_, connection), strip) in enumerate(zip(self.workers, strips)):
+            if strip:
+                pack_enemies(buf, slot, strip, targets)
+            connection.send(('tick', slot, slot + len(strip), now, seed * MAX_ENEMY_WORKERS + number, player_data))
+            slot += len(strip)
+        fired = []
+        slot = 0
+        for (_, connection), strip in zip(self.workers, strips):
+            connection.recv()
+            if strip:
+                for enemy, x, y in unpack_enemies(buf, slot, strip):
+                    bullet = Bullet(0, 0, enemy.angle, color=enemy.color, damage=enemy.damage)
+                    bullet.rect.topleft = bullet.start = (x, y)
+                    fired.append(bullet)
+                    audio.play('enemy_shot', enemy.rect.center)
+            slot += len(strip)
+        del buf
+        return fired
+
+enemy_pool = EnemyPool()
+
+# --- Simulation Tick ---
+def nearest_rect(rect, rects):
+    """ The rect in rects whose centre is closest to rect's centre. """
+    x, y = rect.center
+    return min(rects, key=lambda r: (r.centerx - x) ** 2 + (r.centery - y) ** 2)
+
+def simulate_tick(state, current_time, view):
+    """
+    Advances the world by one fixed tick: spawning, bombardments, waves, every player and enemy,
+    bullets and collisions. Player input (velocity, aim, shots) must already be applied. view is
+    the area players can see (spawns and enemy activity follow it). Returns False once the game
+    is over (every player destroyed, or all MAX_WAVES survived).
+    """
+    all_sprites, players, enemies = state.all_sprites, state.players, state.enemies
+    player_bullets, enemy_bullets = state.player_bullets, state.enemy_bullets
+    walls, powerups, particles = state.walls, state.powerups, state.particles
+    active_bombardment_zones = state.active_bombardment_zones
+    arena, index = state.arena, state.index
+    game_active = True
 
-        # --- Input Handling (Continuous Keys) ---
-        keys = pygame.key.get_pressed()
-        if player.alive():
-            if keys[pygame.K_a]: player.move_left()
-            if keys[pygame.K_d]: player.move_right()
-            if keys[pygame.K_w]: player.move_up()
-            if keys[pygame.K_s]: player.move_down()
-
-        # --- Powerup Spawning --- (Use new name and function)
-        if not powerups and current_time >= next_powerup_spawn_time:
-            # Pass current time and player sprite to spawn function
-            if spawn_powerup(current_time, all_sprites, powerups, walls, players.sprite):
-                 pass # Spawn successful, timer reset on collection/despawn
-            else:
-                # If failed to spawn, try again shortly
-                next_powerup_spawn_time = current_time + 5000
-
-        # --- Update ---
-        # # --- Safe Zone Damage Logic ---
-        # circle_center = pygame.Vector2(circle_center_x, circle_center_y)
-        
-        # --- NEW: Bombardment Timing ---
-        # Check if it's time to START a bombardment
-        if current_time >= next_bombardment_time and not active_bombardment_zones:
-            start_bombardment(current_time, active_bombardment_zones, walls, players.sprite)
-            # Next check will be for ending this one
-
-        # Check if it's time to END the current bombardment
-        elif active_bombardment_zones and active_bombardment_zones[0].is_expired(current_time):
-            print(f"Bombardment ended at {current_time}.") # Debug
-            active_bombardment_zones.clear()
-            # Schedule the next one after the cooldown
-            next_bombardment_time = current_time + BOMBARDMENT_COOLDOWN
-
-        # --- Wave Management Logic ---
-        # 1. Check if wave needs to START
-        if waiting_for_next_wave and current_time >= next_wave_time:
-            wave_number += 1
-            if wave_number > MAX_WAVES:
-                if not win and not game_over:
-                     win = True
-                     print(f"DEBUG: Triggering WIN condition (wave_number={wave_number} > MAX_WAVES={MAX_WAVES})")
-                     game_active = False
+    # --- Powerup Spawning --- (Use new name and function)
+    if not powerups and current_time >= state.next_powerup_spawn_time:
+        # Pass current time and player sprite to spawn function
+        if spawn_powerup(current_time, all_sprites, powerups, walls, state.lead_player(), arena.powerup_spawns_in(view)):
+             pass # Spawn successful, timer reset on collection/despawn
+        else:
+            # If failed to spawn, try again shortly
+            state.next_powerup_spawn_time = current_time + 5000
+
+    # --- Update ---
+    # # --- Safe Zone Damage Logic ---
+    # circle_center = pygame.Vector2(circle_center_x, circle_center_y)
+
+    # --- NEW: Bombardment Timing ---
+    # Check if it's time to START a bombardment
+    if current_time >= state.next_bombardment_time and not active_bombardment_zones:
+        start_bombardment(current_time, active_bombardment_zones, walls, state.lead_player())
+        state.danger.rasterize(active_bombardment_zones)
+        # Next check will be for ending this one
+
+    # Check if it's time to END the current bombardment
+    elif active_bombardment_zones and active_bombardment_zones[0].is_expired(current_time):
+        event_log.emit('bombardment_end')
+        active_bombardment_zones.clear()
+        state.danger.clear()
+        # Schedule the next one after the cooldown
+        state.next_bombardment_time = current_time + BOMBARDMENT_COOLDOWN
+
+    # --- Wave Management Logic ---
+    # 1. Check if wave needs to START
+    if state.waiting_for_next_wave and current_time >= state.next_wave_time:
+        state.wave_number += 1
+        if state.horde:
+            state.enemies_this_wave = state.horde.wave_size(state.wave_number)
+            state.enemies_spawned_this_wave = 0
+            state.waiting_for_next_wave = False
+            state.next_enemy_spawn_time = current_time
+            event_log.emit('wave_start', wave=state.wave_number, enemies=state.enemies_this_wave, horde=True)
+            audio.play('wave')
+        elif state.wave_number > MAX_WAVES:
+            if not state.win and not state.game_over:
+                 state.win = True
+                 event_log.emit('win', waves=MAX_WAVES, score=state.score)
+                 game_active = False
+        else:
+            # Calculate Fibonacci number
+            fib_num = fibonacci(state.wave_number)
+            if fib_num <= 0: fib_num = 1 # Ensure at least 1 base
+
+            # --- ENFORCE MINIMUM ---
+            state.enemies_this_wave = max(10, fib_num) # Set enemies to at least 10
+            # ---
+
+            state.enemies_spawned_this_wave = 0
+            state.waiting_for_next_wave = False
+            state.next_enemy_spawn_time = current_time # Attempt first spawn immediately
+            event_log.emit('wave_start', wave=state.wave_number, enemies=state.enemies_this_wave, fib=fib_num)
+            audio.play('wave')
+
+    # 2. Check if enemies need to be SPAWNED (during active wave)
+    # Ensure wave is active AND not all intended enemies have been successfully spawned yet
+    if not state.waiting_for_next_wave and state.enemies_spawned_this_wave < state.enemies_this_wave:
+        # Only try to spawn if the timer is ready
+        if state.horde and current_time >= state.next_enemy_spawn_time:
+            # Horde bursts: many enemies at once, paused while the live cap is reached
+            room = state.horde.max_live - len(enemies)
+            burst = min(state.horde.burst_size(state.enemies_this_wave), room,
+                        state.enemies_this_wave - state.enemies_spawned_this_wave)
+            if burst > 0:
+                state.enemies_spawned_this_wave += spawn_horde_burst(state, burst, current_time, arena.enemy_spawns_around(view))
+            state.next_enemy_spawn_time = current_time + state.horde.burst_interval
+            if state.enemies_spawned_this_wave >= state.enemies_this_wave:
+                event_log.emit('wave_spawned', 'debug', wave=state.wave_number, enemies=state.enemies_this_wave)
+        elif current_time >= state.next_enemy_spawn_time:
+            # print(f"DEBUG: Attempting spawn for wave {wave_number}. {enemies_spawned_this_wave}/{enemies_this_wave} spawned.") # Debug
+            spawn_success = spawn_enemy_at_edge(current_time, all_sprites, enemies, walls, state.lead_player(), arena.enemy_spawns_around(view))
+
+            if spawn_success:
+                state.enemies_spawned_this_wave += 1
+                # print(f"DEBUG: Spawn SUCCESS. Count now {enemies_spawned_this_wave}") # Debug
+                # Schedule next spawn *only if successful* and more are needed
+                if state.enemies_spawned_this_wave < state.enemies_this_wave:
+                    state.next_enemy_spawn_time = current_time + ENEMY_SPAWN_INTERVAL
+                else: # All enemies for this wave have been successfully spawned
+                      event_log.emit('wave_spawned', 'debug', wave=state.wave_number, enemies=state.enemies_this_wave)
             else:
-                # Calculate Fibonacci number
-                fib_num = fibonacci(wave_number)
-                if fib_num <= 0: fib_num = 1 # Ensure at least 1 base
-
-                # --- ENFORCE MINIMUM ---
-                enemies_this_wave = max(10, fib_num) # Set enemies to at least 10
-                # ---
-
-                enemies_spawned_this_wave = 0
-                waiting_for_next_wave = False
-                next_enemy_spawn_time = current_time # Attempt first spawn immediately
-                print(f"--- Starting Wave {wave_number} ({enemies_this_wave} enemies | Fib={fib_num}) ---") # Log both numbers
-
-        # 2. Check if enemies need to be SPAWNED (during active wave)
-        # Ensure wave is active AND not all intended enemies have been successfully spawned yet
-        if not waiting_for_next_wave and enemies_spawned_this_wave < enemies_this_wave:
-            # Only try to spawn if the timer is ready
-            if current_time >= next_enemy_spawn_time:
-                # print(f"DEBUG: Attempting spawn for wave {wave_number}. {enemies_spawned_this_wave}/{enemies_this_wave} spawned.") # Debug
-                spawn_success = spawn_enemy_at_edge(all_sprites, enemies, walls, players.sprite)
-
-                if spawn_success:
-                    enemies_spawned_this_wave += 1
-                    # print(f"DEBUG: Spawn SUCCESS. Count now {enemies_spawned_this_wave}") # Debug
-                    # Schedule next spawn *only if successful* and more are needed
-                    if enemies_spawned_this_wave < enemies_this_wave:
-                        next_enemy_spawn_time = current_time + ENEMY_SPAWN_INTERVAL
-                    else: # All enemies for this wave have been successfully spawned
-                          print(f"DEBUG: All {enemies_this_wave} enemies for wave {wave_number} successfully spawned.")
-                else:
-                    # If spawn failed, schedule a RETRY soon, don't increment spawn count
-                    # print(f"DEBUG: Spawn FAILED. Retrying soon.") # Debug
-                    next_enemy_spawn_time = current_time + 300 # Try again faster
-
-        # 3. Check if wave is CLEARED (to schedule the next one)
-        # Condition: Wave is NOT waiting, AND all intended spawns have occurred, AND enemy group is empty
-        all_spawns_done = enemies_spawned_this_wave >= enemies_this_wave
-        # print(f"DEBUG: Check Clear: Wait={waiting_for_next_wave}, SpawnsDone={all_spawns_done}, EnemiesLeft={len(enemies)}") # Debug
-
-        if not waiting_for_next_wave and all_spawns_done and not enemies:
-             print(f"--- Wave {wave_number} Cleared! ---")
-             waiting_for_next_wave = True
-             # Ensure we don't schedule wave > MAX_WAVES
-             if wave_number < MAX_WAVES:
-                  next_wave_time = current_time + WAVE_START_DELAY
-             # else: Win condition already checked when wave_number increments
-
-        # # Check Player
-        # if player.alive():
-            # player_pos = pygame.Vector2(player.rect.center)
-            # distance = player_pos.distance_to(circle_center)
-            # if distance > circle_current_radius:
-                # # --- Simplified Damage: Apply small fixed damage per frame outside ---
-                # player.take_damage(0.05) # Example: 0.05 HP damage per frame outside
-                # # ---------------------------
-                # if not player.alive():
-                    # create_explosion(player.rect.center, all_sprites, particles)
-                    # game_over = True
-                    # print("GAME OVER - Player Destroyed by Circle")
-
-        # # Check Enemies
-        # for enemy in enemies:
-             # enemy_pos = pygame.Vector2(enemy.rect.center)
-             # distance = enemy_pos.distance_to(circle_center)
-             # if distance > circle_current_radius:
-                 # # Kill enemies instantly when outside
-                 # print(f"Enemy {enemy.type} outside circle. Destroyed.") # Debug
-                 # create_explosion(enemy.rect.center, all_sprites, particles)
-                 # enemy.kill() # No score for circle kills
-                 
-        # Ensure player update receives enemies group
-        if player.alive():
-             player.update(walls, enemies)
-        # Ensure enemy update receives correct groups
-        player_sprite_rect = player.rect if player.alive() else None
+                # If spawn failed, schedule a RETRY soon, don't increment spawn count
+                # print(f"DEBUG: Spawn FAILED. Retrying soon.") # Debug
+                state.next_enemy_spawn_time = current_time + 300 # Try again faster
+
+    # 3. Check if wave is CLEARED (to schedule the next one)
+    # Condition: Wave is NOT waiting, AND all intended spawns have occurred, AND enemy group is empty
+    all_spawns_done = state.enemies_spawned_this_wave >= state.enemies_this_wave
+    # print(f"DEBUG: Check Clear: Wait={waiting_for_next_wave}, SpawnsDone={all_spawns_done}, EnemiesLeft={len(enemies)}") # Debug
+
+    if not state.waiting_for_next_wave and all_spawns_done and not enemies:
+         event_log.emit('wave_clear', wave=state.wave_number)
+         state.waiting_for_next_wave = True
+         # Ensure we don't schedule wave > MAX_WAVES
+         if state.horde or state.wave_number < MAX_WAVES:
+              state.next_wave_time = current_time + WAVE_START_DELAY
+         # else: Win condition already checked when wave_number increments
+
+    # # Check Player
+    # if player.alive():
+        # player_pos = pygame.Vector2(player.rect.center)
+        # distance = player_pos.distance_to(circle_center)
+        # if distance > circle_current_radius:
+            # # --- Simplified Damage: Apply small fixed damage per frame outside ---
+            # player.take_damage(0.05) # Example: 0.05 HP damage per frame outside
+            # # ---------------------------
+            # if not player.alive():
+                # create_explosion(player.rect.center, all_sprites, particles)
+                # game_over = True
+                # print("GAME OVER - Player Destroyed by Circle")
+
+    # # Check Enemies
+    # for enemy in enemies:
+         # enemy_pos = pygame.Vector2(enemy.rect.center)
+         # distance = enemy_pos.distance_to(circle_center)
+         # if distance > circle_current_radius:
+             # # Kill enemies instantly when outside
+             # print(f"Enemy {enemy.type} outside circle. Destroyed.") # Debug
+             # create_explosion(enemy.rect.center, all_sprites, particles)
+             # enemy.kill() # No score for circle kills
+
+    # Ensure player update receives enemies group
+    for player in players.sprites():
+         player.update(walls, enemies)
+    # Ensure enemy update receives correct groups (each enemy targets the nearest player)
+    player_rects = [player.rect for player in players]
+    player_sprite_rect = player_rects[0] if player_rects else None
+    many_players = len(player_rects) > 1
+    index.rebuild(walls, enemies, players, solid_enemies=not state.horde, grid=arena.grid)
+    danger = state.danger if active_bombardment_zones else None
+    if state.horde:
+        think_interval, think_distance = state.horde.think_interval, state.horde.think_distance
+    else:
+        think_interval, think_distance = 1, AI_LOD_DISTANCE
+    jobs = [] if state.horde and enemy_pool.workers else None # (enemy, think, target) for --enemy-workers
+    if view.contains(world): # Whole world on screen: every enemy is active
+        for slot, enemy in enumerate(enemies):
+              if many_players:
+                  player_sprite_rect = nearest_rect(enemy.rect, player_rects)
+              think = quality.should_think(enemy, slot, player_sprite_rect, state.tick, think_interval, think_distance)
+              if jobs is not None:
+                  jobs.append((enemy, think, player_sprite_rect))
+              elif think:
+                  enemy.update(all_sprites, enemy_bullets, player_sprite_rect, players, enemies, current_time, index, danger)
+              else: # AI level of detail: keep driving on the current heading, skip decisions
+                  enemy.move(players, enemies, current_time, index)
+    else:
+        # Large world: enemies far outside the view stay dormant, off-screen ones think rarely
+        active = view.inflate(ACTIVE_MARGIN * 2, ACTIVE_MARGIN * 2)
+        offscreen_interval = max(think_interval, OFFSCREEN_THINK_INTERVAL)
+        for slot, enemy in enumerate(enemies):
+              if many_players:
+                  player_sprite_rect = nearest_rect(enemy.rect, player_rects)
+              if view.colliderect(enemy.rect):
+                  think = quality.should_think(enemy, slot, player_sprite_rect, state.tick, think_interval, think_distance)
+              elif active.colliderect(enemy.rect):
+                  think = quality.should_think(enemy, slot, player_sprite_rect, state.tick, offscreen_interval, 0)
+              else:
+                  continue
+              if jobs is not None:
+                  jobs.append((enemy, think, player_sprite_rect))
+              elif think:
+                  enemy.update(all_sprites, enemy_bullets, player_sprite_rect, players, enemies, current_time, index, danger)
+              else:
+                  enemy.move(players, enemies, current_time, index)
+    if jobs:
+        fired = enemy_pool.run(state, jobs, current_time, index, danger)
+        all_sprites.add(fired)
+        enemy_bullets.add(fired)
+
+
+    # Update bullets and particles
+    player_bullets.update()
+    enemy_bullets.update()
+    particles.update()
+    powerups.update(current_time)
+
+    # Note: Walls and AmmoRefills don't have update methods, so they don't need calling.
+
+    # --- Collision Detection ---
+    # Bullets are swept along this tick's move and stop at the first wall or tank on the way
+    # Player bullets hitting enemies (nearby candidates from the tank index) or walls
+    for bullet in player_bullets.sprites():
+        path = bullet.path_rect()
+        enemies_hit_list = sweep_bullet(bullet, index.walls_in(path), [e for e in index.query(path) if e.alive()])
+        if enemies_hit_list is None:
+            if not bullet.in_world():
+                bullet.kill()
+            continue
+        bullet.kill()
+        create_explosion(bullet.rect.center, all_sprites, particles)
+        for enemy in enemies_hit_list:
+            if enemy.take_damage(bullet.damage):
+                state.score += enemy.score_value
+                enemy.kill()
+                event_log.emit('kill', victim=enemy.type, cause='bullet', score=state.score)
+
+    # Enemy bullets hitting players or walls
+    for bullet in enemy_bullets.sprites():
+        path = bullet.path_rect()
+        player_hits = sweep_bullet(bullet, index.walls_in(path),
+                                   [p for p in players if p.alive() and path.colliderect(p.rect)])
+        if player_hits is None:
+            if not bullet.in_world():
+                bullet.kill()
+            continue
+        bullet.kill()
+        create_explosion(bullet.rect.center, all_sprites, particles)
+        for player in player_hits:
+            player.take_damage(bullet.damage)
+            if not player.alive():
+                create_explosion(player.rect.center, all_sprites, particles)
+                event_log.emit('kill', victim='player', cause='bullet')
+
+    # --- Players hitting Powerups --- (Check type)
+    for player in players.sprites():
+        collected_powerups = pygame.sprite.spritecollide(player, powerups, True) # True kills powerup
+        if collected_powerups:
+            for powerup in collected_powerups:
+                if powerup.type == 'ammo':
+                    player.ammo = PLAYER_MAX_AMMO
+                    event_log.emit('pickup', type='ammo', ammo=player.ammo)
+                elif powerup.type == 'health':
+                    player.health = PLAYER_MAX_HEALTH
+                    event_log.emit('pickup', type='health', health=player.health)
+
+                audio.play('pickup', player.rect.center)
+                # Reset spawn timer regardless of type collected
+                state.next_powerup_spawn_time = current_time + POWERUP_RESPAWN_TIME
+                # Add score? Optional
+
+    # --- NEW: Bombardment Zone Damage Logic ---
+    if active_bombardment_zones:
+        # Both checks are one danger map lookup per tank, however many zones are active
+        danger_hit = state.danger.hit
+        # Check Players
+        for player in players.sprites():
+            if danger_hit(*player.rect.center):
+                if BOMBARDMENT_INSTANT_KILL:
+                    event_log.emit('kill', victim='player', cause='bombardment')
+                    create_explosion(player.rect.center, all_sprites, particles)
+                    player.kill()
+                # --- Optional: Damage Over Time ---
+                # else:
+                #     damage_this_frame = BOMBARDMENT_DAMAGE_PER_SECOND * delta_time
+                #     player.take_damage(damage_this_frame)
+                #     if not player.alive():
+                #         create_explosion(player.rect.center, all_sprites, particles)
+                #         print("GAME OVER - Player Destroyed by Bombardment")
+                # --- End Optional DOT ---
+
+        # Check Enemies
         for enemy in enemies:
-              enemy.update(all_sprites, enemy_bullets, player_sprite_rect, players, enemies)
+            if danger_hit(*enemy.rect.center):
+                if BOMBARDMENT_INSTANT_KILL:
+                    event_log.emit('kill', victim=enemy.type, cause='bombardment')
+                    create_explosion(enemy.rect.center, all_sprites, particles)
+                    enemy.kill() # No score for bombardment kills
+                # --- Optional: Damage Over Time ---
+                # else:
+                #     # Implement DOT for enemies if desired
+                #     enemy.take_damage(BOMBARDMENT_DAMAGE_PER_SECOND * delta_time)
+                #     if enemy.health <= 0:
+                #          create_explosion(enemy.rect.center, all_sprites, particles)
+                #          enemy.kill()
+                # --- End Optional DOT ---
+
+    # --- Win/Loss Conditions Check ---
+    if not players and not state.game_over: # Every player has been destroyed
+        state.game_over = True
+        event_log.emit('game_over', score=state.score)
+    if not enemies and not state.horde and not state.win and not state.game_over: # Check win only if not already ended (horde mode never ends in a win)
+        state.win = True
+        event_log.emit('win', score=state.score)
+
+    # # Check if time ran out (and player hasn't won or already lost)
+    # if time_remaining <= 0 and not win and not game_over:
+        # print("GAME OVER - Time Ran Out!")
+        # game_over = True
+        # # Optionally kill player if timer runs out?
+        # if player.alive():
+             # create_explosion(player.rect.center, all_sprites, particles)
+             # player.kill()
+
+    return game_active and not state.game_over
+
+# --- Camera ---
+class Camera:
+    """ The screen's window onto the world, centred on a target and kept inside the world. """
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        self.view = pygame.Rect(0, 0, width, height)
+
+    def follow(self, target_rect, bounds):
+        self.view.center = target_rect.center
+        self.view.clamp_ip(bounds)
+
+    def to_world(self, pos):
+        return (pos[0] + self.view.x, pos[1] + self.view.y)
+
+def draw_tiles(surface, chunks, view, scale=1):
+    """ Blits the chunk tiles under view (tiles are already drawn at the render scale). """
+    cs = chunks.chunk_size
+    surface.blits([(chunks.tile(key, scale), (int((key[0] * cs - view.x) * scale), int((key[1] * cs - view.y) * scale)))
+                   for key in chunks.chunks_in(view)], False)
+
+# --- Render Frames ---
+# A frame is captured from the state at the end of a tick and drawn afterwards. It holds only
+# copied positions and the shared cached images, so drawing it never reads the live sprites and
+# the next tick may already be running (see --pipelined).
+class RenderFrame:
+    __slots__ = ('chunks', 'view', 'sprites', 'zones', 'zone_mode', 'hud')
+
+def capture_frame(state, camera, hud_blits):
+    """
+    Captures the view, the sprites inside it as (image, screen rect) pairs in layer order
+    (power-ups, player, enemies, bullets, particles), the bombardment zones and the HUD.
+    """
+    view = camera.view.copy()
+    ox, oy = view.topleft
+    visible = []
+    for group in (state.powerups, state.players):
+        visible += [(s.image, s.rect.move(-ox, -oy)) for s in group if view.colliderect(s.rect)]
+    visible += [(e.image, e.rect.move(-ox, -oy)) for e in state.index.query(view) if e.alive()]
+    for group in (state.player_bullets, state.enemy_bullets, state.particles):
+        visible += [(s.image, s.rect.move(-ox, -oy)) for s in group if view.colliderect(s.rect)]
+    frame = RenderFrame()
+    frame.chunks = state.arena.chunks
+    frame.view = view
+    frame.sprites = visible
+    frame.zones = list(state.active_bombardment_zones)
+    frame.zone_mode = quality.settings['zones']
+    frame.hud = hud_blits
+    return frame
+
+def draw_frame(surface, frame, scale=1):
+    """ Draws a captured frame resized by the render scale: tiles, sprites in one blits() call, zones, HUD. """
+    with _pixels_lock:
+        draw_tiles(surface, frame.chunks, frame.view, scale)
+        surface.blits(scale_blits(frame.sprites, scale), False)
+        if frame.zones:
+            draw_bombardment_zones(surface, frame.zones, frame.zone_mode, frame.view.topleft, scale)
+        surface.blits(scale_blits(frame.hud, scale))
+
+def step_and_capture(state, current_time, camera, hud_blits):
+    """
+    Runs one simulation tick, moves the camera and captures the frame that shows the result
+    (the HUD is rebuilt every hud_interval ticks). Returns (frame, still active, sim ms).
+    """
+    start = time.perf_counter()
+    active = simulate_tick(state, current_time, camera.view)
+    if state.player.alive():
+        camera.follow(state.player.rect, world)
+    if hud_blits is None or state.tick % quality.settings['hud_interval'] == 0:
+        hud_blits = build_hud(state, current_time)
+    frame = capture_frame(state, camera, hud_blits)
+    return frame, active, (time.perf_counter() - start) * 1000
+
+# --- Display ---
+# The game draws into a canvas of SCREEN_WIDTH x SCREEN_HEIGHT times the render scale, and one
+# scaled blit per frame puts the canvas on the window, letterboxed to keep its shape. Drawing
+# cost follows the render scale only, however large the window is.
+class Display:
+    """ The window, the canvas the game draws into, and the mapping between the two. """
+    def __init__(self, window_size=None, render_scale=1.0, fullscreen=False):
+        self.scale = render_scale
+        if window_size is None:
+            window_size = (0, 0) if fullscreen else (SCREEN_WIDTH, SCREEN_HEIGHT) # (0, 0): the desktop size
+        self.window = pygame.display.set_mode(window_size, pygame.FULLSCREEN if fullscreen else 0)
+        self.window.fill(BLACK)
+        window_width, window_height = self.window.get_size()
+        fit = min(window_width / SCREEN_WIDTH, window_height / SCREEN_HEIGHT)
+        self.dest = pygame.Rect(0, 0, round(SCREEN_WIDTH * fit), round(SCREEN_HEIGHT * fit))
+        self.dest.center = (window_width // 2, window_height // 2)
+        canvas_size = (math.ceil(SCREEN_WIDTH * render_scale), math.ceil(SCREEN_HEIGHT * render_scale))
+        if canvas_size == self.dest.size:
+            self.canvas = self.window.subsurface(self.dest) # Nothing to resize: draw straight into the window
+            self.target = None
+        else:
+            self.canvas = new_surface(canvas_size).convert()
+            self.target = self.window.subsurface(self.dest)
 
+    def present(self):
+        """ Scales the canvas onto the window and shows it. """
+        if self.target is not None:
+            pygame.transform.scale(self.canvas, self.dest.size, self.target)
+        pygame.display.flip()
 
-        # Update bullets and particles
-        player_bullets.update()
-        enemy_bullets.update()
+    def to_screen(self, pos):
+        """ Window pixel (e.g. the mouse) -> screen coordinates, which Camera.to_world() expects. """
+        return (int((pos[0] - self.dest.x) * SCREEN_WIDTH / self.dest.width),
+                int((pos[1] - self.dest.y) * SCREEN_HEIGHT / self.dest.height))
+
+# --- HUD ---
+def build_hud(state, current_time):
+    """ Returns the HUD as a list of (text surface, position) pairs ready for Surface.blits(). """
+    player = state.player
+    active_bombardment_zones = state.active_bombardment_zones
+    hud = []
+
+    # --- Draw UI ---
+    hud.append((text_surface(f"Score: {state.score}", 24, WHITE), (15, 15)))
+    hp_color = WHITE if player.alive() else RED
+    hud.append((text_surface(f"HP: {max(0, player.health):.0f}/{PLAYER_MAX_HEALTH}", 24, hp_color), (15, 40))) # Format HP as int
+    hud.append((text_surface(f"Ammo: {player.ammo}/{PLAYER_MAX_AMMO}", 24, WHITE), (15, 65)))
+
+    # # Draw Countdown Timer
+    # minutes = int(time_remaining / 1000 // 60)
+    # seconds = int(time_remaining / 1000 % 60)
+    # time_text = f"Time: {minutes:02d}:{seconds:02d}"
+    # time_color = YELLOW if time_remaining < 30000 else WHITE # Yellow warning under 30s
+    # hud.append((text_surface(time_text, 24, time_color), (SCREEN_WIDTH - 150, 15))) # Top-right
+
+    # --- NEW: Calculate and Draw Bombardment Timer ---
+    bombardment_timer_text = ""
+    bombardment_time_remaining_ms = 0
+    label = ""
+    timer_color = WHITE
+
+    if active_bombardment_zones:
+        # Bombardment is ACTIVE - show time until it ENDS
+        # Assuming all zones start at the same time, use the first one
+        end_time = active_bombardment_zones[0].spawn_time + BOMBARDMENT_DURATION
+        bombardment_time_remaining_ms = max(0, end_time - current_time)
+        label = "Bombardment End:"
+        if bombardment_time_remaining_ms < 3000: # Warning under 3s left
+            timer_color = YELLOW
+    else:
+        # Bombardment is INACTIVE (cooldown or before first) - show time until it STARTS
+        bombardment_time_remaining_ms = max(0, state.next_bombardment_time - current_time)
+        label = "Next Bombardment:"
+        if bombardment_time_remaining_ms < 5000 and state.next_bombardment_time > 0 : # Warning under 5s before start (ignore initial state)
+             timer_color = YELLOW
+
+    # Format the time MM:SS
+    b_minutes = int(bombardment_time_remaining_ms / 1000 // 60) # Should always be 0 for short times, but good practice
+    b_seconds = int(bombardment_time_remaining_ms / 1000 % 60)
+    bombardment_timer_text = f"{label} {b_minutes:01d}:{b_seconds:02d}" # Use 1 digit for minutes if always 0
+
+    # Position in Top-Right
+    timer_x_pos = SCREEN_WIDTH //3 # Adjust X position as needed
+    timer_y_pos = 15             # Adjust Y position as needed
+    hud.append((text_surface(bombardment_timer_text, 24, timer_color), (timer_x_pos, timer_y_pos)))
+    # --- End Bombardment Timer ---
+
+    # --- Draw Wave Status / Timer --- (Revised Logic)
+    wave_timer_text = ""
+    wave_timer_color = WHITE
+    wave_timer_y_pos = 40 # Position below bombardment timer
+
+    # Check ACTIVE wave FIRST
+    if state.horde and not state.game_over:
+         if state.waiting_for_next_wave:
+              w_seconds = int(max(0, state.next_wave_time - current_time) / 1000 % 60)
+              wave_timer_text = f"Next Horde ({state.wave_number + 1}) in: {w_seconds}s"
+         else:
+              wave_timer_text = f"Horde: {state.wave_number} | Left: {len(state.enemies)}"
+              wave_timer_color = ORANGE
+    elif not state.waiting_for_next_wave and state.wave_number <= MAX_WAVES: # Check we haven't already won
+         enemies_left = len(state.enemies)
+         wave_timer_text = f"Wave: {state.wave_number}/{MAX_WAVES} | Left: {enemies_left}"
+         wave_timer_color = ORANGE
+    # Check if WAITING for next wave (and not won yet)
+    elif state.waiting_for_next_wave and state.wave_number < MAX_WAVES and not state.game_over: # Check game_over too
+         wave_time_remaining_ms = max(0, state.next_wave_time - current_time)
+         w_seconds = int(wave_time_remaining_ms / 1000 % 60)
+         wave_timer_text = f"Next Wave ({state.wave_number + 1}) in: {w_seconds}s"
+         if wave_time_remaining_ms < 3000: wave_timer_color = YELLOW
+    # Check if game is WON (highest priority after active)
+    elif state.win:
+         wave_timer_text = f"Survived {MAX_WAVES} Waves!"
+         wave_timer_color = GREEN
+    # Add a case for GAME OVER state during gameplay (optional)
+    elif state.game_over:
+         wave_timer_text = "Player Destroyed!"
+         wave_timer_color = RED
+
+    # Use same X position as bombardment timer, adjust Y
+    wave_timer_x_pos = SCREEN_WIDTH //2 # Reuse X position
+    if wave_timer_text: # Only draw if text is set
+         hud.append((text_surface(wave_timer_text, 24, wave_timer_color), (wave_timer_x_pos, wave_timer_y_pos)))
+    # --- End Wave Timer ---
+
+    return hud
+
+# --- Network Play ---
+# One headless authoritative server runs simulate_tick() for every connected player; clients
+# only send input and draw what the server tells them. Everything travels as small UDP
+# datagrams. Snapshots carry quantised entity records (whole pixels, 256-step angles) and are
+# delta-compressed against the last snapshot the client acknowledged, so an unchanged entity
+# costs nothing; clients draw NET_INTERP_DELAY behind the newest snapshot and interpolate.
+NET_PORT = 47800
+NET_MAGIC = b'TMN1'
+NET_HELLO, NET_WELCOME, NET_INPUT, NET_SNAPSHOT, NET_BYE = range(1, 6)
+NET_SNAPSHOT_RATE = 20 # Snapshots per second sent to each client
+NET_INTERP_DELAY = 100 # ms clients render behind the newest snapshot (two snapshot intervals)
+NET_HISTORY = 64 # Sent snapshots kept per client as delta baselines
+NET_TIMEOUT = 5000 # ms without packets before a client is dropped
+NET_RESTART_DELAY = 5000 # ms the server shows game over before starting a new game
+NET_STATS_INTERVAL = 5000 # ms between 'net_stats' events
+NET_MAX_PLAYERS = 8
+NET_MAX_DATAGRAM = 60000
+NET_MAX_ID = 65535 # Net ids are 16-bit; 0 is never used
+NET_INTEREST_MARGIN = 200 # Entities this far outside a client's screen are still sent
+NET_PLAYER_COLORS = (GREEN, BLUE, (180, 0, 180), (0, 170, 170), YELLOW, (230, 230, 230), (120, 60, 0), BLACK)
+NET_SPAWN_OFFSETS = ((0, 0), (3, 0), (-3, 0), (0, 3), (0, -3), (3, 3), (-3, -3), (3, -3)) # In PLAYER_SIZE units
+
+NET_HEADER = struct.Struct('<4sB') # magic, packet type
+NET_WELCOME_INFO = struct.Struct('<BHHBH') # player number, world width, height, snapshot rate, barrier count
+NET_INPUT_INFO = struct.Struct('<IIBBHH') # input seq, acked snapshot tick, buttons, click count, aim x, y
+NET_SNAPSHOT_INFO = struct.Struct('<IIIIHBBhBHHB') # tick, baseline tick, game time, score, wave, flags,
+                                                   # player number, health, ammo, changed, removed, zones
+NET_ENTITY = struct.Struct('<HBHHBB') # net id, kind, x, y, angle, extra
+
+# Entity kinds and input buttons on the wire
+NET_KIND_PLAYER, NET_KIND_BULLET, NET_KIND_AMMO, NET_KIND_HEALTH = 0, 10, 20, 21
+NET_ENEMY_KINDS = {name: 1 + i for i, name in enumerate(ENEMY_TYPES)} # Enemy type -> kind
+NET_BULLET_COLORS = (BLUE,) + tuple(data['color'] for data in ENEMY_TYPES.values())
+NET_UP, NET_DOWN, NET_LEFT, NET_RIGHT = 1, 2, 4, 8
+NET_GAME_OVER, NET_WIN, NET_BOMBARDMENT = 1, 2, 4
+
+def parse_address(text, port=NET_PORT):
+    """ 'HOST' or 'HOST:PORT' -> (host, port). """
+    host, _, given = text.rpartition(':')
+    if not host or not given.isdigit():
+        return text, port
+    return host, int(given)
+
+def net_packet(kind, payload=b''):
+    return NET_HEADER.pack(NET_MAGIC, kind) + payload
+
+def net_unpack(data):
+    """ (packet type, payload), or (None, b'') for anything that is not one of ours. """
+    if len(data) < NET_HEADER.size:
+        return None, b''
+    magic, kind = NET_HEADER.unpack_from(data)
+    if magic != NET_MAGIC:
+        return None, b''
+    return kind, data[NET_HEADER.size:]
+
+def net_angle(angle):
+    return int(round(angle * 256 / 360)) & 255
+
+def entity_record(sprite, kind, extra=0, angle=0):
+    x, y = sprite.rect.center
+    return (kind, max(0, min(65535, x)), max(0, min(65535, y)), net_angle(angle), extra)
+
+class NetClient:
+    """ Server-side view of one connected client: its player, last input and delta baselines. """
+    def __init__(self, address, number, now):
+        self.address = address
+        self.number = number
+        self.player = None
+        self.last_heard = now
+        self.input_seq = -1
+        self.buttons = 0
+        self.clicks = None
+        self.fire = False
+        self.aim = None
+        self.acked = 0 # Newest snapshot tick the client confirmed
+        self.sent = {} # snapshot tick -> {net id: record}
+        self.bytes_sent = 0
+
+class NetServer:
+    """ Headless authoritative server: owns the GameState and feeds it every client's input. """
+    def __init__(self, host, port, snapshot_rate=NET_SNAPSHOT_RATE):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.snapshot_every = max(1, TICK_RATE // snapshot_rate)
+        self.clients = {} # address -> NetClient
+        self.net_ids = deque(range(1, NET_MAX_ID + 1)) # Free net ids, the longest free first
+        self.net_owners = {} # net id -> the sprite holding it
+        self.state = None
+        self.welcome = b''
+        self.tick_ms = self.encode_ms = 0.0 # Totals since the last stats event
+
+    def new_game(self, arena, horde):
+        """ Starts a game (dropping the local default player) and re-adds every client's tank. """
+        if self.state is None:
+            self.state = GameState()
+            self.state.players = pygame.sprite.Group() # Any number of players
+        state = setup_game(arena, self.state, horde)
+        state.player.kill()
+        barriers = state.arena.barriers
+        self.welcome = zlib.compress(struct.pack(f'<{len(barriers) * 4}H', *[v for b in barriers for v in b]))
+        for client in self.clients.values():
+            self.spawn(client)
+
+    def spawn(self, client):
+        player = Player()
+        player.color = NET_PLAYER_COLORS[(client.number - 1) % len(NET_PLAYER_COLORS)]
+        dx, dy = NET_SPAWN_OFFSETS[(client.number - 1) % len(NET_SPAWN_OFFSETS)]
+        player.rect.move_ip(dx * PLAYER_SIZE, dy * PLAYER_SIZE)
+        player.aim_target = (player.rect.centerx + 1, player.rect.centery)
+        player.number = client.number
+        place_player(self.state, player)
+        client.player = player
+        client.sent.clear()
+        client.acked = 0
+        self.send_welcome(client)
+
+    def send_welcome(self, client):
+        arena = self.state.arena
+        info = NET_WELCOME_INFO.pack(client.number, arena.width, arena.height,
+                                     TICK_RATE // self.snapshot_every, len(arena.barriers))
+        self.send(client, net_packet(NET_WELCOME, info + self.welcome))
+
+    def send(self, client, packet):
+        client.bytes_sent += len(packet)
+        try:
+            self.sock.sendto(packet, client.address)
+        except OSError as e:
+            event_log.emit('net_send_failed', 'warning', client=client.number, error=str(e))
+
+    def receive(self, now):
+        """ Handles every datagram waiting on the socket. """
+        while True:
+            try:
+                data, address = self.sock.recvfrom(65536)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            kind, payload = net_unpack(data)
+            client = self.clients.get(address)
+            if kind == NET_HELLO:
+                if client is None:
+                    taken = {c.number for c in self.clients.values()}
+                    free = [n for n in range(1, NET_MAX_PLAYERS + 1) if n not in taken]
+                    if not free:
+                        event_log.emit('net_refused', 'warning', address=f"{address[0]}:{address[1]}")
+                        continue
+                    client = self.clients[address] = NetClient(address, free[0], now)
+                    event_log.emit('net_join', player=client.number, address=f"{address[0]}:{address[1]}")
+                    self.spawn(client)
+                else:
+                    self.send_welcome(client) # Our welcome was lost
+            elif client is None:
+                continue
+            elif kind == NET_INPUT and len(payload) >= NET_INPUT_INFO.size:
+                seq, acked, buttons, clicks, aim_x, aim_y = NET_INPUT_INFO.unpack_from(payload)
+                if seq > client.input_seq: # Drop late, reordered input
+                    client.input_seq, client.buttons, client.aim = seq, buttons, (aim_x, aim_y)
+                    if client.clicks is not None and clicks != client.clicks:
+                        client.fire = True
+                    client.clicks = clicks
+                    if acked in client.sent:
+                        client.acked = max(client.acked, acked)
+            elif kind == NET_BYE:
+                self.drop(client, 'bye')
+                continue
+            client.last_heard = now
+
+    def drop(self, client, reason):
+        event_log.emit('net_leave', player=client.number, reason=reason)
+        if client.player is not None:
+            client.player.kill()
+        del self.clients[client.address]
+
+    def apply_inputs(self, now):
+        state = self.state
+        for client in self.clients.values():
+            player = client.player
+            if player is None or not player.alive():
+                continue
+            if client.buttons & NET_UP: player.move_up()
+            if client.buttons & NET_DOWN: player.move_down()
+            if client.buttons & NET_LEFT: player.move_left()
+            if client.buttons & NET_RIGHT: player.move_right()
+            if client.aim is not None:
+                player.aim_target = client.aim
+            if client.fire:
+                client.fire = False
+                player.shoot(state.all_sprites, state.player_bullets, now)
+
+    def view(self):
+        """ Bounding box of every client's screen, for spawns and enemy activity. """
+        view = None
+        for client in self.clients.values():
+            if client.player is not None:
+                screen = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+                screen.center = client.player.rect.center
+                view = screen if view is None else view.union(screen)
+        return (view or pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)).clamp(world)
+
+    def net_id(self, sprite):
+        net_id = getattr(sprite, 'net_id', None)
+        if net_id is None:
+            if not self.net_ids:
+                self.release_ids()
+                if not self.net_ids:
+                    raise RuntimeError(f"More than {NET_MAX_ID} entities on the network at once")
+            net_id = sprite.net_id = self.net_ids.popleft()
+            self.net_owners[net_id] = sprite
+        return net_id
+
+    def release_ids(self):
+        """
+        Frees the net ids of sprites that have left the game. They join the back of the free list,
+        so an id is only reused after every other free one, long after clients forgot the old sprite.
+        """
+        released = [net_id for net_id, sprite in self.net_owners.items() if not sprite.alive()]
+        for net_id in released:
+            self.net_owners.pop(net_id).net_id = None # Should the sprite come back, it gets a new id
+        self.net_ids.extend(released)
+
+    def records(self, client):
+        """ {net id: quantised record} of everything near the client's player (every player always). """
+        state = self.state
+        area = pygame.Rect(0, 0, SCREEN_WIDTH + NET_INTEREST_MARGIN * 2, SCREEN_HEIGHT + NET_INTEREST_MARGIN * 2)
+        area.center = client.player.rect.center
+        records = {}
+        for player in state.players:
+            records[self.net_id(player)] = entity_record(player, NET_KIND_PLAYER, player.number, player.angle)
+        for enemy in state.index.query(area):
+            if enemy.alive():
+                records[self.net_id(enemy)] = entity_record(enemy, NET_ENEMY_KINDS[enemy.type],
+                                                            int(100 * enemy.health / enemy.max_health), enemy.angle)
+        for bullet in state.player_bullets.sprites() + state.enemy_bullets.sprites():
+            if area.colliderect(bullet.rect):
+                records[self.net_id(bullet)] = entity_record(bullet, NET_KIND_BULLET, NET_BULLET_COLORS.index(bullet.color))
+        for powerup in state.powerups:
+            if area.colliderect(powerup.rect):
+                kind = NET_KIND_AMMO if powerup.type == 'ammo' else NET_KIND_HEALTH
+                records[self.net_id(powerup)] = entity_record(powerup, kind)
+        return records
+
+    def send_snapshot(self, client):
+        state = self.state
+        records = self.records(client)
+        base = client.sent.get(client.acked) if client.acked else None
+        base_tick = client.acked if base is not None else 0
+        base = base or {}
+        changed = [(net_id, record) for net_id, record in records.items() if base.get(net_id) != record]
+        removed = [net_id for net_id in base if net_id not in records]
+        zones = state.active_bombardment_zones
+        player = client.player
+        flags = (NET_GAME_OVER if state.game_over else 0) | (NET_WIN if state.win else 0) | \
+                (NET_BOMBARDMENT if zones else 0)
+        body = [NET_SNAPSHOT_INFO.pack(state.tick, base_tick, state.current_time, state.score, state.wave_number,
+                                       flags, client.number, int(max(0, player.health)), player.ammo,
+                                       len(changed), len(removed), len(zones))]
+        body += [struct.pack('<HH', int(z.center.x), int(z.center.y)) for z in zones]
+        body += [NET_ENTITY.pack(net_id, *record) for net_id, record in changed]
+        body.append(struct.pack(f'<{len(removed)}H', *removed))
+        packet = net_packet(NET_SNAPSHOT, zlib.compress(b''.join(body), 1))
+        if len(packet) > NET_MAX_DATAGRAM:
+            event_log.emit('net_snapshot_too_large', 'warning', client=client.number, size=len(packet))
+            return
+        client.sent[state.tick] = records
+        if len(client.sent) > NET_HISTORY:
+            del client.sent[min(client.sent)]
+        self.send(client, packet)
+
+    def stats(self, interval_ticks):
+        bandwidth = {client.number: round(client.bytes_sent * 1000 / NET_STATS_INTERVAL) for client in self.clients.values()}
+        event_log.emit('net_stats', clients=len(self.clients), tick_ms=round(self.tick_ms / interval_ticks, 3),
+                       snapshot_ms=round(self.encode_ms / interval_ticks, 3), bytes_per_sec=bandwidth,
+                       enemies=len(self.state.enemies))
+        for client in self.clients.values():
+            client.bytes_sent = 0
+        self.tick_ms = self.encode_ms = 0.0
+
+def run_server(args, level_pack, horde):
+    """ Runs the authoritative server until interrupted. """
+    # Headless: no SDL subsystem is started, the simulation only needs plain surfaces and masks
+    server = NetServer(args.bind, args.port, args.snapshot_rate)
+    event_log.emit('net_listen', address=f"{args.bind}:{args.port}", snapshot_rate=TICK_RATE // server.snapshot_every)
+    new_arena = lambda: level_pack.random_arena() if level_pack else generate_arena(None, *args.world)
+    server.new_game(new_arena(), horde)
+    clock = pygame.time.Clock()
+    stats_ticks = NET_STATS_INTERVAL * TICK_RATE // 1000
+    restart_at = None
+    try:
+        while True:
+            clock.tick(TICK_RATE)
+            state = server.state
+            now = int(time.perf_counter() * 1000) # Wall clock: game time restarts with every game
+            server.receive(now)
+            for client in list(server.clients.values()):
+                if now - client.last_heard > NET_TIMEOUT:
+                    server.drop(client, 'timeout')
+            if not server.clients: # Nobody to play for: idle (and start afresh for the next player)
+                if state.tick:
+                    server.new_game(new_arena(), horde)
+                pygame.time.wait(50)
+                continue
+            if restart_at is not None and state.current_time >= restart_at:
+                restart_at = None
+                server.new_game(new_arena(), horde)
+                state = server.state
+            tick_start = time.perf_counter()
+            if restart_at is None:
+                server.apply_inputs(state.current_time)
+            current_time = state.advance_clock()
+            event_log.now = current_time
+            if restart_at is None and not simulate_tick(state, current_time, server.view()):
+                restart_at = current_time + NET_RESTART_DELAY
+            tick_end = time.perf_counter()
+            server.tick_ms += (tick_end - tick_start) * 1000
+            if state.tick % server.snapshot_every == 0:
+                for client in server.clients.values():
+                    if client.player is not None:
+                        server.send_snapshot(client)
+                server.release_ids()
+                server.encode_ms += (time.perf_counter() - tick_end) * 1000
+            if state.tick % stats_ticks == 0:
+                server.stats(stats_ticks)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.sock.close()
+
+class NetView:
+    """ Client-side world: the decoded snapshots (newest last) and their interpolation. """
+    def __init__(self):
+        self.snapshots = deque(maxlen=NET_HISTORY) # (game time, {net id: record}, info)
+        self.by_tick = {}
+        self.arrival = 0 # Local ms the newest snapshot arrived
+        self.bytes_received = 0
+
+    def decode(self, payload, local_now):
+        """ Applies one snapshot packet; returns the entities it removed, or None if it could not be used. """
+        body = zlib.decompress(payload)
+        info = NET_SNAPSHOT_INFO.unpack_from(body)
+        tick, base_tick, game_time = info[:3]
+        changed, removed, zone_count = info[-3:]
+        if self.snapshots and tick <= self.snapshots[-1][2][0]:
+            return None # Late or duplicate
+        base = self.by_tick.get(base_tick, {}) if base_tick else {}
+        if base_tick and base_tick not in self.by_tick:
+            return None # Baseline already forgotten; the server falls back to a full snapshot
+        offset = NET_SNAPSHOT_INFO.size
+        zones = [struct.unpack_from('<HH', body, offset + i * 4) for i in range(zone_count)]
+        offset += zone_count * 4
+        entities = dict(base)
+        for _ in range(changed):
+            net_id, *record = NET_ENTITY.unpack_from(body, offset)
+            entities[net_id] = tuple(record)
+            offset += NET_ENTITY.size
+        gone = struct.unpack_from(f'<{removed}H', body, offset)
+        lost = {net_id: entities.pop(net_id) for net_id in gone if net_id in entities}
+        self.snapshots.append((game_time, entities, info, zones))
+        self.by_tick[tick] = entities
+        if len(self.by_tick) > NET_HISTORY:
+            del self.by_tick[min(self.by_tick)]
+        self.arrival = local_now
+        return lost
+
+    def latest(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+    def interpolated(self, local_now):
+        """ {net id: (kind, x, y, angle in degrees, extra)} at NET_INTERP_DELAY behind the server. """
+        if not self.snapshots:
+            return {}
+        render_time = self.snapshots[-1][0] + (local_now - self.arrival) - NET_INTERP_DELAY
+        older = newer = self.snapshots[-1]
+        for snapshot in reversed(self.snapshots):
+            if snapshot[0] <= render_time:
+                older = snapshot
+                break
+            newer = older = snapshot
+        span = newer[0] - older[0]
+        t = min(1.0, max(0.0, (render_time - older[0]) / span)) if span else 0.0
+        result = {}
+        for net_id, (kind, x, y, angle, extra) in older[1].items():
+            degrees = angle * 360 / 256
+            after = newer[1].get(net_id)
+            if after is not None and after[0] == kind:
+                x += (after[1] - x) * t
+                y += (after[2] - y) * t
+                degrees += angle_diff(after[3] * 360 / 256, degrees) * t
+            result[net_id] = (kind, x, y, degrees, extra)
+        return result
+
+def net_sprite_image(kind, angle, extra):
+    if kind == NET_KIND_PLAYER:
+        return rotated_tank_image(PLAYER_SIZE, NET_PLAYER_COLORS[(extra - 1) % len(NET_PLAYER_COLORS)], angle)
+    if kind == NET_KIND_BULLET:
+        return bullet_image(NET_BULLET_COLORS[extra])
+    if kind in (NET_KIND_AMMO, NET_KIND_HEALTH):
+        return _image_cache.get(('powerup', 'ammo' if kind == NET_KIND_AMMO else 'health'))
+    data = list(ENEMY_TYPES.values())[kind - 1]
+    return rotated_tank_image(data['size'], data['color'], angle)
+
+def run_client(args):
+    """ Connects to a server, sends input every frame and draws the interpolated snapshots. """
+    host, port = parse_address(args.connect, args.port)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    init_pygame()
+    display = Display(args.window, args.render_scale, args.fullscreen)
+    screen = display.canvas
+    pygame.display.set_caption(f"Tank Mayhem - {host}:{port}")
+    clock = pygame.time.Clock()
+    prebake_assets() # Also the power-up images, which the client never constructs itself
+    particles, all_sprites = pygame.sprite.Group(), pygame.sprite.Group()
+    arena = number = None
+    net = NetView()
+    camera = Camera()
+    seq = clicks = 0
+    next_hello = 0
+    stats_start, stats_bytes, kbps = 0, 0, 0.0
+    running = True
+    while running:
+        clock.tick(TICK_RATE)
+        local_now = int(time.perf_counter() * 1000)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                clicks = (clicks + 1) & 255
+
+        # --- Receive ---
+        while True:
+            try:
+                data = sock.recv(65536)
+            except (BlockingIOError, ConnectionRefusedError, ConnectionResetError):
+                break
+            stats_bytes += len(data)
+            kind, payload = net_unpack(data)
+            if kind == NET_WELCOME:
+                number, width, height, rate, count = NET_WELCOME_INFO.unpack_from(payload)
+                flat = struct.unpack(f'<{count * 4}H', zlib.decompress(payload[NET_WELCOME_INFO.size:]))
+                barriers = [flat[i:i + 4] for i in range(0, len(flat), 4)]
+                if arena is None or arena.barriers != [tuple(b) for b in barriers] or arena.size != (width, height):
+                    arena = Arena(None, barriers, width=width, height=height)
+                    world.size = arena.size
+                net = NetView() # New game: old baselines are meaningless
+                event_log.emit('net_welcome', player=number, snapshot_rate=rate)
+            elif kind == NET_SNAPSHOT and arena is not None:
+                lost = net.decode(payload, local_now)
+                for kind, x, y, angle, extra in (lost or {}).values():
+                    # Tanks and bullets that vanish on screen were destroyed; off-screen ones just left our area
+                    if kind not in (NET_KIND_AMMO, NET_KIND_HEALTH) and camera.view.collidepoint(x, y):
+                        create_explosion((x, y), all_sprites, particles)
+
+        # --- Send ---
+        if arena is None:
+            if local_now >= next_hello:
+                sock.sendto(net_packet(NET_HELLO), (host, port))
+                next_hello = local_now + 500
+        else:
+            keys = pygame.key.get_pressed()
+            buttons = (NET_UP if keys[pygame.K_w] else 0) | (NET_DOWN if keys[pygame.K_s] else 0) | \
+                      (NET_LEFT if keys[pygame.K_a] else 0) | (NET_RIGHT if keys[pygame.K_d] else 0)
+            aim_x, aim_y = camera.to_world(display.to_screen(pygame.mouse.get_pos()))
+            latest = net.latest()
+            seq += 1
+            sock.sendto(net_packet(NET_INPUT, NET_INPUT_INFO.pack(seq, latest[2][0] if latest else 0, buttons, clicks,
+                                                                 max(0, aim_x), max(0, aim_y))), (host, port))
+        if local_now - stats_start >= 1000:
+            kbps = stats_bytes * 8 / (local_now - stats_start)
+            stats_start, stats_bytes = local_now, 0
+
+        # --- Draw ---
+        latest = net.latest()
+        if arena is None or latest is None:
+            screen.fill(BLACK)
+            screen.blits(scale_blits([(text_surface(f"Connecting to {host}:{port}...", 30), (20, 20))], display.scale))
+            display.present()
+            continue
+        entities = net.interpolated(local_now)
+        info = latest[2]
+        for kind, x, y, angle, extra in entities.values():
+            if kind == NET_KIND_PLAYER and extra == info[6]:
+                camera.view.center = (int(x), int(y))
+                camera.view.clamp_ip(world)
+        view = camera.view
+        ox, oy = view.topleft
+        draw_tiles(screen, arena.chunks, view, display.scale)
+        sprites = []
+        for kind, x, y, angle, extra in sorted(entities.values(), key=lambda e: e[0] == NET_KIND_BULLET):
+            image = net_sprite_image(kind, angle, extra)
+            sprites.append((image, image.get_rect(center=(int(x) - ox, int(y) - oy))))
         particles.update()
-        powerups.update(current_time)
-
-        # Note: Walls and AmmoRefills don't have update methods, so they don't need calling.
-
-        # --- Collision Detection ---
-        # Player bullets hitting enemies
-        enemy_hits = pygame.sprite.groupcollide(player_bullets, enemies, True, False)
-        for bullet, enemies_hit_list in enemy_hits.items():
-            create_explosion(bullet.rect.center, all_sprites, particles)
-            for enemy in enemies_hit_list:
-                if enemy.take_damage(bullet.damage):
-                    score += enemy.score_value
-                    enemy.kill()
-
-        # Enemy bullets hitting player
-        if player.alive():
-            player_hits = pygame.sprite.spritecollide(player, enemy_bullets, True)
-            for bullet in player_hits:
-                create_explosion(bullet.rect.center, all_sprites, particles)
-                player.take_damage(bullet.damage)
-                if not player.alive():
-                    create_explosion(player.rect.center, all_sprites, particles)
-                    game_over = True # Set game_over flag
-                    print("GAME OVER - Player Destroyed")
-                    # Don't break here, let the loop finish naturally
-
-        # Bullets hitting walls
-        player_wall_hits = pygame.sprite.groupcollide(player_bullets, walls, True, False)
-        for bullet, _ in player_wall_hits.items(): create_explosion(bullet.rect.center, all_sprites, particles)
-        enemy_wall_hits = pygame.sprite.groupcollide(enemy_bullets, walls, True, False)
-        for bullet, _ in enemy_wall_hits.items(): create_explosion(bullet.rect.center, all_sprites, particles)
-
-        # --- Player hitting Powerups --- (Check type)
-        if player.alive():
-            collected_powerups = pygame.sprite.spritecollide(player, powerups, True) # True kills powerup
-            if collected_powerups:
-                for powerup in collected_powerups:
-                    if powerup.type == 'ammo':
-                        player.ammo = PLAYER_MAX_AMMO
-                        print(f"Player collected AMMO! Ammo refilled to {player.ammo}")
-                    elif powerup.type == 'health':
-                        player.health = PLAYER_MAX_HEALTH
-                        print(f"Player collected HEALTH! Health restored to {player.health}")
-
-                    # Reset spawn timer regardless of type collected
-                    next_powerup_spawn_time = current_time + POWERUP_RESPAWN_TIME
-                    # Add score? Optional
-
-        # --- NEW: Bombardment Zone Damage Logic ---
-        if active_bombardment_zones:
-            player_was_hit = False # Prevent multiple hits per frame
-            # Check Player
+        sprites += [(p.image, p.rect.move(-ox, -oy)) for p in particles]
+        screen.blits(scale_blits(sprites, display.scale), False)
+        if latest[3]:
+            zones = [BombardmentZone(x, y, 0) for x, y in latest[3]]
+            draw_bombardment_zones(screen, zones, 'overlay', view.topleft, display.scale)
+
+        # --- HUD --- (tick, base, time, score, wave, flags, number, health, ammo, ...)
+        hud = [(text_surface(f"Score: {info[3]}", 24), (15, 15)),
+               (text_surface(f"HP: {info[7]}/{PLAYER_MAX_HEALTH}", 24, WHITE if info[7] > 0 else RED), (15, 40)),
+               (text_surface(f"Ammo: {info[8]}/{PLAYER_MAX_AMMO}", 24), (15, 65)),
+               (text_surface(f"Wave: {info[4]}", 24), (SCREEN_WIDTH - 120, 15)),
+               (text_surface(f"Player {info[6]} | {kbps:.0f} kbit/s", 20), (SCREEN_WIDTH - 180, SCREEN_HEIGHT - 25))]
+        if info[5] & NET_GAME_OVER:
+            hud.append((text_surface("GAME OVER - next game starting soon", 36, RED), (SCREEN_WIDTH // 2 - 230, SCREEN_HEIGHT // 2)))
+        screen.blits(scale_blits(hud, display.scale))
+        display.present()
+
+    if arena is not None:
+        sock.sendto(net_packet(NET_BYE), (host, port))
+    sock.close()
+    pygame.quit()
+
+# --- Replays ---
+# A replay is the player's input for every tick; the fixed-step simulation turns it back into
+# the same game. Every REPLAY_KEYFRAME_INTERVAL ticks a snapshot (keyframe) starts a new
+# segment, and an index of segments and wave starts is appended when the game ends, so seeking
+# restores the nearest keyframe and simulates at most one interval forward. The file is
+# memory-mapped and only the keyframe being restored is decoded. Without an index (the game
+# crashed) the segments are walked instead; wave starts are then known to the nearest keyframe.
+# The game's RNG is reseeded at every keyframe, which therefore stores a 4-byte seed instead of
+# the 2.5 KB generator state (most of a compressed snapshot).
+# Header:  magic, version, tick rate, keyframe interval, JSON length, JSON (horde settings)
+# Segment: keyframe tick, keyframe length, input count, wave, seed; keyframe; input records
+# Index:   segment offsets, then (wave, first tick) per wave
+# Trailer: index offset, segment count, wave count, magic
+REPLAY_MAGIC = b'TMRP'
+REPLAY_INDEX_MAGIC = b'TMRI'
+REPLAY_VERSION = 1
+REPLAY_KEYFRAME_INTERVAL = 60 # Ticks between keyframes (1s); a seek simulates at most this many
+REPLAY_SEEK_STEP = 5 * TICK_RATE # Ticks the viewer's arrow keys jump
+REPLAY_HEADER = struct.Struct('<4sHHHI')
+REPLAY_SEGMENT = struct.Struct('<IIIHI')
+REPLAY_INPUT = struct.Struct('<bbiiBB') # move x, move y, aim x, aim y, fired, quality tier
+REPLAY_OFFSET = struct.Struct('<Q')
+REPLAY_WAVE = struct.Struct('<HI')
+REPLAY_TRAILER = struct.Struct('<QII4s')
+
+def replay_path(path, game):
+    """ Where game number `game` of a session is recorded: path itself, then path-2, path-3... """
+    if game == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{game}{ext}"
+
+class ReplayRecorder:
+    """ Writes the running game to a replay file: a keyframe and input records per segment. """
+    def __init__(self, path, state, horde=None, interval=REPLAY_KEYFRAME_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.file = open(path, 'wb')
+        header = json.dumps({'horde': vars(horde) if horde else None}).encode()
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, TICK_RATE, interval, len(header)) + header)
+        self.segments = [] # [offset, keyframe tick, keyframe length, input count, wave, seed] of written segments
+        self.waves = [] # (wave, first tick)
+        self.wave = state.wave_number
+        self.start_segment(state)
+
+    def start_segment(self, state, snap=None):
+        """ Starts a segment at state.tick; snap may be a snapshot of this tick that was already taken. """
+        snap = snap or take_snapshot(state)
+        keyframe = Snapshot()
+        for name in Snapshot.__slots__:
+            setattr(keyframe, name, getattr(snap, name))
+        keyframe.rng_state = None
+        self.tick = state.tick
+        self.wave_at_keyframe = state.wave_number
+        self.seed = random.getrandbits(32)
+        random.seed(self.seed)
+        self.keyframe = snapshot_to_bytes(keyframe)
+        self.inputs = bytearray()
+
+    def write_segment(self):
+        count = len(self.inputs) // REPLAY_INPUT.size
+        offset = self.file.tell()
+        self.file.write(REPLAY_SEGMENT.pack(self.tick, len(self.keyframe), count, self.wave_at_keyframe, self.seed))
+        self.file.write(self.keyframe)
+        self.file.write(self.inputs)
+        self.file.flush()
+        self.segments.append([offset, self.tick, len(self.keyframe), count, self.wave_at_keyframe, self.seed])
+
+    def input(self, player, fired):
+        """ Records the input applied this tick: call after the clock advances, before the tick runs. """
+        self.inputs += REPLAY_INPUT.pack((player.vel_x > 0) - (player.vel_x < 0), (player.vel_y > 0) - (player.vel_y < 0),
+                                         *player.aim_target, fired, quality.tier)
+
+    def capture(self, state, snap=None):
+        """ After each tick: notes wave starts, and starts a new segment on the keyframe interval. """
+        if state.wave_number != self.wave:
+            self.wave = state.wave_number
+            self.waves.append((self.wave, state.tick))
+        if state.tick % self.interval == 0:
+            self.write_segment()
+            self.start_segment(state, snap)
+
+    def rewind(self, state):
+        """ The game was rewound to state.tick: forgets everything recorded after it. """
+        tick = state.tick
+        self.waves = [(wave, start) for wave, start in self.waves if start <= tick]
+        self.wave = state.wave_number
+        if self.tick < tick: # Still inside the current segment (its keyframe tick reseeded after the rewind snapshot)
+            del self.inputs[(tick - self.tick) * REPLAY_INPUT.size:]
+            return
+        while self.segments and self.segments[-1][1] >= tick:
+            self.file.truncate(self.segments.pop()[0])
+        if self.segments: # Cut the segment that runs past tick short
+            segment = self.segments[-1]
+            offset, start, size, count = segment[:4]
+            if start + count > tick:
+                segment[3] = tick - start
+                self.file.seek(offset)
+                self.file.write(REPLAY_SEGMENT.pack(*segment[1:]))
+                self.file.truncate(offset + REPLAY_SEGMENT.size + size + segment[3] * REPLAY_INPUT.size)
+        self.file.seek(0, os.SEEK_END)
+        self.start_segment(state)
+
+    def close(self):
+        """ Writes the last segment, the index and the trailer. """
+        self.write_segment()
+        index_offset = self.file.tell()
+        self.file.write(b''.join(REPLAY_OFFSET.pack(segment[0]) for segment in self.segments))
+        self.file.write(b''.join(REPLAY_WAVE.pack(*wave) for wave in self.waves))
+        self.file.write(REPLAY_TRAILER.pack(index_offset, len(self.segments), len(self.waves), REPLAY_INDEX_MAGIC))
+        self.file.close()
+        event_log.emit('replay_saved', path=self.path, ticks=self.tick + len(self.inputs) // REPLAY_INPUT.size,
+                       keyframes=len(self.segments), bytes=os.path.getsize(self.path))
+
+class Replay:
+    """ Memory-mapped, read-only replay file; seeks decode one keyframe and simulate forward. """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rate, self.interval, header_len = REPLAY_HEADER.unpack_from(self._map, 0)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a version {REPLAY_VERSION} replay")
+        if rate != TICK_RATE:
+            raise ValueError(f"{path} was recorded at {rate} ticks per second")
+        start = REPLAY_HEADER.size + header_len
+        info = json.loads(self._map[REPLAY_HEADER.size:start])
+        self.horde = None
+        if info['horde']:
+            self.horde = HordeConfig()
+            vars(self.horde).update(info['horde'])
+        index_offset, count, wave_count, magic = REPLAY_TRAILER.unpack_from(self._map, len(self._map) - REPLAY_TRAILER.size)
+        if magic == REPLAY_INDEX_MAGIC:
+            offsets = [o for (o,) in REPLAY_OFFSET.iter_unpack(self._map[index_offset:index_offset + count * REPLAY_OFFSET.size])]
+            wave_start = index_offset + count * REPLAY_OFFSET.size
+            self.waves = list(REPLAY_WAVE.iter_unpack(self._map[wave_start:wave_start + wave_count * REPLAY_WAVE.size]))
+        else: # Unfinished recording
+            offsets = self._walk(start)
+        self.segments = [] # (offset, keyframe tick, keyframe length, input count, seed)
+        for offset in offsets:
+            tick, size, inputs, wave, seed = REPLAY_SEGMENT.unpack_from(self._map, offset)
+            self.segments.append((offset, tick, size, inputs, seed))
+        if not self.segments:
+            raise ValueError(f"{path} has no complete segment")
+        self.ticks = [segment[1] for segment in self.segments]
+        self.first_tick = self.ticks[0]
+        self.last_tick = self.ticks[-1] + self.segments[-1][3]
+
+    def _walk(self, offset):
+        """ Offsets of the complete segments from offset on; wave starts are taken from the keyframes. """
+        offsets = []
+        self.waves = []
+        while offset + REPLAY_SEGMENT.size <= len(self._map):
+            tick, size, inputs, wave, seed = REPLAY_SEGMENT.unpack_from(self._map, offset)
+            end = offset + REPLAY_SEGMENT.size + size + inputs * REPLAY_INPUT.size
+            if end > len(self._map):
+                break
+            offsets.append(offset)
+            if wave and (not self.waves or self.waves[-1][0] != wave):
+                self.waves.append((wave, tick))
+            offset = end
+        return offsets
+
+    def keyframe(self, i, arena=None):
+        """ Decodes keyframe i straight from the mapped file. """
+        offset, tick, size, inputs, seed = self.segments[i]
+        start = offset + REPLAY_SEGMENT.size
+        return snapshot_from_bytes(self._map[start:start + size], arena)
+
+    def apply(self, state):
+        """ Advances the clock and applies the recorded input for the new tick; returns the game time. """
+        tick = state.tick
+        offset, start, size, inputs, seed = self.segments[bisect.bisect_right(self.ticks, tick) - 1]
+        if tick == start: # The recording reseeded here
+            random.seed(seed)
+        move_x, move_y, aim_x, aim_y, fired, tier = REPLAY_INPUT.unpack_from(
+            self._map, offset + REPLAY_SEGMENT.size + size + (tick - start) * REPLAY_INPUT.size)
+        current_time = state.advance_clock()
+        event_log.now = current_time
+        if tier != quality.tier:
+            quality.set_tier(tier)
+        player = state.player
+        if fired and player.alive():
+            player.shoot(state.all_sprites, state.player_bullets, current_time)
+        player.aim_target = (aim_x, aim_y)
+        player.vel_x, player.vel_y = move_x * PLAYER_SPEED, move_y * PLAYER_SPEED
+        return current_time
+
+    def seek(self, state, camera, tick):
+        """ Puts state (and camera) at tick: restores the nearest keyframe before it and simulates forward. """
+        tick = max(self.first_tick, min(self.last_tick, tick))
+        i = bisect.bisect_right(self.ticks, tick) - 1
+        restore_snapshot(state, self.keyframe(i, state.arena))
+        camera.follow(state.player.rect, world)
+        while state.tick < tick:
+            current_time = self.apply(state)
+            simulate_tick(state, current_time, camera.view)
+            if state.player.alive():
+                camera.follow(state.player.rect, world)
+
+    def wave_tick(self, wave):
+        """ The tick wave started on, or None if the replay does not reach it. """
+        for number, tick in self.waves:
+            if number == wave:
+                return tick
+        return None
+
+    def start_tick(self, spec):
+        """ The tick a --replay-start spec ('wave:N' or seconds of game time) refers to. """
+        if spec is None:
+            return self.first_tick
+        if spec.startswith('wave:'):
+            tick = self.wave_tick(int(spec[5:]))
+            if tick is None:
+                raise ValueError(f"{self.path} does not reach {spec}")
+            return tick
+        return int(float(spec) * TICK_RATE)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+def replay_clock(tick):
+    seconds = tick // TICK_RATE
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def run_replay(args):
+    """ Plays a replay in a window: Space pauses, Left/Right jump 5s, PgUp/PgDn and 1-9 pick a wave. """
+    replay = Replay(args.replay)
+    init_pygame()
+    display = Display(args.window, args.render_scale, args.fullscreen)
+    screen = display.canvas
+    pygame.display.set_caption(f"Tank Mayhem - Replay {os.path.basename(args.replay)}")
+    clock = pygame.time.Clock()
+    prebake_assets()
+    if not args.mute:
+        audio.start(args.sound_dir)
+    quality.enabled = False # Tiers come from the recording
+    state = setup_game(replay.keyframe(0).arena, None, replay.horde)
+    camera = Camera()
+    replay.seek(state, camera, replay.start_tick(args.replay_start))
+    frame = hud_blits = None
+    paused = False
+    running = True
+    while running:
+        clock.tick(TICK_RATE)
+        target = None
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                key = event.key
+                if key in (pygame.K_ESCAPE, pygame.K_q):
+                    running = False
+                elif key == pygame.K_SPACE:
+                    paused = not paused
+                elif key == pygame.K_RIGHT:
+                    target = state.tick + REPLAY_SEEK_STEP
+                elif key == pygame.K_LEFT:
+                    target = state.tick - REPLAY_SEEK_STEP
+                elif key == pygame.K_HOME:
+                    target = replay.first_tick
+                elif key == pygame.K_PAGEDOWN: # Next wave start
+                    target = next((tick for _, tick in replay.waves if tick > state.tick), None)
+                elif key == pygame.K_PAGEUP: # Start of this wave, or the previous one when just past it
+                    target = next((tick for _, tick in reversed(replay.waves) if tick < state.tick - TICK_RATE), replay.first_tick)
+                elif pygame.K_1 <= key <= pygame.K_9:
+                    target = replay.wave_tick(key - pygame.K_0)
+        if target is not None:
+            seek_start = time.perf_counter()
+            replay.seek(state, camera, target)
+            audio.pending.clear() # Not the effects of the ticks simulated to get there
+            event_log.emit('replay_seek', tick=state.tick, ms=round((time.perf_counter() - seek_start) * 1000, 1))
+            frame = hud_blits = None
+        if not paused and state.tick < replay.last_tick:
+            frame, _, _ = step_and_capture(state, replay.apply(state), camera, hud_blits)
+            hud_blits = frame.hud
+        elif frame is None:
+            frame = capture_frame(state, camera, build_hud(state, state.current_time))
+        draw_frame(screen, frame, display.scale)
+        status = (f"REPLAY {replay_clock(state.tick)} / {replay_clock(replay.last_tick)}"
+                  f"{'  PAUSED' if paused else ''}  |  Space pause  Left/Right 5s  PgUp/PgDn or 1-9 wave")
+        screen.blits(scale_blits([(text_surface(status, 20), (10, SCREEN_HEIGHT - 22))], display.scale))
+        display.present()
+        audio.flush(frame.view)
+    replay.close()
+    pygame.quit()
+
+# --- Frame Export ---
+# Turns a replay into video frames without a window: the replay is simulated tick by tick as
+# fast as it goes and every EXPORT_EVERY-th tick is drawn by the usual render path (the game's
+# HUD included, the viewer's status line not) into a canvas at the export scale. Frames are
+# written as numbered PNGs or as one raw RGB stream on stdout for an encoder. PNG compression is
+# the slow part and releases the GIL, so it runs on a thread per CPU with a bounded backlog;
+# each job saves its own copy of the canvas.
+EXPORT_FILENAME = 'frame_{:06d}.png'
+EXPORT_BACKLOG = 2 # PNG jobs queued per encoder thread before the simulation waits
+
+def export_frames(args):
+    """ Writes the frames of --replay to --export-frames (a directory, or - for raw RGB on stdout). """
+    replay = Replay(args.replay)
+    pygame.font.init() # No display: the canvas is a plain surface
+    prebake_assets()
+    quality.enabled = False # Tiers come from the recording
+    state = setup_game(replay.keyframe(0).arena, None, replay.horde)
+    camera = Camera()
+    replay.seek(state, camera, replay.start_tick(args.replay_start))
+    end = replay.last_tick
+    if args.export_seconds is not None:
+        end = min(end, state.tick + int(args.export_seconds * TICK_RATE))
+    scale = args.export_scale
+    canvas = new_surface((math.ceil(SCREEN_WIDTH * scale), math.ceil(SCREEN_HEIGHT * scale)))
+    stream = sys.stdout.buffer if args.export_frames == '-' else None
+    encoders = jobs = None
+    if stream is None:
+        os.makedirs(args.export_frames, exist_ok=True)
+        workers = os.cpu_count() or 1
+        encoders = ThreadPoolExecutor(workers, thread_name_prefix='png')
+        jobs = deque()
+    frames = 0
+    start = time.perf_counter()
+    first_tick = state.tick
+    frame = capture_frame(state, camera, build_hud(state, state.current_time))
+    try:
+        while True:
+            draw_frame(canvas, frame, scale)
+            if stream is not None:
+                stream.write(pygame.image.tobytes(canvas, 'RGB'))
+            else:
+                if len(jobs) >= workers * EXPORT_BACKLOG:
+                    jobs.popleft().result()
+                path = os.path.join(args.export_frames, EXPORT_FILENAME.format(frames))
+                jobs.append(encoders.submit(pygame.image.save, canvas.copy(), path))
+            frames += 1
+            if state.tick + args.export_every > end:
+                break
+            for _ in range(args.export_every - 1): # Skipped ticks are simulated but not drawn
+                simulate_tick(state, replay.apply(state), camera.view)
+                if state.player.alive():
+                    camera.follow(state.player.rect, world)
+            frame, _, _ = step_and_capture(state, replay.apply(state), camera, None)
+        if stream is not None:
+            stream.flush()
+    except BrokenPipeError: # The encoder stopped reading
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno()) # So the exit flush does not fail again
+        sys.stderr.write("Frame export: output closed early\n")
+    finally:
+        if encoders is not None:
+            for job in jobs:
+                job.result()
+            encoders.shutdown()
+        replay.close()
+    elapsed = time.perf_counter() - start
+    seconds = (state.tick - first_tick) / TICK_RATE
+    event_log.emit('frame_export', frames=frames, size=list(canvas.get_size()), game_s=round(seconds, 1),
+                   wall_s=round(elapsed, 2), fps=round(frames / elapsed, 1), realtime=round(seconds / elapsed, 1))
+    sys.stderr.write(f"Exported {frames} frames ({canvas.get_width()}x{canvas.get_height()}, "
+                     f"{TICK_RATE / args.export_every:g} fps) covering {seconds:.1f}s of play in {elapsed:.1f}s "
+                     f"({seconds / elapsed:.1f}x real time)\n")
+
+# --- Vector Environment ---
+# For training bots: VectorEnv runs num_envs headless games on worker processes (each owning a
+# contiguous range of them) and steps them all in parallel. Actions, observations, rewards,
+# done flags and episode info live in one shared-memory block, so a step is one short message
+# to each worker and the parent never receives a pickled frame. Observations are small RGB
+# frames of the player's view, drawn by the usual render path straight into the shared block
+# (each game's canvas is a Surface over its slice of it). A finished game is reset at once with
+# a new seed, seed + env + num_envs * episode, so every env and every episode plays differently.
+# With numpy installed the buffers are numpy arrays, otherwise multi-dimensional memoryviews.
+ENV_OBS_WIDTH = 96 # Observation frames are ENV_OBS_WIDTH wide, at the screen's 4:3 shape
+ENV_FRAME_SKIP = 4 # Ticks simulated per step, repeating the action
+ENV_MAX_STEPS = 4500 # Steps before an episode is cut off (5 minutes at ENV_FRAME_SKIP 4)
+ENV_DAMAGE_WEIGHT = 10 # Reward is score gained minus this per health point lost (a small tank is worth 10)
+ENV_ACTION_FIELDS = ('move_x', 'move_y', 'aim', 'fire') # -1..1, -1..1, degrees, fire if > 0.5
+ENV_INFO_FIELDS = ('score', 'health', 'ammo', 'wave', 'steps') # Of the episode just ended when done
+ENV_WORKER_START_METHOD = 'spawn' # Workers start clean instead of forking the parent's SDL state
+
+class EnvBuffers:
+    """ Where each of the vector env's arrays sits in its shared-memory block. """
+    def __init__(self, num_envs, obs_width=ENV_OBS_WIDTH):
+        self.num_envs = num_envs
+        self.obs_width = obs_width
+        self.obs_height = round(obs_width * SCREEN_HEIGHT / SCREEN_WIDTH)
+        self.layout = {}
+        offset = 0
+        for name, fmt, shape in (('actions', 'f', (num_envs, len(ENV_ACTION_FIELDS))),
+                                 ('rewards', 'f', (num_envs,)),
+                                 ('dones', 'B', (num_envs,)),
+                                 ('infos', 'd', (num_envs, len(ENV_INFO_FIELDS))),
+                                 ('observations', 'B', (num_envs, self.obs_height, obs_width, 3))):
+            offset = -(-offset // 8) * 8
+            nbytes = struct.calcsize(fmt) * math.prod(shape)
+            self.layout[name] = (offset, fmt, shape, nbytes)
+            offset += nbytes
+        self.size = offset
+
+    def view(self, buf, name):
+        offset, fmt, shape, nbytes = self.layout[name]
+        return buf[offset:offset + nbytes].cast(fmt, shape)
+
+    def array(self, numpy, buf, name):
+        offset, fmt, shape, _ = self.layout[name]
+        return numpy.ndarray(shape, dtype=fmt, buffer=buf, offset=offset)
+
+    def frame(self, buf, env):
+        """ The bytes of one env's observation frame. """
+        offset, _, _, _ = self.layout['observations']
+        size = self.obs_height * self.obs_width * 3
+        return buf[offset + env * size:offset + (env + 1) * size]
+
+class HeadlessGame:
+    """ One env inside a worker: a GameState driven by actions and rendered into its observation slice. """
+    def __init__(self, env, buffers, buf, config):
+        self.env = env
+        self.config = config
+        self.episode = 0
+        self.state = None
+        self.camera = Camera()
+        self.scale = buffers.obs_width / SCREEN_WIDTH
+        self.canvas = pygame.image.frombuffer(buffers.frame(buf, env), (buffers.obs_width, buffers.obs_height), 'RGB')
+        self.rng = None # This game's random state, swapped in while it runs
+        self.steps = self.last_score = self.last_health = 0
+
+    def reset(self):
+        config = self.config
+        seed = config['seed'] + self.env + config['num_envs'] * self.episode
+        self.episode += 1
+        random.seed(seed)
+        if config['level_pack']:
+            arena = config['level_pack'].random_arena()
+        else:
+            arena = generate_arena(seed, *config['world'])
+        self.state = setup_game(arena, self.state, config['horde'])
+        self.camera.follow(self.state.player.rect, world)
+        self.steps = self.last_score = 0
+        self.last_health = self.state.player.health
+        self.render()
+        self.rng = random.getstate()
+
+    def render(self):
+        draw_frame(self.canvas, capture_frame(self.state, self.camera, []), self.scale)
+
+    def step(self, action, rewards, dones, infos):
+        """ Runs ENV_FRAME_SKIP ticks of the action and fills in this env's reward, done and info (resetting if done). """
+        state, player, config = self.state, self.state.player, self.config
+        move_x, move_y, aim, fire = action
+        random.setstate(self.rng)
+        done = False
+        for _ in range(config['frame_skip']):
+            current_time = state.advance_clock()
             if player.alive():
-                player_pos = pygame.Vector2(player.rect.center)
-                for zone in active_bombardment_zones:
-                    if zone.collides_point(player_pos):
-                        if BOMBARDMENT_INSTANT_KILL:
-                            print("Player inside bombardment zone! Instant kill.")
-                            create_explosion(player.rect.center, all_sprites, particles)
-                            player.kill()
-                            game_over = True
-                            player_was_hit = True
-                            break # Stop checking zones for player
-                        # --- Optional: Damage Over Time ---
-                        # else:
-                        #     damage_this_frame = BOMBARDMENT_DAMAGE_PER_SECOND * delta_time
-                        #     player.take_damage(damage_this_frame)
-                        #     if not player.alive():
-                        #         create_explosion(player.rect.center, all_sprites, particles)
-                        #         game_over = True
-                        #         print("GAME OVER - Player Destroyed by Bombardment")
-                        #         player_was_hit = True
-                        #         break
-                        # --- End Optional DOT ---
-
-            # Check Enemies (Iterate over a copy in case of removal)
-            enemies_hit_this_frame = [] # Track enemies hit to avoid multi-hit
-            for enemy in enemies.sprites()[:]: # Iterate copy
-                 if enemy in enemies_hit_this_frame: continue # Already processed
-
-                 enemy_pos = pygame.Vector2(enemy.rect.center)
-                 for zone in active_bombardment_zones:
-                     if zone.collides_point(enemy_pos):
-                         if BOMBARDMENT_INSTANT_KILL:
-                             print(f"Enemy {enemy.type} in bombardment. Destroyed.")
-                             create_explosion(enemy.rect.center, all_sprites, particles)
-                             enemy.kill() # No score for bombardment kills
-                             enemies_hit_this_frame.append(enemy) # Mark as processed
-                             break # Stop checking zones for this enemy
-                         # --- Optional: Damage Over Time ---
-                         # else:
-                         #     # Implement DOT for enemies if desired
-                         #     enemy.take_damage(BOMBARDMENT_DAMAGE_PER_SECOND * delta_time)
-                         #     if enemy.health <= 0:
-                         #          create_explosion(enemy.rect.center, all_sprites, particles)
-                         #          enemy.kill()
-                         #          enemies_hit_this_frame.append(enemy)
-                         #          break
-                         # --- End Optional DOT ---
-
-        # --- Win/Loss Conditions Check ---
-        if not enemies and not win and not game_over: # Check win only if not already ended
-            win = True
-            print("YOU WIN! - All Enemies Destroyed")
-
-        # # Check if time ran out (and player hasn't won or already lost)
-        # if time_remaining <= 0 and not win and not game_over:
-            # print("GAME OVER - Time Ran Out!")
-            # game_over = True
-            # # Optionally kill player if timer runs out?
-            # if player.alive():
-                 # create_explosion(player.rect.center, all_sprites, particles)
-                 # player.kill()
-
-
-        # --- Check if game should end this frame ---
-        if game_over:
-            game_active = False # Exit the gameplay loop
-
-        # --- Drawing ---
-        screen.fill(GRASS_GREEN)
-        all_sprites.draw(screen)
-
-        # --- NEW: Draw Bombardment Zones ---
-        if active_bombardment_zones:
-            for zone in active_bombardment_zones:
-                zone.draw(screen)
-        # --- End Bombardment Drawing ---
-
-        # # --- NEW: Draw Safe Zone Circle ---
-        # # Use a surface for transparency
-        # circle_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        # current_circle_color = CIRCLE_COLOR
-        # # Optional: Warning color if player is close to edge
-        # if player.alive():
-            # player_dist_from_edge = circle_current_radius - player_pos.distance_to(circle_center)
-            # if 0 < player_dist_from_edge < PLAYER_SIZE * 3: # If within 3x player size of edge
-                 # current_circle_color = CIRCLE_WARNING_COLOR
-
-        # pygame.draw.circle(circle_surface, current_circle_color,
-                           # (int(circle_center_x), int(circle_center_y)),
-                           # int(circle_current_radius), CIRCLE_THICKNESS)
-        # screen.blit(circle_surface, (0,0))
-        # # --- End Circle Drawing ---
-
-        # --- Draw UI ---
-        draw_text(screen, f"Score: {score}", 24, 15, 15)
-        hp_color = WHITE if player.alive() else RED
-        draw_text(screen, f"HP: {max(0, player.health):.0f}/{PLAYER_MAX_HEALTH}", 24, 15, 40, hp_color) # Format HP as int
-        draw_text(screen, f"Ammo: {player.ammo}/{PLAYER_MAX_AMMO}", 24, 15, 65)
-
-        # # Draw Countdown Timer
-        # minutes = int(time_remaining / 1000 // 60)
-        # seconds = int(time_remaining / 1000 % 60)
-        # time_text = f"Time: {minutes:02d}:{seconds:02d}"
-        # time_color = YELLOW if time_remaining < 30000 else WHITE # Yellow warning under 30s
-        # draw_text(screen, time_text, 24, SCREEN_WIDTH - 150, 15, time_color) # Top-right
-
-        # --- NEW: Calculate and Draw Bombardment Timer ---
-        bombardment_timer_text = ""
-        bombardment_time_remaining_ms = 0
-        label = ""
-        timer_color = WHITE
-
-        if active_bombardment_zones:
-            # Bombardment is ACTIVE - show time until it ENDS
-            # Assuming all zones start at the same time, use the first one
-            end_time = active_bombardment_zones[0].spawn_time + BOMBARDMENT_DURATION
-            bombardment_time_remaining_ms = max(0, end_time - current_time)
-            label = "Bombardment End:"
-            if bombardment_time_remaining_ms < 3000: # Warning under 3s left
-                timer_color = YELLOW
+                if move_x < -0.5: player.move_left()
+                if move_x > 0.5: player.move_right()
+                if move_y < -0.5: player.move_up()
+                if move_y > 0.5: player.move_down()
+                rad = math.radians(aim)
+                player.aim_target = (player.rect.centerx + math.cos(rad) * 100, player.rect.centery + math.sin(rad) * 100)
+                if fire > 0.5:
+                    player.shoot(state.all_sprites, state.player_bullets, current_time)
+            if not simulate_tick(state, current_time, self.camera.view) or state.game_over:
+                done = True
+                break
+            if player.alive():
+                self.camera.follow(player.rect, world)
+        self.steps += 1
+        health = max(0, player.health)
+        rewards[self.env] = (state.score - self.last_score) - ENV_DAMAGE_WEIGHT * (self.last_health - health)
+        self.last_score, self.last_health = state.score, health
+        done = done or self.steps >= config['max_steps']
+        dones[self.env] = done
+        for i, value in enumerate((state.score, health, player.ammo, state.wave_number, self.steps)):
+            infos[self.env, i] = value
+        if done:
+            self.reset()
         else:
-            # Bombardment is INACTIVE (cooldown or before first) - show time until it STARTS
-            bombardment_time_remaining_ms = max(0, next_bombardment_time - current_time)
-            label = "Next Bombardment:"
-            if bombardment_time_remaining_ms < 5000 and next_bombardment_time > 0 : # Warning under 5s before start (ignore initial state)
-                 timer_color = YELLOW
-
-        # Format the time MM:SS
-        b_minutes = int(bombardment_time_remaining_ms / 1000 // 60) # Should always be 0 for short times, but good practice
-        b_seconds = int(bombardment_time_remaining_ms / 1000 % 60)
-        bombardment_timer_text = f"{label} {b_minutes:01d}:{b_seconds:02d}" # Use 1 digit for minutes if always 0
-
-        # Position in Top-Right
-        timer_x_pos = SCREEN_WIDTH //3 # Adjust X position as needed
-        timer_y_pos = 15             # Adjust Y position as needed
-        draw_text(screen, bombardment_timer_text, 24, timer_x_pos, timer_y_pos, timer_color)
-        # --- End Bombardment Timer ---
-
-        # --- Draw Wave Status / Timer --- (Revised Logic)
-        wave_timer_text = ""
-        wave_timer_color = WHITE
-        wave_timer_y_pos = 40 # Position below bombardment timer
-
-        # Check ACTIVE wave FIRST
-        if not waiting_for_next_wave and wave_number <= MAX_WAVES: # Check we haven't already won
-             enemies_left = len(enemies)
-             wave_timer_text = f"Wave: {wave_number}/{MAX_WAVES} | Left: {enemies_left}"
-             wave_timer_color = ORANGE
-        # Check if WAITING for next wave (and not won yet)
-        elif waiting_for_next_wave and wave_number < MAX_WAVES and not game_over: # Check game_over too
-             wave_time_remaining_ms = max(0, next_wave_time - current_time)
-             w_seconds = int(wave_time_remaining_ms / 1000 % 60)
-             wave_timer_text = f"Next Wave ({wave_number + 1}) in: {w_seconds}s"
-             if wave_time_remaining_ms < 3000: wave_timer_color = YELLOW
-        # Check if game is WON (highest priority after active)
-        elif win:
-             wave_timer_text = f"Survived {MAX_WAVES} Waves!"
-             wave_timer_color = GREEN
-        # Add a case for GAME OVER state during gameplay (optional)
-        elif game_over:
-             wave_timer_text = "Player Destroyed!"
-             wave_timer_color = RED
-
-        # Use same X position as bombardment timer, adjust Y
-        wave_timer_x_pos = SCREEN_WIDTH //2 # Reuse X position
-        if wave_timer_text: # Only draw if text is set
-             draw_text(screen, wave_timer_text, 24, wave_timer_x_pos, wave_timer_y_pos, wave_timer_color)
-        # --- End Wave Timer ---
+            self.render()
+            self.rng = random.getstate()
+
+def env_worker(connection, memory_name, num_envs, first, count, config):
+    """ Worker process: owns envs first..first + count - 1 and resets or steps them on request. """
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # The parent closes its workers on Ctrl+C
+    event_log.set_level('warning')
+    memory = shared_memory.SharedMemory(name=memory_name)
+    buffers = EnvBuffers(num_envs, config['obs_width'])
+    if config['level_pack']:
+        config['level_pack'] = LevelPack(config['level_pack'])
+    games = [HeadlessGame(env, buffers, memory.buf, config) for env in range(first, first + count)]
+    actions = buffers.view(memory.buf, 'actions')
+    rewards = buffers.view(memory.buf, 'rewards')
+    dones = buffers.view(memory.buf, 'dones')
+    infos = buffers.view(memory.buf, 'infos')
+    while True:
+        kind = connection.recv()
+        if kind == 'step':
+            for game in games:
+                game.step([actions[game.env, i] for i in range(len(ENV_ACTION_FIELDS))], rewards, dones, infos)
+        elif kind == 'reset':
+            for game in games:
+                game.reset()
+        else:
+            break
+        connection.send(True)
+    del games, game, actions, rewards, dones, infos # Let go of the shared block before closing it
+    memory.close()
+
+class VectorEnv:
+    """
+    num_envs headless games stepped in parallel on worker processes. reset() and step() return
+    views of the shared buffers: observations (num_envs, height, width, 3) uint8, rewards float32,
+    dones uint8 and infos (num_envs, len(ENV_INFO_FIELDS)) float64.
+    """
+    def __init__(self, num_envs, workers=None, obs_width=ENV_OBS_WIDTH, seed=0, horde=None,
+                 world_size=(SCREEN_WIDTH, SCREEN_HEIGHT), level_pack=None, frame_skip=ENV_FRAME_SKIP,
+                 max_steps=ENV_MAX_STEPS):
+        try:
+            import numpy
+        except ImportError: # Optional: the buffers are memoryviews without it
+            numpy = None
+        workers = max(1, min(num_envs, workers or os.cpu_count() or 1))
+        self.num_envs = num_envs
+        self.numpy = numpy
+        self.buffers = EnvBuffers(num_envs, obs_width)
+        self.memory = shared_memory.SharedMemory(create=True, size=self.buffers.size)
+        buf = self.memory.buf
+        if numpy:
+            view = lambda name: self.buffers.array(numpy, buf, name)
+        else:
+            view = lambda name: self.buffers.view(buf, name)
+        self.actions, self.observations = view('actions'), view('observations')
+        self.rewards, self.dones, self.infos = view('rewards'), view('dones'), view('infos')
+        config = {'num_envs': num_envs, 'obs_width': obs_width, 'seed': seed, 'horde': horde, 'world': world_size,
+                  'level_pack': level_pack, 'frame_skip': frame_skip, 'max_steps': max_steps}
+        context = multiprocessing.get_context(ENV_WORKER_START_METHOD)
+        self.workers = []
+        first = 0
+        for number in range(workers):
+            count = num_envs // workers + (number < num_envs % workers)
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=env_worker, name=f'env-worker-{number}', daemon=True,
+                                      args=(child_connection, self.memory.name, num_envs, first, count, config))
+            start_worker(process)
+            child_connection.close()
+            self.workers.append((process, connection))
+            first += count
+
+    def call(self, kind):
+        for _, connection in self.workers:
+            connection.send(kind)
+        for _, connection in self.workers:
+            connection.recv()
+
+    def reset(self):
+        self.call('reset')
+        return self.observations
+
+    def step(self, actions=None):
+        """ Steps every env with actions (num_envs rows of ENV_ACTION_FIELDS; None uses self.actions as already filled in). """
+        if actions is not None and self.numpy:
+            self.actions[...] = actions
+        elif actions is not None:
+            for env, row in enumerate(actions):
+                for i, value in enumerate(row):
+                    self.actions[env, i] = value
+        self.call('step')
+        return self.observations, self.rewards, self.dones, self.infos
+
+    def close(self):
+        for process, connection in self.workers:
+            try:
+                connection.send('stop')
+            except OSError:
+                pass
+        for process, connection in self.workers:
+            process.join(1)
+            connection.close()
+        self.workers = []
+        for view in (self.actions, self.observations, self.rewards, self.dones, self.infos):
+            if isinstance(view, memoryview):
+                view.release()
+        self.actions = self.observations = self.rewards = self.dones = self.infos = None
+        try:
+            self.memory.close()
+        except BufferError:
+            pass # The caller still holds numpy arrays over it; the mapping goes with them
+        self.memory.unlink()
+
+def run_env_benchmark(args, horde):
+    """ Steps --envs environments on --env-workers processes with random actions and reports steps per second. """
+    env = VectorEnv(args.envs, args.env_workers, seed=args.seed or 0, horde=horde, world_size=args.world,
+                    level_pack=args.level_pack)
+    start = time.perf_counter()
+    env.reset()
+    ready = time.perf_counter()
+    episodes = 0
+    rng = random.Random(args.seed)
+    for _ in range(args.env_steps):
+        actions = [(rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1)), rng.uniform(0, 360), rng.random() < 0.2)
+                   for _ in range(args.envs)]
+        _, _, dones, _ = env.step(actions)
+        episodes += sum(dones[env_index] for env_index in range(args.envs))
+    elapsed = time.perf_counter() - ready
+    workers = len(env.workers)
+    buffers = 'numpy' if env.numpy else 'memoryview'
+    env.close()
+    steps_per_sec = args.envs * args.env_steps / elapsed
+    event_log.emit('env_bench', envs=args.envs, workers=workers, steps=args.envs * args.env_steps, startup_s=round(ready - start, 2),
+                   steps_per_sec=round(steps_per_sec, 1), ticks_per_sec=round(steps_per_sec * ENV_FRAME_SKIP, 1),
+                   episodes=episodes, buffers=buffers)
+    print(f"{args.envs} envs on {workers} workers: {steps_per_sec:.0f} steps/s ({steps_per_sec * ENV_FRAME_SKIP:.0f} ticks/s), "
+          f"{episodes} episodes finished, startup {ready - start:.2f}s, {buffers} buffers")
+
+def run_horde_benchmark(enemies=HORDE_BENCH_ENEMIES, ticks=HORDE_BENCH_TICKS, seed=0, world_size=(SCREEN_WIDTH, SCREEN_HEIGHT),
+                        horde=None, scale=1):
+    """
+    Plays a headless horde game with at least `enemies` tanks alive and times every frame's
+    simulation, capture and drawing at the current quality tier (the governor never steps in).
+    A bombardment runs through the second half. Logs a 'horde_bench' event and returns its fields.
+    """
+    random.seed(seed)
+    state = setup_game(generate_arena(seed, *world_size), None, horde or HordeConfig())
+    player = state.player
+    player.health = 10 ** 9 # Outlives the run; enemy fire still hits it
+    camera = Camera()
+    camera.follow(player.rect, world)
+    canvas = new_surface((math.ceil(SCREEN_WIDTH * scale), math.ceil(SCREEN_HEIGHT * scale)))
+    rng = random.Random(seed)
+    hud_blits = None
+    frames, sims, draws, live, bullets, particles = [], [], [], [], [], []
+    for tick in range(HORDE_BENCH_WARMUP + ticks):
+        if tick == HORDE_BENCH_WARMUP + ticks // 2:
+            state.next_bombardment_time = state.current_time
+        if len(state.enemies) < enemies:
+            spawn_horde_burst(state, enemies - len(state.enemies), state.current_time)
+        alive = len(state.enemies)
+        now = state.advance_clock()
+        if tick % 30 == 0: # The player wanders and keeps firing, as in play
+            direction = rng.choice((player.move_left, player.move_right, player.move_up, player.move_down))
+        direction()
+        player.aim_target = (player.rect.centerx + rng.uniform(-100, 100), player.rect.centery + rng.uniform(-100, 100))
+        player.shoot(state.all_sprites, state.player_bullets, now)
+        start = time.perf_counter()
+        frame, _, sim_ms = step_and_capture(state, now, camera, hud_blits)
+        hud_blits = frame.hud
+        draw_start = time.perf_counter()
+        draw_frame(canvas, frame, scale)
+        end = time.perf_counter()
+        if tick >= HORDE_BENCH_WARMUP:
+            frames.append((end - start) * 1000)
+            sims.append(sim_ms)
+            draws.append((end - draw_start) * 1000)
+            live.append(alive)
+            bullets.append(len(state.enemy_bullets))
+            particles.append(len(state.particles))
+    budget = 1000 / TICK_RATE
+    median = lambda values: sorted(values)[len(values) // 2]
+    report = {'enemies': min(live), 'ticks': ticks, 'tier': quality.tier,
+              'frame_ms': round(median(frames), 2), 'frame_p95_ms': round(sorted(frames)[int(len(frames) * 0.95)], 2),
+              'frame_max_ms': round(max(frames), 2), 'sim_ms': round(median(sims), 2), 'draw_ms': round(median(draws), 2),
+              'budget_ms': round(budget, 2), 'over_budget': round(sum(1 for ms in frames if ms > budget) / len(frames), 3),
+              'enemy_bullets': round(sum(bullets) / len(bullets)), 'particles': round(sum(particles) / len(particles))}
+    event_log.emit('horde_bench', **report)
+    return report
+
+# --- Command Line ---
+def parse_world_size(text):
+    """ Parses 'WxH' into a world size of at least the screen, rounded up to whole grid cells. """
+    try:
+        width, height = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    cell = GRID_CELL_SIZE
+    return (-(-max(width, SCREEN_WIDTH) // cell) * cell, -(-max(height, SCREEN_HEIGHT) // cell) * cell)
+
+def parse_window_size(text):
+    """ Parses 'WxH' into a window size. """
+    try:
+        width, height = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    return (width, height)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tank Mayhem")
+    parser.add_argument('--level-pack', metavar='PATH',
+                        help="Pick each arena from a pre-generated level pack instead of generating one")
+    parser.add_argument('--build-level-pack', metavar='PATH',
+                        help="Generate a level pack at PATH and exit")
+    parser.add_argument('--count', type=int, default=100, help="Arenas to generate for --build-level-pack")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for --build-level-pack and --env-bench")
+    parser.add_argument('--autosave', metavar='PATH',
+                        help="Periodically save a snapshot of the running game to PATH")
+    parser.add_argument('--resume', metavar='PATH', help="Continue the game saved in a snapshot file")
+    parser.add_argument('--record', metavar='PATH',
+                        help="Record each game to a seekable replay file (PATH, then PATH-2, PATH-3...)")
+    parser.add_argument('--replay', metavar='PATH', help="Watch a replay file instead of playing")
+    parser.add_argument('--replay-start', metavar='SECONDS|wave:N',
+                        help="Where --replay starts: seconds of game time, or the start of wave N")
+    parser.add_argument('--export-frames', metavar='DIR|-',
+                        help="Write the frames of --replay as PNGs in DIR, or as raw RGB24 on stdout with -, and exit")
+    parser.add_argument('--export-every', type=int, default=1, metavar='N',
+                        help="Export every Nth tick (60/N frames per second)")
+    parser.add_argument('--export-scale', type=float, default=1.0, metavar='F',
+                        help="Exported frame size relative to 800x600")
+    parser.add_argument('--export-seconds', type=float, metavar='S', help="Stop exporting after S seconds of play")
+    parser.add_argument('--log-file', metavar='PATH', help="Append game events to PATH as JSON lines")
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='info',
+                        help="Lowest event level to record")
+    parser.add_argument('--log-console', action='store_true',
+                        help="Echo game events to the console (written from a background thread)")
+    parser.add_argument('--telemetry', metavar='PATH',
+                        help="Record per-frame metrics to a rolling binary file at PATH")
+    parser.add_argument('--telemetry-dump', metavar='PATH', help="Print a telemetry file as CSV and exit")
+    parser.add_argument('--profile-dir', metavar='DIR', default='profiles',
+                        help="Where F9 / automatic profile captures are written")
+    parser.add_argument('--profile-frames', type=int, default=PROFILE_FRAMES,
+                        help="Frames covered by each profile capture")
+    parser.add_argument('--profile-budget', type=float, default=0, metavar='MS',
+                        help="Automatically profile after a frame slower than MS (0 = off)")
+    parser.add_argument('--quality-governor', action='store_true',
+                        help="Shed cosmetic work (particles, zone rendering, HUD rate, far-enemy AI) when frames run long")
+    parser.add_argument('--frame-budget', type=float, default=FRAME_BUDGET_MS, metavar='MS',
+                        help="Frame work budget used by the quality governor")
+    parser.add_argument('--quality-tier', type=int, default=0, metavar='N',
+                        help=f"Start at (or, without the governor, stay at) quality tier 0-{len(QUALITY_TIERS) - 1}")
+    parser.add_argument('--world', type=parse_world_size, default=(SCREEN_WIDTH, SCREEN_HEIGHT), metavar='WxH',
+                        help="World size in pixels; larger than the screen scrolls with the player")
+    parser.add_argument('--window', type=parse_window_size, metavar='WxH',
+                        help=f"Window size; the {SCREEN_WIDTH}x{SCREEN_HEIGHT} screen is scaled to fit")
+    parser.add_argument('--fullscreen', action='store_true', help="Fill the display (at --window size if given)")
+    parser.add_argument('--render-scale', type=float, default=1.0, metavar='F',
+                        help="Draw at F times the screen resolution before scaling to the window (0.5 halves the pixels drawn)")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="Simulate each tick on a second thread while the previous frame is drawn")
+    parser.add_argument('--low-latency', action='store_true',
+                        help="Sample input and simulate as late as possible before each present (spins the CPU briefly)")
+    parser.add_argument('--mute', action='store_true', help="Play no sound (the audio device is never opened)")
+    parser.add_argument('--sound-dir', metavar='DIR',
+                        help="Load effects from DIR/<effect>.wav or .ogg instead of the built-in synthesised ones")
+    parser.add_argument('--horde', action='store_true', help="Endless horde waves instead of MAX_WAVES")
+    parser.add_argument('--horde-curve', choices=HORDE_CURVES, default='geometric',
+                        help="How horde wave size grows with the wave number")
+    parser.add_argument('--horde-base', type=int, default=HORDE_BASE_ENEMIES, help="Enemies in the first horde wave")
+    parser.add_argument('--horde-growth', type=float, default=HORDE_GROWTH, help="Horde curve growth factor")
+    parser.add_argument('--horde-burst', type=int, default=HORDE_BURST_SIZE,
+                        help="Minimum enemies spawned together in one burst")
+    parser.add_argument('--enemy-workers', type=int, default=0, metavar='N',
+                        help="Update horde enemies on N worker processes, one strip of the world each")
+    parser.add_argument('--env-bench', action='store_true',
+                        help="Benchmark the training vector environment with random actions and exit")
+    parser.add_argument('--envs', type=int, default=8, metavar='N', help="Environments for --env-bench")
+    parser.add_argument('--env-workers', type=int, default=None, metavar='K',
+                        help="Worker processes for --env-bench (default: one per CPU core, at most --envs)")
+    parser.add_argument('--env-steps', type=int, default=500, help="Steps per environment for --env-bench")
+    parser.add_argument('--horde-bench', type=int, nargs='?', const=HORDE_BENCH_ENEMIES, metavar='N',
+                        help=f"Time headless horde frames with N enemies alive (default {HORDE_BENCH_ENEMIES}) and exit")
+    parser.add_argument('--memory-diagnostics', metavar='PATH',
+                        help="Write tracemalloc and live-object reports at wave/bombardment/restart checkpoints")
+    parser.add_argument('--memory-compare', nargs=2, metavar=('A', 'B'),
+                        help="Compare two --memory-diagnostics files and exit")
+    parser.add_argument('--asset-cache', metavar='PATH',
+                        help="Keep baked sprite images and HUD text in PATH and load them from there on later launches")
+    parser.add_argument('--server', action='store_true',
+                        help="Run a headless network server that clients join with --connect")
+    parser.add_argument('--bind', metavar='HOST', default='127.0.0.1',
+                        help="Address the --server listens on (0.0.0.0 for every interface)")
+    parser.add_argument('--connect', metavar='HOST[:PORT]', help="Join a network game instead of playing locally")
+    parser.add_argument('--port', type=int, default=NET_PORT, help="UDP port of the network game")
+    parser.add_argument('--snapshot-rate', type=int, default=NET_SNAPSHOT_RATE,
+                        help="World snapshots per second the server sends each client")
+    args = parser.parse_args(argv)
+    if args.render_scale <= 0:
+        parser.error("--render-scale must be positive")
+    if not 0 <= args.enemy_workers <= MAX_ENEMY_WORKERS:
+        parser.error(f"--enemy-workers must be 0-{MAX_ENEMY_WORKERS}")
+    if args.export_frames:
+        if not args.replay:
+            parser.error("--export-frames needs --replay")
+        if args.export_every < 1 or args.export_scale <= 0:
+            parser.error("--export-every must be at least 1 and --export-scale positive")
+        if args.export_frames == '-' and args.log_console:
+            parser.error("--log-console would write into the --export-frames - stream")
+    return args
+
+def main():
+    startup = StartupTimer()
+    args = parse_args()
+    if args.build_level_pack:
+        build_level_pack(args.build_level_pack, args.count, args.seed, *args.world)
+        sys.exit()
+    if args.telemetry_dump:
+        dump_telemetry(args.telemetry_dump)
+        sys.exit()
+    if args.memory_compare:
+        compare_memory_reports(*args.memory_compare)
+        sys.exit()
+    level_pack = LevelPack(args.level_pack) if args.level_pack else None
+    resume_snapshot = load_snapshot(args.resume) if args.resume else None
+    event_log.set_level(args.log_level)
+    event_log.start(args.log_file, args.log_console)
+    telemetry = Telemetry(args.telemetry) if args.telemetry else None
+    profile_capture = ProfileCapture(args.profile_dir, args.profile_frames, args.profile_budget)
+    memory_diagnostics = MemoryDiagnostics(args.memory_diagnostics) if args.memory_diagnostics else None
+    quality.enabled = args.quality_governor or args.horde
+    quality.budget_ms = args.frame_budget
+    quality.set_tier(args.quality_tier)
+    horde = None
+    if args.horde:
+        horde = HordeConfig(args.horde_curve, args.horde_base, args.horde_growth, args.horde_burst)
+        if args.enemy_workers:
+            enemy_pool.start(args.enemy_workers, horde.max_live)
+    if args.horde_bench:
+        init_pygame()
+        prebake_assets()
+        report = run_horde_benchmark(args.horde_bench, seed=args.seed or 0, world_size=args.world, horde=horde,
+                                     scale=args.render_scale)
+        print(f"{report['enemies']} enemies at quality tier {report['tier']}: frame {report['frame_ms']} ms median, "
+              f"{report['frame_p95_ms']} ms p95 (sim {report['sim_ms']} ms, draw {report['draw_ms']} ms); "
+              f"{report['over_budget']:.0%} of frames over the {report['budget_ms']} ms budget")
+        enemy_pool.stop()
+        event_log.close()
+        sys.exit()
+    if args.env_bench:
+        run_env_benchmark(args, horde)
+        event_log.close()
+        sys.exit()
+    if args.export_frames:
+        export_frames(args)
+        event_log.close()
+        sys.exit()
+    if args.replay:
+        run_replay(args)
+        event_log.close()
+        sys.exit()
+    if args.server or args.connect:
+        if args.server:
+            run_server(args, level_pack, horde)
+        else:
+            run_client(args)
+        enemy_pool.stop()
+        event_log.close()
+        sys.exit()
+
+    startup.mark('imports')
+
+    # --- Pygame Initialization ---
+    init_pygame()
+    display = Display(args.window, args.render_scale, args.fullscreen)
+    screen = display.canvas
+    pygame.display.set_caption("Tank Mayhem - Restartable")
+    clock = pygame.time.Clock()
+    pacer = FramePacer(args.low_latency)
+    random.seed()
+    startup.mark('init')
+    asset_cache_hit = bool(args.asset_cache) and load_asset_cache(args.asset_cache)
+    prebake_assets() # Only fills in what the cache did not have
+    startup.mark('assets')
+    if not args.mute:
+        audio.start(args.sound_dir) # Synthesises only the sounds the cache did not have
+    startup.mark('audio')
+
+    # Simulation thread for --pipelined
+    pipeline = ThreadPoolExecutor(1, thread_name_prefix='simulation') if args.pipelined else None
+
+    # --- Main Game Control Loop ---
+    running = True
+    state = None
+    retry_same_arena = False
+    snapshot_ring = SnapshotRing()
+    games = 0
+    while running:
+        # --- Call setup to reset the game state ---
+        # Sprite groups, walls and cached assets survive the restart; only simulation state is reset
+        if retry_same_arena:
+            arena = state.arena
+        else:
+            arena = level_pack.random_arena() if level_pack else generate_arena(None, *args.world)
+        state = setup_game(arena, state, horde)
+        retry_same_arena = False
+        if startup:
+            startup.mark('arena')
+        if resume_snapshot is not None:
+            restore_snapshot(state, resume_snapshot)
+            resume_snapshot = None
+        snapshot_ring.clear()
+        games += 1
+        recorder = ReplayRecorder(replay_path(args.record, games), state, horde) if args.record else None
+        all_sprites, player_bullets = state.all_sprites, state.player_bullets
+        player, arena = state.player, state.arena
+        camera = Camera()
+        camera.follow(player.rect, world)
+
+        # --- Gameplay Loop ---
+        game_active = True
+        # # Variable to track damage tick for circle
+        # last_circle_damage_time = pygame.time.get_ticks()
+
+        frame_start = time.perf_counter()
+        hud_blits = None
+        frame = None # Captured at the end of each tick, drawn the same frame (or the next, pipelined)
+        frame_input = None # When the input behind `frame` was sampled
+        pacer.reset()
+        while game_active:
+            pacer.wait() # Default: sleep off the rest of the tick; low-latency: until just before the deadline
+            frame_ms = (time.perf_counter() - frame_start) * 1000 # Previous frame, including the tick wait
+            frame_start = time.perf_counter()
+            profile_capture.begin_frame(frame_ms)
+            current_time = state.advance_clock()
+            event_log.now = current_time
+            rewind_requested = False
+
+            # # --- Calculate Time and Circle Radius ---
+            # elapsed_time = current_time - game_start_time
+            # time_remaining = max(0, GAME_DURATION - elapsed_time)
+            # time_ratio = min(1.0, elapsed_time / GAME_DURATION) # Clamp between 0 and 1
+
+            # # Linear interpolation for radius
+            # circle_current_radius = circle_start_radius + (CIRCLE_END_RADIUS - circle_start_radius) * time_ratio
+            # circle_current_radius = max(CIRCLE_END_RADIUS, circle_current_radius) # Ensure it doesn't go below min
+
+            # --- Event Handling ---
+            input_time = pacer.sampled()
+            fired = False
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    game_active = False # Exit gameplay loop
+                    running = False     # Exit main control loop
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                     if event.button == 1 and player.alive():
+                         player.shoot(all_sprites, player_bullets, current_time)
+                         fired = True
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_BACKSPACE:
+                     rewind_requested = True
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+                     profile_capture.request()
+                # --- Check for quit/restart keys DURING gameplay? Optional ---
+                # if event.type == pygame.KEYDOWN:
+                #     if event.key == pygame.K_ESCAPE: # Example quit key
+                #         game_active = False
+                #         running = False
+
+            # If running is false due to QUIT event, stop processing this frame
+            if not running:
+                break
 
-        pygame.display.flip()
-        clock.tick(60)
-
-    # --- End Screen Loop --- (Only run if game didn't quit during gameplay)
-    if running:
-        end_font_large = pygame.font.Font(None, 74)
-        end_font_small = pygame.font.Font(None, 36)
-        restart_text_surf = end_font_small.render("Press R to Restart", True, WHITE)
-        restart_rect = restart_text_surf.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2 + 50))
-        quit_text_surf = end_font_small.render("Press Q to Quit", True, WHITE)
-        quit_rect = quit_text_surf.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2 + 90))
-
-        final_message_text = ""
-        final_message_color = WHITE
-
-        # --- PRIORITIZE GAME OVER MESSAGE ---
-        if game_over: # Check Game Over FIRST
-            final_message_text = "GAME OVER"
-            final_message_color = RED
-        elif win: # Check Win only if not Game Over
-            final_message_text = f"YOU WIN! Survived {MAX_WAVES} Waves!"
-            final_message_color = GREEN
-
-        if final_message_text:
-            final_message_surface = end_font_large.render(final_message_text, True, final_message_color)
-            final_message_rect = final_message_surface.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2))
-
-            # Draw the end screen elements once before the loop
-            screen.blit(final_message_surface, final_message_rect)
-            screen.blit(restart_text_surf, restart_rect)
-            screen.blit(quit_text_surf, quit_rect)
-            pygame.display.flip()
-
-
-        running_end_screen = True
-        while running_end_screen and running: # Need to check 'running' too
-             for event in pygame.event.get():
-                 if event.type == pygame.QUIT:
-                     running_end_screen = False
-                     running = False # Ensure main loop terminates
-                 if event.type == pygame.KEYDOWN:
-                     if event.key == pygame.K_r:
-                         print("Restarting...")
-                         running_end_screen = False # Exit end screen loop, main loop continues
-                     if event.key == pygame.K_q:
+            # --- Rewind --- (restores the snapshot from REWIND_TICKS ago and skips this frame)
+            if rewind_requested and snapshot_ring.rewind(state, REWIND_TICKS):
+                arena = state.arena
+                camera.follow(player.rect, world)
+                if recorder:
+                    recorder.rewind(state)
+                profile_capture.end_frame(state)
+                pacer.skip()
+                continue
+
+            # --- Input Handling (Continuous Keys) ---
+            keys = pygame.key.get_pressed()
+            player.aim_target = camera.to_world(display.to_screen(pygame.mouse.get_pos()))
+            if player.alive():
+                if keys[pygame.K_a]: player.move_left()
+                if keys[pygame.K_d]: player.move_right()
+                if keys[pygame.K_w]: player.move_up()
+                if keys[pygame.K_s]: player.move_down()
+            if recorder:
+                recorder.input(player, fired)
+
+            # --- Simulation & Drawing --- (simulate_tick is shared with the network server)
+            # Pipelined, the previous tick's frame is drawn, then this tick runs on the simulation
+            # thread while the frame is scaled to the window and shown here (the scale and flip
+            # release the GIL; blits do not). While a profile capture records, the tick runs here.
+            if pipeline and not profile_capture.active:
+                render_start = time.perf_counter()
+                if frame is not None:
+                    draw_frame(screen, frame, display.scale)
+                pending = pipeline.submit(step_and_capture, state, current_time, camera, hud_blits)
+                if frame is not None:
+                    display.present()
+                    pacer.presented(frame_input)
+                render_end = time.perf_counter()
+                presented = frame is not None
+                frame, active, sim_ms = pending.result()
+                audio.flush(frame.view) # This tick's effects, as its frame goes up next
+            else:
+                frame, active, sim_ms = step_and_capture(state, current_time, camera, hud_blits)
+                render_start = time.perf_counter()
+                draw_frame(screen, frame, display.scale)
+                display.present()
+                pacer.presented(input_time)
+                audio.flush(frame.view)
+                render_end = time.perf_counter()
+                presented = True
+            hud_blits = frame.hud
+            frame_input = input_time
+
+            # # --- NEW: Draw Safe Zone Circle ---
+            # # Use a surface for transparency
+            # circle_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+            # current_circle_color = CIRCLE_COLOR
+            # # Optional: Warning color if player is close to edge
+            # if player.alive():
+                # player_dist_from_edge = circle_current_radius - player_pos.distance_to(circle_center)
+                # if 0 < player_dist_from_edge < PLAYER_SIZE * 3: # If within 3x player size of edge
+                     # current_circle_color = CIRCLE_WARNING_COLOR
+
+            # pygame.draw.circle(circle_surface, current_circle_color,
+                               # (int(circle_center_x), int(circle_center_y)),
+                               # int(circle_current_radius), CIRCLE_THICKNESS)
+            # screen.blit(circle_surface, (0,0))
+            # # --- End Circle Drawing ---
+
+            # --- Check if game should end this frame ---
+            if not active or state.game_over:
+                game_active = False # Exit the gameplay loop
+
+            # --- Save States ---
+            snapshot_ring.capture(state)
+            if recorder: # Reuses the rewind snapshot when both fall on this tick
+                ring = snapshot_ring.snapshots
+                recorder.capture(state, ring[-1] if ring and ring[-1].tick == state.tick else None)
+            if args.autosave and state.tick % AUTOSAVE_INTERVAL == 0:
+                save_snapshot(args.autosave, take_snapshot(state))
+
+            if startup and presented: # First playable frame is on screen
+                startup.mark('first_frame')
+                startup.report(asset_cache=asset_cache_hit, surfaces=alloc_counts['surfaces'])
+                if args.asset_cache and not asset_cache_hit:
+                    save_asset_cache(args.asset_cache)
+                startup = None
+            quality.update((time.perf_counter() - frame_start) * 1000)
+            if telemetry:
+                telemetry.record(state, frame_ms, sim_ms, (render_end - render_start) * 1000)
+            profile_capture.end_frame(state)
+
+        audio.report()
+        if recorder:
+            recorder.close()
+
+        # --- End Screen Loop --- (Only run if game didn't quit during gameplay)
+        if running:
+            if pipeline and frame is not None: # The final tick's frame has not been drawn yet
+                draw_frame(screen, frame, display.scale)
+            end_font_large = get_font(74)
+            end_font_small = get_font(36)
+            restart_text_surf = end_font_small.render("Press R to Restart", True, WHITE)
+            restart_rect = restart_text_surf.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2 + 50))
+            retry_text_surf = end_font_small.render("Press A to Retry Same Arena", True, WHITE)
+            retry_rect = retry_text_surf.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2 + 90))
+            quit_text_surf = end_font_small.render("Press Q to Quit", True, WHITE)
+            quit_rect = quit_text_surf.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2 + 130))
+
+            final_message_text = ""
+            final_message_color = WHITE
+
+            # --- PRIORITIZE GAME OVER MESSAGE ---
+            if state.game_over and state.horde:
+                final_message_text = f"GAME OVER - Horde {state.wave_number}"
+                final_message_color = RED
+            elif state.game_over: # Check Game Over FIRST
+                final_message_text = "GAME OVER"
+                final_message_color = RED
+            elif state.win: # Check Win only if not Game Over
+                final_message_text = f"YOU WIN! Survived {MAX_WAVES} Waves!"
+                final_message_color = GREEN
+
+            if final_message_text:
+                final_message_surface = end_font_large.render(final_message_text, True, final_message_color)
+                final_message_rect = final_message_surface.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2))
+
+                # Draw the end screen elements once before the loop
+                screen.blits(scale_blits([(final_message_surface, final_message_rect), (restart_text_surf, restart_rect),
+                                          (retry_text_surf, retry_rect), (quit_text_surf, quit_rect)], display.scale))
+                display.present()
+
+
+            running_end_screen = True
+            while running_end_screen and running: # Need to check 'running' too
+                 for event in pygame.event.get():
+                     if event.type == pygame.QUIT:
                          running_end_screen = False
                          running = False # Ensure main loop terminates
-             clock.tick(15) # Lower tick rate for end screen
-
-# --- Quit Pygame --- (This runs after the main 'while running:' loop exits)
-pygame.quit()
-sys.exit()
\ No newline at end of file
+                     if event.type == pygame.KEYDOWN:
+                         if event.key == pygame.K_r:
+                             print("Restarting...")
+                             running_end_screen = False # Exit end screen loop, main loop continues
+                         if event.key == pygame.K_a:
+                             event_log.emit('arena_retry', seed=state.arena.seed)
+                             retry_same_arena = True
+                             running_end_screen = False
+                         if event.key == pygame.K_q:
+                             running_end_screen = False
+                             running = False # Ensure main loop terminates
+                 clock.tick(15) # Lower tick rate for end screen
+
+    # --- Quit Pygame --- (This runs after the main 'while running:' loop exits)
+    if pipeline:
+        pipeline.shutdown()
+    enemy_pool.stop()
+    event_log.close()
+    if telemetry:
+        telemetry.close()
+    if memory_diagnostics:
+        memory_diagnostics.close()
+    pygame.quit()
+    sys.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import os
+import sys
+
+# The game runs headless under test: no window and no audio device (set before pygame is imported)
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def pygame_fonts():
+    """ HUD text needs the font module; no display is opened. """
+    pygame.font.init()
+    yield
+    pygame.font.quit()
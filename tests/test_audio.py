@@ -0,0 +1,118 @@
+import pygame
+import pytest
+
+import tank_game as tg
+
+
+class FakeChannel:
+    """ Stands in for a mixer channel: busy from play() until finish(). """
+    def __init__(self):
+        self.sound = None
+        self.volume = None
+
+    def play(self, sound):
+        self.sound = sound
+
+    def set_volume(self, left, right):
+        self.volume = (left, right)
+
+    def get_busy(self):
+        return self.sound is not None
+
+    def finish(self):
+        self.sound = None
+
+
+@pytest.fixture
+def engine():
+    """ An AudioEngine with AUDIO_CATEGORIES pools of fake channels, so no mixer or device is opened. """
+    engine = tg.AudioEngine()
+    engine.pools = {category: [[FakeChannel(), 0, 0] for _ in range(count)] for category, count in tg.AUDIO_CATEGORIES.items()}
+    engine.sounds = {name: name for name in tg.AUDIO_EFFECTS}
+    engine.enabled = True
+    return engine
+
+
+VIEW = pygame.Rect(0, 0, 800, 600)
+
+
+def playing(engine, category):
+    """ What each channel of the category's pool plays, in channel order. """
+    return [slot[0].sound for slot in engine.pools[category]]
+
+
+def test_identical_sounds_coalesce(engine):
+    """ Forty explosions in one tick start one louder voice. """
+    for i in range(40):
+        engine.play('explosion', (400 + i, 300))
+    engine.flush(VIEW)
+    assert playing(engine, 'explosions').count('explosion') == 1
+    assert engine.stats['triggered'] == 40 and engine.stats['merged'] == 39 and engine.stats['played'] == 1
+    voice = next(slot[0] for slot in engine.pools['explosions'] if slot[0].sound)
+    engine.play('explosion', (400, 300))
+    engine.flush(VIEW)
+    single = next(slot[0] for slot in engine.pools['explosions'] if slot[0] is not voice and slot[0].sound)
+    assert sum(voice.volume) > sum(single.volume)
+
+
+def test_flooded_category_steals_oldest_then_drops(engine):
+    """ A full pool gives the oldest weakest voice to an equal or higher priority effect, and drops a lower one. """
+    weapons = tg.AUDIO_CATEGORIES['weapons']
+    for _ in range(weapons): # One voice per frame fills the pool
+        engine.play('enemy_shot', (400, 300))
+        engine.flush(VIEW)
+    assert playing(engine, 'weapons') == ['enemy_shot'] * weapons
+    oldest = engine.pools['weapons'][0]
+    engine.play('player_shot', (400, 300)) # Outranks them all: replaces the oldest
+    engine.flush(VIEW)
+    assert oldest[0].sound == 'player_shot' and engine.stats['stolen'] == 1
+    engine.play('enemy_shot', (400, 300)) # Ties the other enemy shots: replaces the oldest of them
+    engine.flush(VIEW)
+    assert engine.pools['weapons'][1][0].sound == 'enemy_shot' and engine.pools['weapons'][1][2] == engine.started
+    assert engine.stats['stolen'] == 2
+    for _ in range(weapons):
+        engine.play('player_shot', (400, 300))
+        engine.flush(VIEW)
+    assert playing(engine, 'weapons') == ['player_shot'] * weapons
+    engine.play('enemy_shot', (400, 300))
+    engine.play('empty_click', (400, 300))
+    engine.flush(VIEW)
+    assert engine.stats['dropped'] == 2 # Both outranked by every playing voice
+    assert playing(engine, 'weapons') == ['player_shot'] * weapons
+    # Other categories keep their own channels
+    engine.play('explosion', (400, 300))
+    engine.play('pickup', (400, 300))
+    engine.flush(VIEW)
+    assert 'explosion' in playing(engine, 'explosions') and 'pickup' in playing(engine, 'pickups')
+
+
+def test_free_channels_before_stealing(engine):
+    """ A finished voice's channel is reused before any playing voice is replaced. """
+    for _ in range(tg.AUDIO_CATEGORIES['pickups']):
+        engine.play('pickup')
+        engine.flush(VIEW)
+    engine.pools['pickups'][1][0].finish()
+    engine.play('pickup')
+    engine.flush(VIEW)
+    assert engine.stats['stolen'] == 0 and engine.stats['played'] == 3
+
+
+def test_higher_priority_takes_the_last_channel(engine):
+    """ Within a frame, effects start highest priority first. """
+    for _ in range(tg.AUDIO_CATEGORIES['alerts'] - 1):
+        engine.play('player_hit')
+        engine.flush(VIEW)
+    engine.play('wave')
+    engine.play('bombardment')
+    engine.flush(VIEW)
+    assert sorted(playing(engine, 'alerts')) == ['bombardment', 'player_hit', 'player_hit']
+    assert engine.stats['dropped'] == 1
+
+
+def test_far_sounds_culled_and_disabled_engine_silent(engine):
+    engine.play('explosion', (VIEW.right + tg.AUDIO_HEARING_MARGIN + 500, 300))
+    engine.flush(VIEW)
+    assert engine.stats['culled'] == 1 and playing(engine, 'explosions').count(None) == tg.AUDIO_CATEGORIES['explosions']
+    engine.enabled = False
+    engine.play('explosion', (400, 300))
+    assert not engine.pending
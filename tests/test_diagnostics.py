@@ -0,0 +1,37 @@
+import json
+import random
+
+import tank_game as tg
+
+
+def play(state, ticks):
+    camera = tg.Camera()
+    enemies_seen = 0
+    for _ in range(ticks):
+        now = state.advance_clock()
+        tg.event_log.now = now
+        state.player.aim_target = (400, 0)
+        if state.tick % 10 == 0:
+            state.player.shoot(state.all_sprites, state.player_bullets, now)
+        tg.simulate_tick(state, now, camera.view)
+        enemies_seen = max(enemies_seen, len(state.enemies))
+    return enemies_seen
+
+
+def test_clean_restarts_report_no_leak_suspects(tmp_path):
+    """ Restarting through setup_game() leaves nothing of the old game alive, so no checkpoint blames it. """
+    path = tmp_path / 'memory.jsonl'
+    diagnostics = tg.MemoryDiagnostics(str(path))
+    try:
+        random.seed(1)
+        arena = tg.generate_arena(1)
+        state = None
+        for _ in range(3):
+            state = tg.setup_game(arena, state)
+            assert play(state, 420) > 0 # The old game had tanks that could leak
+        state = tg.setup_game(tg.generate_arena(2), state) # A new arena drops the old walls too
+    finally:
+        diagnostics.close()
+    setups = [record for record in map(json.loads, path.read_text().splitlines()) if record['label'] == 'game_setup']
+    assert [record['game'] for record in setups] == [1, 2, 3, 4]
+    assert [record['leak_suspects'] for record in setups] == [[], [], [], []]
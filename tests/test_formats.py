@@ -0,0 +1,86 @@
+import random
+
+import pygame
+
+import tank_game as tg
+
+
+def play(state, ticks, rng):
+    camera = tg.Camera()
+    for _ in range(ticks):
+        now = state.advance_clock()
+        state.player.shoot(state.all_sprites, state.player_bullets, now)
+        state.player.aim_target = (rng.randint(0, 800), rng.randint(0, 600))
+        state.player.move_left() if rng.random() < 0.5 else state.player.move_up()
+        tg.simulate_tick(state, now, camera.view)
+
+
+def snapshot_fields(snap):
+    return [getattr(snap, name) for name in tg.Snapshot.__slots__ if name != 'arena']
+
+
+def test_snapshot_bytes_round_trip(tmp_path):
+    random.seed(3)
+    state = tg.setup_game(tg.generate_arena(3))
+    state.player.take_damage = lambda amount: None
+    play(state, 400, random.Random(1))
+    snap = tg.take_snapshot(state)
+    assert snap.enemies and snap.player_bullets
+    path = tmp_path / 'save.snap'
+    tg.save_snapshot(str(path), snap)
+    loaded = tg.load_snapshot(str(path))
+    assert snapshot_fields(loaded) == snapshot_fields(snap)
+    assert loaded.arena.barriers == snap.arena.barriers and loaded.arena.size == snap.arena.size
+    restored = tg.setup_game(loaded.arena)
+    tg.restore_snapshot(restored, loaded)
+    assert snapshot_fields(tg.take_snapshot(restored)) == snapshot_fields(snap)
+
+
+def test_asset_cache_round_trip(tmp_path):
+    caches = (tg._image_cache, tg._text_cache, tg._sound_cache)
+    saved = [dict(cache) for cache in caches]
+    try:
+        tg.rotated_tank_image(tg.PLAYER_SIZE, tg.GREEN, 45)
+        tg.bullet_image(tg.BLUE)
+        tg.text_surface("Score: 10", 30)
+        tg._sound_cache['test'] = b'\x01\x02' * 64
+        path = str(tmp_path / 'assets.cache')
+        tg.save_asset_cache(path)
+        expected = [{key: (pygame.image.tobytes(value, 'RGBA') if isinstance(value, pygame.Surface) else value)
+                     for key, value in cache.items() if key[0] != 'wall'} for cache in caches]
+        for cache in caches:
+            cache.clear()
+        assert tg.load_asset_cache(path)
+        for cache, want in zip(caches, expected):
+            got = {key: (pygame.image.tobytes(value, 'RGBA') if isinstance(value, pygame.Surface) else value)
+                   for key, value in cache.items()}
+            assert got == want
+        with open(path, 'r+b') as f: # Another game version's cache is ignored
+            f.write(b'XXXX')
+        assert not tg.load_asset_cache(path)
+    finally:
+        for cache, before in zip(caches, saved):
+            cache.clear()
+            cache.update(before)
+
+
+def test_telemetry_ring_round_trip(tmp_path):
+    path = str(tmp_path / 'run.telemetry')
+    state = tg.setup_game(tg.generate_arena(1))
+    telemetry = tg.Telemetry(path, capacity=16)
+    try:
+        for tick in range(10):
+            state.tick = tick
+            telemetry.record(state, 16.0, 2.5, 4.0)
+        telemetry.flush()
+        for tick in range(10, 50): # Overruns the ring before the next flush
+            state.tick = tick
+            telemetry.record(state, 16.0, 2.5, 4.0)
+        telemetry.flush()
+    finally:
+        telemetry.close()
+    rows = list(tg.read_telemetry(path))
+    assert telemetry.dropped == 40 - 16
+    assert [row['tick'] for row in rows] == list(range(10)) + list(range(34, 50))
+    assert rows[0]['frame_ms'] == 16.0 and rows[0]['sim_ms'] == 2.5 and rows[0]['render_ms'] == 4.0
+    assert list(rows[0]) == list(tg.TELEMETRY_FIELDS)
@@ -0,0 +1,185 @@
+import random
+
+import pygame
+import pytest
+
+import tank_game as tg
+
+
+@pytest.fixture
+def small_world(monkeypatch):
+    """ DangerMap.rasterize() covers the current world bounds. """
+    monkeypatch.setattr(tg, 'world', pygame.Rect(0, 0, 800, 600))
+
+
+def zone_hit(zones, x, y):
+    return any(zone.collides_point(pygame.Vector2(x, y)) for zone in zones)
+
+
+def test_danger_map_hit_is_collides_point(small_world):
+    """ DangerMap.hit() agrees with BombardmentZone.collides_point() inside, outside and on the rim. """
+    rng = random.Random(3)
+    r = tg.BOMBARDMENT_RADIUS
+    rim = [(r, 0), (0, r), (45, 60), (60, 45)] # Integer points at exactly the radius (75 = 15 * 5)
+    for _ in range(20):
+        zones = [tg.BombardmentZone(rng.randrange(80, 720), rng.randrange(80, 520), 0) for _ in range(9)]
+        danger = tg.DangerMap()
+        danger.rasterize(zones)
+        points = [(rng.randrange(800), rng.randrange(600)) for _ in range(2000)]
+        points += [(rng.uniform(0, 800), rng.uniform(0, 600)) for _ in range(2000)]
+        for zone in zones:
+            cx, cy = int(zone.center.x), int(zone.center.y)
+            for dx, dy in rim:
+                for sx in (-1, 1):
+                    for sy in (-1, 1):
+                        for extra in (-1, 0, 1): # Just inside, on and just outside the rim
+                            points.append((cx + sx * (dx + extra * (dx > 0)), cy + sy * (dy + extra * (dy > 0))))
+        for x, y in points:
+            if 0 <= x < 800 and 0 <= y < 600:
+                exact = zone_hit(zones, x, y)
+                assert danger.hit(x, y) == exact, (x, y)
+                assert danger.dangerous(x, y) or not exact, (x, y)
+
+
+def test_danger_map_cleared(small_world):
+    danger = tg.DangerMap()
+    danger.rasterize([tg.BombardmentZone(400, 300, 0)])
+    assert danger.hit(400, 300)
+    danger.rasterize([])
+    assert not danger.hit(400, 300) and not danger.dangerous(400, 300)
+
+
+def segment_meets_cell(grid, col, row, x0, y0, x1, y1, closed):
+    """ Liang-Barsky clip of the segment against a cell square, closed or open (interior only). """
+    cs = grid.cell_size
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - col * cs), (dx, (col + 1) * cs - x0), (-dy, y0 - row * cs), (dy, (row + 1) * cs - y0)):
+        if p == 0:
+            if q < 0 or (q == 0 and not closed):
+                return False
+        elif p < 0:
+            t0 = max(t0, q / p)
+        else:
+            t1 = min(t1, q / p)
+    return t0 <= t1 if closed else t0 < t1
+
+
+def wall_cells_crossed(grid, x0, y0, x1, y1, closed):
+    """ Per-cell reference for line_clear(): occupied cells the segment meets, besides its end cells. """
+    cs = grid.cell_size
+    ends = {(int(x0) // cs, int(y0) // cs), (int(x1) // cs, int(y1) // cs)}
+    return [(col, row) for row in range(grid.rows) for col in range(grid.cols)
+            if grid.occupancy[row * grid.cols + col] and (col, row) not in ends
+            and segment_meets_cell(grid, col, row, x0, y0, x1, y1, closed)]
+
+
+def random_grid(rng, width=400, height=300, walls=60):
+    grid = tg.WallGrid(width, height)
+    for _ in range(walls):
+        grid.add(pygame.Rect(rng.randrange(width - 30), rng.randrange(height - 30), rng.randrange(5, 30), rng.randrange(5, 30)))
+    return grid
+
+
+def assert_line_clear_matches(grid, x0, y0, x1, y1):
+    """ Blocked by any wall cell whose interior the segment passes, and only by cells it touches. """
+    clear = grid.line_clear(x0, y0, x1, y1)
+    if wall_cells_crossed(grid, x0, y0, x1, y1, closed=False):
+        assert not clear, (x0, y0, x1, y1)
+    if not clear:
+        assert wall_cells_crossed(grid, x0, y0, x1, y1, closed=True), (x0, y0, x1, y1)
+
+
+def test_line_clear_random_segments():
+    rng = random.Random(1)
+    grid = random_grid(rng)
+    for _ in range(1500):
+        assert_line_clear_matches(grid, rng.uniform(0, 399), rng.uniform(0, 299), rng.uniform(0, 399), rng.uniform(0, 299))
+    for _ in range(1500): # Whole-pixel segments, which often run along or through the cell lines
+        assert_line_clear_matches(grid, rng.randrange(400), rng.randrange(300), rng.randrange(400), rng.randrange(300))
+
+
+def test_line_clear_axis_aligned():
+    rng = random.Random(2)
+    grid = random_grid(rng)
+    for _ in range(500):
+        x0, x1 = rng.randrange(400), rng.randrange(400)
+        y = rng.choice([rng.randrange(300), rng.randrange(30) * 10]) # Inside a row or along a row line
+        assert_line_clear_matches(grid, x0, y, x1, y)
+        assert_line_clear_matches(grid, y, x0 * 3 // 4, y, x1 * 3 // 4)
+    grid = tg.WallGrid(100, 100)
+    grid.add(pygame.Rect(50, 50, 10, 10))
+    assert not grid.line_clear(15, 55, 85, 55)
+    assert not grid.line_clear(55, 85, 55, 15)
+    assert grid.line_clear(15, 45, 85, 45)
+    assert grid.line_clear(51, 52, 58, 57) # Start and end cell are not checked
+
+
+@pytest.mark.parametrize('side', ['column', 'row'])
+@pytest.mark.parametrize('direction', [(1, 1), (1, -1), (-1, 1), (-1, -1)])
+def test_line_clear_through_corner(side, direction):
+    """ A segment through a cell corner is blocked by either of the two cells beside the corner. """
+    sx, sy = direction
+    corner = 50
+    x0, y0 = corner - sx * 25, corner - sy * 15 # Not a 45 degree line, yet exactly through (50, 50)
+    x1, y1 = corner + sx * 25, corner + sy * 15
+    assert (corner - x0) * (y1 - y0) == (corner - y0) * (x1 - x0) # Passes exactly through the corner
+    grid = tg.WallGrid(100, 100)
+    assert grid.line_clear(x0, y0, x1, y1)
+    # The cells beside the corner: one past it along x (the column step), one past it along y (the row step)
+    col_before, row_before = (corner - 1 if sx > 0 else corner) // 10, (corner - 1 if sy > 0 else corner) // 10
+    if side == 'column':
+        cell = (col_before + sx, row_before)
+    else:
+        cell = (col_before, row_before + sy)
+    grid.add(pygame.Rect(cell[0] * 10, cell[1] * 10, 10, 10))
+    assert not grid.line_clear(x0, y0, x1, y1)
+    assert not grid.line_clear(x1, y1, x0, y0)
+
+
+def fast_bullet(x, y, vel_x, vel_y):
+    """ A bullet moved one tick at vel_x, vel_y pixels per tick (far above BULLET_SPEED). """
+    bullet = tg.Bullet(x, y, 0)
+    bullet.vel_x, bullet.vel_y = vel_x, vel_y
+    bullet.update()
+    return bullet
+
+
+def target_sprite(center, size=20):
+    target = pygame.sprite.Sprite()
+    target.image = tg.tank_image(size, tg.RED)
+    target.rect = target.image.get_rect(center=center)
+    target.mask = pygame.mask.from_surface(target.image)
+    return target
+
+
+def test_sweep_box_enters_thin_wall():
+    wall = pygame.Rect(170, 0, 4, 400)
+    span = tg.sweep_box((150, 97), (40, 0), (6, 6), wall)
+    assert span == pytest.approx(((170 - 6 - 150) / 40, (174 - 150) / 40))
+    assert tg.sweep_box((150, 97), (40, 0), (6, 6), pygame.Rect(170, 200, 4, 40)) is None # Passes beside it
+    assert tg.sweep_box((150, 97), (10, 0), (6, 6), wall) is None # Stops short of it
+
+
+def test_fast_bullet_stopped_by_thin_wall():
+    """ A 40 px move jumps a 4 px wall: neither end overlaps it, but the sweep stops the bullet on it. """
+    wall = pygame.Rect(170, 0, 4, 400)
+    bullet = fast_bullet(150, 100, 40, 0)
+    assert not bullet.rect.colliderect(wall) and not pygame.Rect(bullet.start, bullet.rect.size).colliderect(wall)
+    assert tg.sweep_bullet(bullet, [wall], []) == []
+    assert bullet.rect.right == wall.left # Moved back to the point of impact
+    diagonal = fast_bullet(150, 100, 30, 30)
+    assert not diagonal.rect.colliderect(wall)
+    assert tg.sweep_bullet(diagonal, [wall], []) == []
+    assert diagonal.rect.right == wall.left
+
+
+def test_fast_bullet_hits_tank_it_passes():
+    tank = target_sprite((200, 100))
+    bullet = fast_bullet(160, 100, 80, 0)
+    assert not pygame.sprite.collide_mask(bullet, tank) # Lands beyond the tank
+    assert tg.sweep_bullet(bullet, [], [tank]) == [tank]
+    assert tg.sweep_bullet(fast_bullet(160, 130, 80, 0), [], [tank]) is None # Passes below it
+    wall = pygame.Rect(180, 0, 4, 400)
+    bullet = fast_bullet(160, 100, 80, 0)
+    assert tg.sweep_bullet(bullet, [wall], [tank]) == [] # The wall in front takes the hit
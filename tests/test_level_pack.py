@@ -0,0 +1,48 @@
+import random
+
+import pygame
+import pytest
+
+import tank_game as tg
+
+
+def assert_same_arena(loaded, built):
+    assert loaded.seed == built.seed
+    assert loaded.size == built.size
+    assert loaded.barriers == built.barriers
+    assert loaded.grid.occupancy == built.grid.occupancy
+    assert loaded.enemy_spawns == built.enemy_spawns
+    assert loaded.powerup_spawns == built.powerup_spawns
+    for cell, occupied in enumerate(built.grid.occupancy):
+        if occupied:
+            assert sorted(map(tuple, loaded.grid.buckets[cell])) == sorted(map(tuple, built.grid.buckets[cell]))
+    chunks = [(col, row) for row in range(built.chunks.rows) for col in range(built.chunks.cols)]
+    for table in ('enemy_spawns', 'powerup_spawns'):
+        for key in chunks:
+            assert list(getattr(loaded.chunks, table).get(key, ())) == list(getattr(built.chunks, table).get(key, ()))
+    rng = random.Random(0)
+    for _ in range(500):
+        rect = pygame.Rect(rng.randrange(built.width), rng.randrange(built.height), rng.randrange(1, 80), rng.randrange(1, 80))
+        assert loaded.grid.collides(rect) == built.grid.collides(rect)
+        assert sorted(map(tuple, loaded.grid.query(rect))) == sorted(map(tuple, built.grid.query(rect)))
+
+
+@pytest.mark.parametrize('size', [(800, 600), (1605, 1213)])
+def test_build_then_load_matches_generated(tmp_path, size):
+    """ A packed arena is the arena that was generated, including a world size off the cell grid. """
+    path = tmp_path / 'arenas.pack'
+    tg.build_level_pack(str(path), 3, 5, *size)
+    pack = tg.LevelPack(str(path))
+    try:
+        assert len(pack) == 3
+        assert (pack.width, pack.height) == size
+        rng = random.Random(5)
+        for i in range(3):
+            assert_same_arena(pack.load(i), tg.generate_arena(rng.randrange(2**32), *size))
+    finally:
+        pack.close()
+
+
+def test_world_too_large_for_int16(tmp_path):
+    with pytest.raises(ValueError):
+        tg.build_level_pack(str(tmp_path / 'big.pack'), 1, 1, tg.LEVEL_PACK_MAX_COORD + 1, 600)
@@ -0,0 +1,103 @@
+import random
+import socket
+
+import tank_game as tg
+
+
+def recv_snapshot(sock):
+    """ The payload of the next snapshot datagram, skipping welcomes. """
+    while True:
+        kind, payload = tg.net_unpack(sock.recv(65536))
+        if kind == tg.NET_SNAPSHOT:
+            return payload
+
+
+def connect(server, sock):
+    sock.sendto(tg.net_packet(tg.NET_HELLO), server.sock.getsockname())
+    while not server.clients:
+        server.receive(0)
+    return next(iter(server.clients.values()))
+
+
+def test_delta_snapshots_rebuild_the_server_view():
+    """ Deltas against acked baselines, with moves, spawns, removals and lost acks, decode to what the server sent. """
+    server = tg.NetServer('127.0.0.1', 0)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(2)
+    try:
+        server.new_game(tg.generate_arena(3), None)
+        state = server.state
+        client = connect(server, sock)
+        view = tg.NetView()
+        rng = random.Random(4)
+        bullets = []
+        full = delta = 0
+        for round_number in range(40):
+            x, y = client.player.rect.center
+            for _ in range(rng.randint(0, 8)):
+                bullet = tg.Bullet(x + rng.randint(-300, 300), y + rng.randint(-200, 200), rng.randint(0, 359))
+                state.all_sprites.add(bullet)
+                state.player_bullets.add(bullet)
+                bullets.append(bullet)
+            for bullet in rng.sample(bullets, len(bullets) // 3):
+                bullet.rect.move_ip(rng.randint(-5, 5), rng.randint(-5, 5))
+            for bullet in rng.sample(bullets, len(bullets) // 5):
+                bullet.kill()
+                bullets.remove(bullet)
+            client.player.angle = rng.randint(0, 359)
+            state.advance_clock()
+            server.send_snapshot(client)
+            view.decode(recv_snapshot(sock), state.current_time)
+            info = view.latest()[2]
+            if info[1]:
+                delta += 1
+            else:
+                full += 1
+            assert view.latest()[1] == client.sent[state.tick]
+            if round_number % 7 != 3: # Every seventh ack is lost; the next delta uses an older baseline
+                client.acked = state.tick
+            server.release_ids()
+        assert full == 1 and delta == 39
+    finally:
+        sock.close()
+        server.sock.close()
+
+
+def test_net_ids_are_not_reused_while_alive():
+    """ More than 65535 bullets come and go over loopback; the player's id never changes hands. """
+    server = tg.NetServer('127.0.0.1', 0)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(2)
+    try:
+        server.new_game(tg.generate_arena(7), None)
+        state = server.state
+        client = connect(server, sock)
+        player = client.player
+        view = tg.NetView()
+        per_round = 1000
+        rounds = tg.NET_MAX_ID // per_round + 6
+        player_id = None
+        for _ in range(rounds):
+            x, y = player.rect.center
+            bullets = [tg.Bullet(x + i % 40, y + i // 40, 0) for i in range(per_round)]
+            state.all_sprites.add(bullets)
+            state.player_bullets.add(bullets)
+            state.advance_clock()
+            server.send_snapshot(client)
+            view.decode(recv_snapshot(sock), state.current_time)
+            entities = view.latest()[1]
+            if player_id is None:
+                player_id = player.net_id
+            assert entities[player_id][0] == tg.NET_KIND_PLAYER
+            assert sum(record[0] == tg.NET_KIND_BULLET for record in entities.values()) == per_round
+            client.acked = state.tick # As the client's next input would
+            for bullet in bullets:
+                bullet.kill()
+            server.release_ids()
+        assert player.net_id == player_id
+        assert rounds * per_round > tg.NET_MAX_ID
+    finally:
+        sock.close()
+        server.sock.close()
@@ -0,0 +1,47 @@
+import random
+
+import pygame
+import pytest
+
+import tank_game as tg
+
+
+def draw_through_screen_surface(surface, zone, offset, scale):
+    """ The old 'full' zone drawing: the ring on a screen-sized alpha surface, blended over the target. """
+    overlay = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+    pygame.draw.circle(overlay, zone.color, (int((zone.center.x - offset[0]) * scale), int((zone.center.y - offset[1]) * scale)),
+                       int(zone.radius * scale), max(1, int(zone.thickness * scale)))
+    surface.blit(overlay, (0, 0))
+
+
+@pytest.mark.parametrize('scale', [1, 0.5, 0.75, 1.5])
+def test_full_zones_match_screen_surface_drawing(scale):
+    """ Cached rings give the same pixels as drawing every zone through its own screen-sized surface. """
+    rng = random.Random(1)
+    size = (int(800 * scale), int(600 * scale))
+    for _ in range(10):
+        zones = [tg.BombardmentZone(rng.uniform(-50, 850), rng.uniform(-50, 650), 0) for _ in range(5)]
+        offset = (rng.randrange(-30, 30), rng.randrange(-30, 30))
+        expected = pygame.Surface(size)
+        expected.fill(tg.GRASS_GREEN)
+        drawn = expected.copy()
+        for zone in zones:
+            draw_through_screen_surface(expected, zone, offset, scale)
+        tg.draw_bombardment_zones(drawn, zones, 'full', offset, scale)
+        assert pygame.image.tobytes(drawn, 'RGB') == pygame.image.tobytes(expected, 'RGB')
+
+
+def test_full_zones_reuse_one_ring():
+    zones = [tg.BombardmentZone(100 + 60 * i, 300, 0) for i in range(9)]
+    surface = pygame.Surface((800, 600))
+    tg.draw_bombardment_zones(surface, zones, 'full')
+    cached = len(tg._image_cache)
+    tg.draw_bombardment_zones(surface, zones, 'full')
+    assert len(tg._image_cache) == cached
+
+
+def test_horde_benchmark_reports_frame_times():
+    report = tg.run_horde_benchmark(enemies=100, ticks=20)
+    assert report['enemies'] == 100 and report['ticks'] == 20
+    assert 0 < report['sim_ms'] <= report['frame_ms'] <= report['frame_p95_ms'] <= report['frame_max_ms']
+    assert 0 <= report['over_budget'] <= 1 and report['budget_ms'] == pytest.approx(1000 / tg.TICK_RATE, abs=0.01)
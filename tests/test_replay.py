@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+import tank_game as tg
+
+
+def fields(state):
+    """ Everything a snapshot holds except the arena object and the RNG (reseeded at keyframes). """
+    snap = tg.take_snapshot(state)
+    return [getattr(snap, name) for name in tg.Snapshot.__slots__ if name not in ('arena', 'rng_state')]
+
+
+def record_game(path, ticks, horde=None):
+    """ Plays a scripted game (with rewinds) into a replay; returns the expected state fields per tick. """
+    random.seed(5)
+    state = tg.setup_game(tg.generate_arena(5), None, horde)
+    state.player.take_damage = lambda amount: None # Outlive the script
+    ring = tg.SnapshotRing()
+    camera = tg.Camera()
+    camera.follow(state.player.rect, tg.world)
+    recorder = tg.ReplayRecorder(str(path), state, horde)
+    rng = random.Random(9)
+    expected = {state.tick: fields(state)}
+    rewinds = 0
+    while state.tick < ticks:
+        now = state.advance_clock()
+        player = state.player
+        if state.tick % 97 == 0 and state.tick > 200 and rewinds < 3 and ring.rewind(state, tg.REWIND_TICKS):
+            rewinds += 1
+            camera.follow(player.rect, tg.world)
+            recorder.rewind(state)
+            for tick in [tick for tick in expected if tick > state.tick]:
+                del expected[tick]
+            continue
+        fired = rng.random() < 0.3
+        if fired:
+            player.shoot(state.all_sprites, state.player_bullets, now)
+        player.aim_target = (rng.randint(0, 800), rng.randint(0, 600))
+        if rng.random() < 0.5:
+            player.move_left() if rng.random() < 0.5 else player.move_right()
+        if rng.random() < 0.5:
+            player.move_up() if rng.random() < 0.5 else player.move_down()
+        if state.tick % 200 == 0:
+            tg.quality.set_tier(rng.randint(0, 3))
+        recorder.input(player, fired)
+        tg.simulate_tick(state, now, camera.view)
+        if player.alive():
+            camera.follow(player.rect, tg.world)
+        ring.capture(state)
+        latest = ring.snapshots[-1] if ring.snapshots else None
+        recorder.capture(state, latest if latest is not None and latest.tick == state.tick else None)
+        expected[state.tick] = fields(state)
+    recorder.close()
+    tg.quality.set_tier(0)
+    assert rewinds == 3
+    return expected
+
+
+def playback_state(replay):
+    state = tg.setup_game(replay.keyframe(0).arena, None, replay.horde)
+    state.player.take_damage = lambda amount: None
+    return state, tg.Camera()
+
+
+@pytest.mark.parametrize('horde', [None, tg.HordeConfig('geometric', 40, 0.5, 20)], ids=['campaign', 'horde'])
+def test_playback_and_seeks_match_the_recorded_game(tmp_path, horde):
+    path = tmp_path / 'game.replay'
+    expected = record_game(path, 900, horde)
+    replay = tg.Replay(str(path))
+    try:
+        assert replay.last_tick == 900
+        state, camera = playback_state(replay)
+        replay.seek(state, camera, replay.first_tick)
+        while state.tick < replay.last_tick:
+            tg.simulate_tick(state, replay.apply(state), camera.view)
+            if state.player.alive():
+                camera.follow(state.player.rect, tg.world)
+            assert fields(state) == expected[state.tick], state.tick
+        for target in (1, 59, 60, 61, 437, 900, 300):
+            replay.seek(state, camera, target)
+            assert state.tick == target
+            assert fields(state) == expected[target], target
+        for wave, tick in replay.waves:
+            replay.seek(state, camera, replay.wave_tick(wave))
+            assert state.wave_number == wave
+    finally:
+        replay.close()
+        tg.quality.set_tier(0)
+
+
+def test_unfinished_recording_plays_to_its_last_segment(tmp_path):
+    path = tmp_path / 'game.replay'
+    expected = record_game(path, 600)
+    data = path.read_bytes()
+    cut = tmp_path / 'crashed.replay'
+    cut.write_bytes(data[:len(data) * 3 // 4]) # No index, last segment incomplete
+    replay = tg.Replay(str(cut))
+    try:
+        assert replay.last_tick < 600
+        state, camera = playback_state(replay)
+        replay.seek(state, camera, replay.last_tick)
+        assert fields(state) == expected[replay.last_tick]
+    finally:
+        replay.close()
+        tg.quality.set_tier(0)
+
+
+def test_start_tick_spec(tmp_path):
+    path = tmp_path / 'game.replay'
+    record_game(path, 300)
+    replay = tg.Replay(str(path))
+    try:
+        assert replay.start_tick(None) == replay.first_tick
+        assert replay.start_tick('2.5') == 150
+        with pytest.raises(ValueError):
+            replay.start_tick('wave:99')
+    finally:
+        replay.close()
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import tank_game as tg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_modules_hidden_only_inside_block():
+    name = 'tank_game_test_missing_module'
+    with tg.modules_hidden([name, 'sys']):
+        with pytest.raises(ImportError):
+            __import__(name)
+        assert sys.modules['sys'] is sys # Already imported: left alone
+    assert name not in sys.modules
+
+
+def test_environ_set_restores(monkeypatch):
+    monkeypatch.delenv('TANK_GAME_TEST_VAR', raising=False)
+    with tg.environ_set('TANK_GAME_TEST_VAR', '1'):
+        assert os.environ['TANK_GAME_TEST_VAR'] == '1'
+    assert 'TANK_GAME_TEST_VAR' not in os.environ
+    monkeypatch.setenv('TANK_GAME_TEST_VAR', 'keep')
+    with tg.environ_set('TANK_GAME_TEST_VAR', '1'):
+        pass
+    with tg.environ_set('TANK_GAME_TEST_VAR', None):
+        assert os.environ['TANK_GAME_TEST_VAR'] == 'keep'
+    assert os.environ['TANK_GAME_TEST_VAR'] == 'keep'
+
+
+def run_python(code):
+    """ Runs code in a fresh interpreter from the repo root (nothing imported yet) and returns its stdout. """
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_numpy_imports_after_tank_game():
+    pytest.importorskip('numpy')
+    assert run_python('import tank_game, numpy; print(numpy.ndarray.__name__)').split() == ['ndarray']
+
+
+def test_numpy_imports_after_script_run():
+    """ A script run imports pygame without numpy, and numpy still imports afterwards. """
+    pytest.importorskip('numpy')
+    code = '\n'.join((
+        'import runpy, sys',
+        "sys.argv = ['tank_game.py', '--help']",
+        'try:',
+        "    runpy.run_path('tank_game.py', run_name='__main__')",
+        'except SystemExit:',
+        '    pass',
+        "print('numpy' in sys.modules, sys.modules.get('pkg_resources', False) is None)",
+        'import numpy',
+        'print(numpy.ndarray.__name__)',
+    ))
+    assert run_python(code).split()[-3:] == ['False', 'False', 'ndarray']
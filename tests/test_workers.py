@@ -0,0 +1,134 @@
+import os
+import random
+import sys
+
+import pygame
+import pytest
+
+import tank_game as tg
+
+
+def horde_jobs(enemies=300):
+    """ A horde state with a mix of roaming and chasing enemies, its snapshot and its update jobs. """
+    random.seed(5)
+    state = tg.setup_game(tg.generate_arena(None, 800, 600), None, tg.HordeConfig())
+    tg.spawn_horde_burst(state, enemies, 0)
+    for enemy in state.enemies:
+        enemy.state = random.choice(tg.ENEMY_AI_STATES)
+    return state, tg.take_snapshot(state)
+
+
+def run_enemies(state, snap, pool, ticks=40):
+    """
+    Updates the enemies for ticks ticks, on the pool's workers or in-process (pool None), from the
+    same snapshot and seeds. In-process, the main stream is reseeded the way a one-worker pool seeds
+    its worker. Returns the enemy records and the bullets fired.
+    """
+    tg.restore_snapshot(state, snap)
+    index = tg.TankIndex()
+    index.rebuild(state.walls, state.enemies, state.players, solid_enemies=False, grid=state.arena.grid)
+    target = state.player.rect
+    jobs = [(enemy, slot % 3 != 0, target) for slot, enemy in enumerate(state.enemies)]
+    fired = []
+    for tick in range(ticks):
+        now = 5000 + tick * 16
+        random.seed(tick)
+        if pool:
+            fired += pool.run(state, jobs, now, index, None)
+        else:
+            random.seed(random.getrandbits(32) * tg.MAX_ENEMY_WORKERS)
+            bullets = pygame.sprite.Group()
+            for enemy, think, rect in jobs:
+                if think:
+                    enemy.update(bullets, bullets, rect, state.players, state.enemies, now, index, None)
+                else:
+                    enemy.move(state.players, state.enemies, now, index)
+            fired += bullets.sprites()
+    enemies = [(tuple(e.rect), e.angle, e.state, e.change_dir_timer, e.shoot_timer, e.ammo) for e in state.enemies]
+    return enemies, sorted((bullet.rect.topleft, bullet.angle) for bullet in fired)
+
+
+@pytest.fixture
+def pool():
+    pools = []
+    def start(count):
+        pools.append(tg.EnemyPool())
+        pools[-1].start(count, 100) # Below the horde size, so the record table grows
+        return pools[-1]
+    yield start
+    for started in pools:
+        started.stop()
+
+
+def test_one_worker_matches_in_process(pool):
+    """ With one worker and the same seed, the records match in-process updates exactly. """
+    state, snap = horde_jobs()
+    expected = run_enemies(state, snap, None)
+    assert len(expected[1]) > 0 # Some enemies fired
+    assert run_enemies(state, snap, pool(1)) == expected
+
+
+def test_two_workers_are_reproducible(pool):
+    """ Two workers draw from their own streams: not the in-process run, but the same run every time. """
+    state, snap = horde_jobs()
+    first = run_enemies(state, snap, pool(2))
+    assert run_enemies(state, snap, pool(2)) == first
+    assert first[0] != run_enemies(state, snap, None, ticks=0)[0]
+
+
+def test_start_worker_restores_environment(monkeypatch, capfd):
+    """ Starting workers leaves the parent's environment alone, and they print no pygame banner. """
+    monkeypatch.delenv('PYGAME_HIDE_SUPPORT_PROMPT', raising=False)
+    started = tg.EnemyPool()
+    started.start(1, 10)
+    try:
+        assert 'PYGAME_HIDE_SUPPORT_PROMPT' not in os.environ
+        state, snap = horde_jobs(10)
+        run_enemies(state, snap, started, ticks=1) # The worker has imported pygame by its first answer
+    finally:
+        started.stop()
+    monkeypatch.setenv('PYGAME_HIDE_SUPPORT_PROMPT', 'keep')
+    started.start(1, 10)
+    started.stop()
+    assert os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] == 'keep'
+    assert 'pygame' not in capfd.readouterr().out
+
+
+def run_envs(workers, steps=30):
+    """ Steps two seeded envs with scripted actions; returns every buffer after the reset and each step. """
+    env = tg.VectorEnv(2, workers, obs_width=32, seed=11, max_steps=12) # Episodes end, and reset, within the run
+    try:
+        buffers = 'numpy' if env.numpy else 'memoryview'
+        trace = [bytes(env.reset())]
+        rng = random.Random(3)
+        for _ in range(steps):
+            actions = [(rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1)), rng.uniform(0, 360), rng.random() < 0.3)
+                       for _ in range(2)]
+            trace.append(tuple(map(bytes, env.step(actions))))
+    finally:
+        env.close()
+    return buffers, trace
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_vector_env_is_deterministic(monkeypatch, numpy):
+    """ The same seed gives the same observations, rewards, dones and infos on one worker or two. """
+    if not numpy:
+        monkeypatch.setitem(sys.modules, 'numpy', None) # VectorEnv falls back to memoryview buffers
+    else:
+        pytest.importorskip('numpy')
+    buffers, trace = run_envs(1)
+    assert buffers == ('numpy' if numpy else 'memoryview')
+    assert run_envs(2) == (buffers, trace)
+    dones = [step[2] for step in trace[1:]]
+    assert b'\x01\x01' in dones # Both envs finished an episode and were reset
+    frame = len(trace[0]) // 2
+    assert trace[0][:frame] != trace[0][frame:] # Each env has its own seed
+
+
+def test_vector_env_buffers_match_without_numpy(monkeypatch):
+    """ numpy arrays and the memoryview fallback carry the same run. """
+    pytest.importorskip('numpy')
+    with_numpy = run_envs(1)[1]
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    assert run_envs(1)[1] == with_numpy